@@ -0,0 +1,59 @@
+# Frequent batch auction throughput against continuous matching on the same order flow.
+# Orders are submitted in batches of BATCH_SIZE and the book is cleared after each batch.
+# Run from the repository root with: python -m benchmarks.batch_auction [num_orders]
+import random
+import sys
+from time import perf_counter
+
+from sim.auctions import ContinuousDoubleAuction, FrequentBatchAuction, OrderType
+
+from .book_engine import generate_orders
+
+BATCH_SIZES = (100, 1000, 10000)
+
+
+def run_batches(
+    orders: list[tuple], traders: list[str], batch_size: int, allocation: str
+) -> tuple[float, float, int]:
+    sim = FrequentBatchAuction(
+        traders, (random.uniform, 100, 1000), allocation=allocation
+    )
+    submit_time = clear_time = 0.0
+    volume = 0
+    for batch_start in range(0, len(orders), batch_size):
+        start = perf_counter()
+        for is_bid, quantity, price, trader in orders[batch_start : batch_start + batch_size]:
+            sim.submit_order(is_bid, quantity, price, OrderType.limit, trader)
+        submit_time += perf_counter() - start
+
+        start = perf_counter()
+        result = sim.clear()
+        clear_time += perf_counter() - start
+        if result is not None:
+            volume += result["volume"]
+    return submit_time, clear_time, volume
+
+
+def main(num_orders: int = 200_000):
+    traders = [f"trader_{i}" for i in range(100)]
+    orders = generate_orders(num_orders, traders)
+
+    sim = ContinuousDoubleAuction(traders, (random.uniform, 100, 1000))
+    start = perf_counter()
+    for is_bid, quantity, price, trader in orders:
+        sim.submit_order(is_bid, quantity, price, OrderType.limit, trader)
+    elapsed = perf_counter() - start
+    print(f"continuous: {num_orders / elapsed:,.0f} orders/s, volume {sum(sim.bid_history.column('quantity_bid'))}")
+
+    for allocation in ("pro_rata", "time"):
+        for batch_size in BATCH_SIZES:
+            submit_time, clear_time, volume = run_batches(orders, traders, batch_size, allocation)
+            batches = -(-num_orders // batch_size)
+            print(
+                f"{allocation:>8} batch {batch_size:>6}: {num_orders / (submit_time + clear_time):,.0f} orders/s,"
+                f" {clear_time / batches * 1e3:.2f}ms per clear, volume {volume}"
+            )
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,44 @@
+# Throughput of the ContinuousDoubleAuction book on a seeded order flow.
+# Run from the repository root with: python -m benchmarks.book_engine [num_orders]
+import random
+import sys
+from time import perf_counter
+
+from sim.auctions import ContinuousDoubleAuction, OrderType
+
+
+def generate_orders(num_orders: int, traders: list[str], seed: int = 0) -> list[tuple]:
+    # Prices scatter around a mid of 500 so the book holds a realistic mix of resting and crossing orders
+    rng = random.Random(seed)
+    orders = []
+    for _ in range(num_orders):
+        is_bid = rng.random() < 0.5
+        price = max(1, int(rng.gauss(500, 25)) + (-5 if is_bid else 5))
+        orders.append((is_bid, rng.randint(1, 10), price, rng.choice(traders)))
+    return orders
+
+
+def run(orders: list[tuple], traders: list[str]) -> tuple[float, ContinuousDoubleAuction]:
+    sim = ContinuousDoubleAuction(traders, (random.uniform, 100, 1000))
+    start = perf_counter()
+    for is_bid, quantity, price, trader in orders:
+        if is_bid:
+            sim.bid(quantity, price, OrderType.limit, trader)
+        else:
+            sim.ask(quantity, price, OrderType.limit, trader)
+    return perf_counter() - start, sim
+
+
+def main(num_orders: int = 200_000):
+    traders = [f"trader_{i}" for i in range(100)]
+    orders = generate_orders(num_orders, traders)
+
+    elapsed, sim = run(orders, traders)
+    print(
+        f"{elapsed:.3f}s, {num_orders / elapsed:,.0f} orders/s, "
+        f"{len(sim.bid_history)} trades, {len(sim.bids)} bid / {len(sim.asks)} ask levels"
+    )
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,58 @@
+# Cost of fanning one room broadcast out to every consumer, encoding per consumer versus once per broadcast.
+# The in-memory channel layer deep copies each event per channel, so that cost is included too.
+# Run from the repository root with: python -m benchmarks.broadcast
+import json
+import random
+from copy import deepcopy
+from time import perf_counter
+
+from sim.auctions import ContinuousDoubleAuction, OrderType
+from sim.encoding import encode_message, orjson
+
+ROOM_SIZES = (10, 50, 200, 1000)
+REPEATS = 200
+
+
+def sample_book_update() -> dict:
+    # A CDA order that sweeps a few levels, the most common broadcast in a busy room
+    traders = [f"trader_{i}" for i in range(20)]
+    sim = ContinuousDoubleAuction(traders, (random.uniform, 100, 1000))
+    for i, trader in enumerate(traders[:10]):
+        sim.ask(5, 500 + i, OrderType.limit, trader)
+    sim.get_book_update()
+    report = sim.bid(30, 510, OrderType.limit, traders[-1])
+    return {"book_update": sim.get_book_update(), "execution_report": report.as_dict()}
+
+
+def per_consumer(message: dict, room_size: int):
+    # The old path, the event dict is copied to every channel and each consumer encodes it itself
+    event = {"type": "send_message", "message": message, "username": "trader_19"}
+    for _ in range(room_size):
+        received = deepcopy(event)
+        json.dumps({"message": received["message"], "username": received["username"]})
+
+
+def encoded_once(message: dict, room_size: int):
+    event = {"type": "send_encoded", "text": encode_message(message, "trader_19")}
+    for _ in range(room_size):
+        deepcopy(event)
+
+
+def main():
+    message = sample_book_update()
+    print(f"Payload: {len(encode_message(message, 'trader_19'))} bytes, encoder: {'orjson' if orjson else 'json'}")
+    print(f"{'room size':>10} {'per consumer':>14} {'encoded once':>14} {'speedup':>8}")
+    for room_size in ROOM_SIZES:
+        timings = []
+        for broadcast in (per_consumer, encoded_once):
+            start = perf_counter()
+            for _ in range(REPEATS):
+                broadcast(message, room_size)
+            timings.append((perf_counter() - start) / REPEATS)
+        print(
+            f"{room_size:>10} {timings[0] * 1e3:>12.3f}ms {timings[1] * 1e3:>12.3f}ms {timings[0] / timings[1]:>7.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+# Reproducible order flow for benchmarking the matching engine.
+# Prices scatter around a mid with a uniform or normal spread. Each order is either passive, priced on its own side of
+# the mid so it rests, or aggressive, priced through the mid so it trades with what rests on the other side.
+# A share of events cancel one of the orders submitted shortly before, as quoting traders do.
+import random
+
+DISTRIBUTIONS = ("uniform", "normal")
+
+
+def get_price_offset(rng: random.Random, distribution: str, spread: int) -> int:
+    # Distance from the mid, most normal orders sit close to it while uniform ones fill the whole spread evenly
+    if distribution == "normal":
+        return int(abs(rng.gauss(0, spread / 2)))
+    return rng.randint(0, spread)
+
+
+def generate_order_flow(
+    num_events: int,
+    traders: list[str],
+    seed: int = 0,
+    distribution: str = "uniform",
+    mid: int = 500,
+    spread: int = 50,
+    cancel_ratio: float = 0.2,
+    aggressive_ratio: float = 0.3,
+    max_quantity: int = 10,
+    cancel_window: int = 100,  # Cancels pick one of this many most recent orders
+) -> list[tuple]:
+    # Events are ("bid" | "ask", quantity, price, trader) or ("cancel", index of the order in the flow, trader).
+    # Cancelled orders may since have traded, in which case the cancel finds nothing, as it would live.
+    if distribution not in DISTRIBUTIONS:
+        raise ValueError(f"Unknown price distribution {distribution}")
+
+    rng = random.Random(seed)
+    events = []
+    submitted = []  # (index in events, trader) of every order
+    for _ in range(num_events):
+        if submitted and rng.random() < cancel_ratio:
+            index, trader = submitted[rng.randint(max(len(submitted) - cancel_window, 0), len(submitted) - 1)]
+            events.append(("cancel", index, trader))
+            continue
+
+        is_bid = rng.random() < 0.5
+        offset = get_price_offset(rng, distribution, spread)
+        if rng.random() < aggressive_ratio:
+            price = mid + offset if is_bid else mid - offset
+        else:
+            price = mid - 1 - offset if is_bid else mid + 1 + offset
+        trader = rng.choice(traders)
+        submitted.append((len(events), trader))
+        events.append(("bid" if is_bid else "ask", rng.randint(1, max_quantity), max(price, 1), trader))
+    return events
@@ -0,0 +1,55 @@
+# Measures the per-object size of the slotted book classes and the cost of a long ContinuousDoubleAuction replay.
+# Run from the repository root with: python -m benchmarks.order_memory [num_orders]
+import gc
+import random
+import sys
+import tracemalloc
+from time import perf_counter
+
+from sim.auctions import ContinuousDoubleAuction, OrderType
+from sim.doubly_linked_list import Order
+from sim.limit_order_book import LimitLevel
+
+from .book_engine import generate_orders
+
+
+def replay(orders: list[tuple], traders: list[str]) -> ContinuousDoubleAuction:
+    sim = ContinuousDoubleAuction(traders, (random.uniform, 100, 1000))
+    for is_bid, quantity, price, trader in orders:
+        if is_bid:
+            sim.bid(quantity, price, OrderType.limit, trader)
+        else:
+            sim.ask(quantity, price, OrderType.limit, trader)
+    return sim
+
+
+def main(num_orders: int = 1_000_000):
+    order = Order(True, 1, 1, 0, OrderType.limit, "trader")
+    print(f"Order: {sys.getsizeof(order)} bytes, LimitLevel: {sys.getsizeof(LimitLevel(order))} bytes (no __dict__)")
+
+    traders = [f"trader_{i}" for i in range(100)]
+    orders = generate_orders(num_orders, traders)
+
+    gc.collect()
+    collections_before = sum(stat["collections"] for stat in gc.get_stats())
+    start = perf_counter()
+    replay(orders, traders)
+    elapsed = perf_counter() - start
+    collections = sum(stat["collections"] for stat in gc.get_stats()) - collections_before
+
+    # Memory is measured on a separate run as tracemalloc distorts timings
+    gc.collect()
+    tracemalloc.start()
+    sim = replay(orders, traders)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del sim
+
+    print(
+        f"{elapsed:.2f}s, {len(orders) / elapsed:,.0f} orders/s, "
+        f"{collections} gc collections, peak {peak / 2**20:.1f} MiB, retained {current / 2**20:.1f} MiB"
+    )
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
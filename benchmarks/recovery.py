@@ -0,0 +1,90 @@
+# Times the recovery of a double auction room from its journal after a crash, replaying every command from the
+# start against restoring the latest snapshot and replaying only the commands after it.
+# Run from the repository root with: python -m benchmarks.recovery [num_events] [snapshot_interval]
+import asyncio
+import random
+import sys
+import tempfile
+from time import perf_counter
+
+from sim.auctions import ContinuousDoubleAuction
+from sim.clocks import VirtualClock
+from sim.commands import apply_command
+from sim.journal import RoomJournal
+
+COMMIT_SIZE = 64  # Commands per group commit, about one busy actor batch
+
+
+def generate_commands(num_events: int, traders: list[str], seed: int = 0) -> list[dict]:
+    # Limit orders around a mid of 500 with one in five commands cancelling a recent order
+    rng = random.Random(seed)
+    commands = []
+    for order_id in range(num_events):
+        trader = rng.choice(traders)
+        if order_id > 0 and rng.random() < 0.2:
+            instruction = {"method": "cancel", "order_id": rng.randint(max(0, order_id - 50), order_id - 1)}
+        else:
+            is_bid = rng.random() < 0.5
+            instruction = {
+                "method": "bid" if is_bid else "ask",
+                "quantity": rng.randint(1, 10),
+                "price": max(1, int(rng.gauss(500, 25)) + (-5 if is_bid else 5)),
+            }
+        commands.append({"kind": "update", "user": trader, "instructions": [instruction]})
+    return commands
+
+
+async def write_room(directory: str, commands: list[dict], traders: list[str], snapshot_interval: int) -> ContinuousDoubleAuction:
+    # Runs the commands as a live room would, journalling each before applying it and committing in groups
+    clock = VirtualClock()
+    sim = ContinuousDoubleAuction(
+        traders, (random.uniform, 100, 1000), timer=10**9, clock=clock
+    )
+    journal = RoomJournal(directory, "bench", snapshot_interval)
+    journal.start(sim)
+    for index, command in enumerate(commands):
+        clock.advance(0.001)
+        journal.append(command["kind"], clock(), **{k: v for k, v in command.items() if k != "kind"})
+        apply_command(sim, command)
+        if index % COMMIT_SIZE == COMMIT_SIZE - 1:
+            await journal.commit()
+    await journal.commit()
+    journal.close()
+    return sim
+
+
+def recover(directory: str) -> tuple[float, ContinuousDoubleAuction, RoomJournal]:
+    journal = RoomJournal(directory, "bench")
+    start = perf_counter()
+    sim = journal.recover()
+    elapsed = perf_counter() - start
+    journal.close()
+    return elapsed, sim, journal
+
+
+def main(num_events: int = 1_000_000, snapshot_interval: int = 50_000):
+    traders = [f"trader_{i}" for i in range(100)]
+    commands = generate_commands(num_events, traders)
+
+    # An interval longer than the run leaves only the empty auction's snapshot, so the whole journal is replayed
+    for name, interval in (("journal only", num_events + 1), ("snapshot + tail", snapshot_interval)):
+        with tempfile.TemporaryDirectory() as directory:
+            start = perf_counter()
+            live = asyncio.run(write_room(directory, commands, traders, interval))
+            written = perf_counter() - start
+
+            elapsed, sim, journal = recover(directory)
+            replayed = journal.sequence - journal.snapshot_sequence
+            print(
+                f"{name:>15}: recovered {num_events:,} events in {elapsed:.3f}s "
+                f"({replayed:,} replayed after snapshot {journal.snapshot_sequence:,}), "
+                f"written live in {written:.2f}s"
+            )
+
+            # Recovery is only useful if it rebuilds exactly the room that crashed
+            assert sim.bid_history.rows() == live.bid_history.rows()
+            assert sim.order_id == live.order_id and sim.orders.keys() == live.orders.keys()
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
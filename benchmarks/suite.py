@@ -0,0 +1,446 @@
+# Benchmark suite for the matching engine and the sealed-bid auctions, on seeded order flow so runs are comparable.
+# Measures ContinuousDoubleAuction bid/ask/cancel throughput and latency percentiles, how order latency scales with
+# book depth, SecondPriceSealedBidAuction.bid with many bidders, the cost of a growing bid_history and TradeTape
+# append and read throughput.
+# Results are written as JSON, tagged with the commit they ran on, and --compare prints the change from another run.
+# Run from the repository root with: python -m benchmarks.suite [--quick] [--seed N] [--output path] [--compare path]
+import argparse
+import json
+import platform
+import random
+import subprocess
+from datetime import datetime, timezone
+from pathlib import Path
+from time import perf_counter, perf_counter_ns
+
+import numpy as np
+
+from sim.auctions import ContinuousDoubleAuction, OrderType, SecondPriceSealedBidAuction
+from sim.clocks import VirtualClock
+from sim.encoding import msgpack, orjson
+from sim.trade_tape import TradeTape
+
+from .order_flow import generate_order_flow
+
+RESULTS_DIR = Path(__file__).parent / "results"
+
+# Order flows the engine is measured on, each passed to generate_order_flow
+FLOWS = {
+    "passive_uniform": {"distribution": "uniform", "cancel_ratio": 0.2, "aggressive_ratio": 0.1},
+    "mixed_normal": {"distribution": "normal", "cancel_ratio": 0.2, "aggressive_ratio": 0.3},
+    "aggressive_normal": {"distribution": "normal", "cancel_ratio": 0.1, "aggressive_ratio": 0.6},
+    "cancel_heavy": {"distribution": "uniform", "cancel_ratio": 0.6, "aggressive_ratio": 0.2},
+}
+
+# Sizes of a full run, --quick divides each by QUICK_DIVISOR
+FLOW_EVENTS = 200_000
+BOOK_DEPTHS = (1_000, 10_000, 100_000)
+DEPTH_PROBES = 20_000
+SPSB_BIDDERS = (1_000, 10_000, 100_000)
+SPSB_UNITS = (1, 10)
+HISTORY_ROWS = 1_000_000
+HISTORY_CHECKPOINTS = 10
+QUICK_DIVISOR = 10
+
+# Rows a client downloads per history frame, as SimConsumer.download_history sends them
+HISTORY_CHUNK_SIZE = 500
+
+
+def get_latency_summary(latencies_ns: list[int]) -> dict:
+    # Microseconds, percentiles over every call measured
+    if not latencies_ns:
+        return {"count": 0}
+    latencies = np.asarray(latencies_ns, dtype=np.float64) / 1000
+    p50, p90, p99, p999 = np.percentile(latencies, (50, 90, 99, 99.9))
+    return {
+        "count": len(latencies_ns),
+        "mean_us": float(latencies.mean()),
+        "p50_us": float(p50),
+        "p90_us": float(p90),
+        "p99_us": float(p99),
+        "p999_us": float(p999),
+        "max_us": float(latencies.max()),
+    }
+
+
+def create_double_auction(traders: list[str]) -> ContinuousDoubleAuction:
+    # A virtual clock keeps the auction open however long the benchmark runs
+    return ContinuousDoubleAuction(
+        traders,
+        (random.uniform, 100, 1000),
+        timer=10**9,
+        clock=VirtualClock(),
+    )
+
+
+def run_flow(sim: ContinuousDoubleAuction, events: list[tuple], latencies: dict | None = None):
+    # Applies generated events, timing each call by its kind when given somewhere to put the latencies
+    order_ids = [None] * len(events)
+    for index, event in enumerate(events):
+        kind = event[0]
+        start = perf_counter_ns()
+        if kind == "cancel":
+            sim.cancel(order_ids[event[1]], event[2])
+        elif kind == "bid":
+            report = sim.bid(event[1], event[2], OrderType.limit, event[3])
+        else:
+            report = sim.ask(event[1], event[2], OrderType.limit, event[3])
+        if latencies is not None:
+            latencies[kind].append(perf_counter_ns() - start)
+        if kind != "cancel" and report is not None:
+            order_ids[index] = report.order_id
+
+
+def bench_cda_throughput(num_events: int, seed: int) -> list[dict]:
+    traders = [f"trader_{i}" for i in range(100)]
+    results = []
+    for flow_name, flow in FLOWS.items():
+        events = generate_order_flow(num_events, traders, seed, **flow)
+        # Throughput without the timing calls, then latencies from a second run of the same flow
+        sim = create_double_auction(traders)
+        start = perf_counter()
+        run_flow(sim, events)
+        elapsed = perf_counter() - start
+
+        latencies = {"bid": [], "ask": [], "cancel": []}
+        run_flow(create_double_auction(traders), events, latencies)
+        results.append(
+            {
+                "benchmark": "cda_throughput",
+                "params": {"flow": flow_name, "events": num_events, **flow},
+                "metrics": {
+                    "seconds": elapsed,
+                    "events_per_second": num_events / elapsed,
+                    "trades": len(sim.bid_history),
+                    "resting_orders": len(sim.orders),
+                    "levels": len(sim.bids) + len(sim.asks),
+                    **{f"{kind}_latency": get_latency_summary(values) for kind, values in latencies.items()},
+                },
+            }
+        )
+    return results
+
+
+def bench_book_depth(depths: tuple[int, ...], probes: int, seed: int) -> list[dict]:
+    # Fills a book with depth resting orders over a wide spread, then times orders against it at that depth:
+    #   insert: a passive order joining the book
+    #   cancel: a random resting order leaving it
+    #   aggressive: a one unit order trading with the best price, replaced afterwards so the depth holds
+    traders = [f"trader_{i}" for i in range(100)]
+    results = []
+    for depth in depths:
+        events = generate_order_flow(
+            depth, traders, seed, spread=400, cancel_ratio=0, aggressive_ratio=0
+        )
+        sim = create_double_auction(traders)
+        run_flow(sim, events)
+        resting = list(sim.orders)
+        rng = random.Random(seed)
+        latencies = {"insert": [], "cancel": [], "aggressive": []}
+
+        for _ in range(probes):
+            is_bid = rng.random() < 0.5
+            offset = rng.randint(0, 400)
+            price = 499 - offset if is_bid else 501 + offset
+            trader = rng.choice(traders)
+            start = perf_counter_ns()
+            report = sim.submit_order(is_bid, rng.randint(1, 10), price, OrderType.limit, trader)
+            latencies["insert"].append(perf_counter_ns() - start)
+            resting.append(report.order_id)
+
+            # Orders traded away by the aggressive probes are skipped
+            index = rng.randrange(len(resting))
+            while resting[index] not in sim.orders:
+                resting[index] = resting[-1]
+                resting.pop()
+                index = rng.randrange(len(resting))
+            order = sim.orders[resting[index]]
+            start = perf_counter_ns()
+            sim.cancel(order.id, order.trader_id)
+            latencies["cancel"].append(perf_counter_ns() - start)
+            resting[index] = resting[-1]
+            resting.pop()
+
+            best = sim.get_best_ask() if is_bid else sim.get_best_bid()
+            price, head = best.price, best.get_head()
+            start = perf_counter_ns()
+            sim.submit_order(is_bid, 1, price, OrderType.limit, trader)
+            latencies["aggressive"].append(perf_counter_ns() - start)
+            if head.id not in sim.orders:
+                # Its last unit traded, a new one unit order takes its place
+                report = sim.submit_order(not is_bid, 1, price, OrderType.limit, head.trader_id)
+                resting.append(report.order_id)
+
+        results.append(
+            {
+                "benchmark": "book_depth",
+                "params": {"depth": depth, "probes": probes},
+                "metrics": {
+                    "resting_orders": len(sim.orders),
+                    "levels": len(sim.bids) + len(sim.asks),
+                    **{f"{kind}_latency": get_latency_summary(values) for kind, values in latencies.items()},
+                },
+            }
+        )
+    return results
+
+
+def create_sealed_bid_auction(bidders: list[str], units: int, seed: int) -> SecondPriceSealedBidAuction:
+    random.seed(seed)  # AuctionUser draws its limit price and money from the module level generator
+    sim = SecondPriceSealedBidAuction(
+        [*bidders, "auctioneer"],
+        (random.uniform, 100, 1000),
+        timer=10**9,
+        units=units,
+        clock=VirtualClock(),
+    )
+    sim.auctioneer = "auctioneer"
+    return sim
+
+
+def bench_spsb(bidder_counts: tuple[int, ...], seed: int) -> list[dict]:
+    # Every bidder bids once, the last bid ends and settles the auction
+    results = []
+    for count in bidder_counts:
+        bidders = [f"bidder_{i}" for i in range(count)]
+        rng = random.Random(seed)
+        amounts = [rng.randint(1, 1000) for _ in bidders]
+        for units in SPSB_UNITS:
+            start = perf_counter()
+            sim = create_sealed_bid_auction(bidders, units, seed)
+            setup = perf_counter() - start
+
+            start = perf_counter()
+            for bidder, amount in zip(bidders, amounts):
+                sim.bid(bidder, amount)
+            elapsed = perf_counter() - start
+            assert sim.auction_over
+
+            sim = create_sealed_bid_auction(bidders, units, seed)
+            latencies = []
+            for bidder, amount in zip(bidders, amounts):
+                start = perf_counter_ns()
+                sim.bid(bidder, amount)
+                latencies.append(perf_counter_ns() - start)
+
+            results.append(
+                {
+                    "benchmark": "spsb_bid",
+                    "params": {"bidders": count, "units": units},
+                    "metrics": {
+                        "setup_seconds": setup,
+                        "seconds": elapsed,
+                        "bids_per_second": count / elapsed,
+                        "bid_latency": get_latency_summary(latencies),
+                        "clearing_price": sim.get_winners()[0][0],
+                    },
+                }
+            )
+    return results
+
+
+def get_history_bytes(tape: TradeTape) -> int:
+    # Memory held by the trade tape's columns, its interned trader ids are shared with the rest of the auction
+    tape.flush()
+    return sum(column.buffer_info()[1] * column.itemsize for column in tape.columns)
+
+
+def bench_bid_history(num_rows: int, checkpoints: int, seed: int) -> list[dict]:
+    # Crossing pairs of orders grow the history one trade at a time. At each checkpoint it records the cost of the
+    # trades since the last one, the memory per row, and reading the history back as a download would.
+    traders = [f"trader_{i}" for i in range(100)]
+    rng = random.Random(seed)
+    sim = create_double_auction(traders)
+    chunk = num_rows // checkpoints
+    results = []
+    for checkpoint in range(1, checkpoints + 1):
+        # Buyer and seller always differ, so every pair trades
+        pairs = []
+        for _ in range(chunk):
+            seller = rng.randrange(len(traders))
+            buyer = (seller + rng.randrange(1, len(traders))) % len(traders)
+            pairs.append((traders[seller], traders[buyer], rng.randint(450, 550)))
+        start = perf_counter()
+        for seller, buyer, price in pairs:
+            sim.ask(1, price, OrderType.limit, seller)
+            sim.bid(1, price, OrderType.limit, buyer)
+        trade_seconds = perf_counter() - start
+
+        rows = len(sim.bid_history)
+        start = perf_counter()
+        sim.bid_history.rows(rows - HISTORY_CHUNK_SIZE, rows)
+        tail_seconds = perf_counter() - start
+        start = perf_counter()
+        sim.bid_history.rows()
+        full_seconds = perf_counter() - start
+
+        results.append(
+            {
+                "benchmark": "bid_history",
+                "params": {"rows": rows},
+                "metrics": {
+                    "trades_per_second": chunk / trade_seconds,
+                    "bytes_per_row": get_history_bytes(sim.bid_history) / rows,
+                    "tail_chunk_seconds": tail_seconds,
+                    "full_read_seconds": full_seconds,
+                },
+            }
+        )
+    return results
+
+
+def bench_trade_tape(num_rows: int, seed: int) -> list[dict]:
+    # TradeTape.append against appending the same rows to a plain list, which is what bid_history used to be,
+    # then the cost of the columnar conversion that reading the tape back triggers
+    traders = [f"trader_{i}" for i in range(100)]
+    rng = random.Random(seed)
+    rows = [
+        (rng.choice(traders), rng.choice(traders), rng.randint(1, 10), rng.randint(450, 550), float(index))
+        for index in range(num_rows)
+    ]
+
+    history = []
+    start = perf_counter()
+    for buyer, seller, quantity, price, timestamp in rows:
+        history.append([buyer, seller, quantity, price, timestamp])
+    list_seconds = perf_counter() - start
+
+    tape = create_double_auction(traders).bid_history
+    start = perf_counter()
+    for buyer, seller, quantity, price, timestamp in rows:
+        tape.append(buyer, seller, quantity, price, timestamp)
+    append_seconds = perf_counter() - start
+    start = perf_counter()
+    tape.rows()
+    read_seconds = perf_counter() - start
+
+    return [
+        {
+            "benchmark": "trade_tape",
+            "params": {"rows": num_rows},
+            "metrics": {
+                "list_rows_per_second": num_rows / list_seconds,
+                "append_rows_per_second": num_rows / append_seconds,
+                "read_rows_per_second": num_rows / read_seconds,
+                "bytes_per_row": get_history_bytes(tape) / num_rows,
+            },
+        }
+    ]
+
+
+def get_environment() -> dict:
+    # What the results were measured on, so runs from different commits and machines are not confused
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+        dirty = bool(
+            subprocess.run(
+                ["git", "status", "--porcelain", "--untracked-files=no"],
+                capture_output=True,
+                text=True,
+                check=True,
+            ).stdout.strip()
+        )
+    except (OSError, subprocess.CalledProcessError):
+        commit, dirty = None, None
+    return {
+        "commit": commit,
+        "dirty": dirty,
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "platform": platform.platform(),
+        "processor": platform.processor() or platform.machine(),
+        "numpy": np.__version__,
+        "orjson": orjson is not None,
+        "msgpack": msgpack is not None,
+    }
+
+
+def get_result_key(result: dict) -> str:
+    return f"{result['benchmark']} {json.dumps(result['params'], sort_keys=True)}"
+
+
+def flatten_metrics(metrics: dict, prefix: str = "") -> dict[str, float]:
+    flat = {}
+    for name, value in metrics.items():
+        if isinstance(value, dict):
+            flat.update(flatten_metrics(value, f"{prefix}{name}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[f"{prefix}{name}"] = value
+    return flat
+
+
+def compare(current: dict, baseline: dict):
+    # Percentage change of every metric measured in both runs, throughputs should rise and latencies fall
+    print(f"Compared with {baseline['environment'].get('commit')} ({baseline['environment'].get('timestamp')})")
+    baseline_results = {get_result_key(result): result for result in baseline["results"]}
+    for result in current["results"]:
+        key = get_result_key(result)
+        if key not in baseline_results:
+            continue
+        previous = flatten_metrics(baseline_results[key]["metrics"])
+        changes = []
+        for name, value in flatten_metrics(result["metrics"]).items():
+            if name.endswith(("per_second", "p50_us", "p99_us")) and previous.get(name):
+                changes.append(f"{name} {100 * (value / previous[name] - 1):+.1f}%")
+        print(f"{key}: {', '.join(changes)}")
+
+
+def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(description="Benchmark the matching engine and sealed-bid auctions")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--quick", action="store_true", help=f"Divide every size by {QUICK_DIVISOR}")
+    parser.add_argument(
+        "--only",
+        nargs="+",
+        choices=("cda_throughput", "book_depth", "spsb_bid", "bid_history", "trade_tape"),
+        help="Run only these benchmarks",
+    )
+    parser.add_argument("--output", help="JSON results file, benchmarks/results/<commit>.json by default")
+    parser.add_argument("--compare", help="JSON results file of an earlier run to compare against")
+    args = parser.parse_args(argv)
+
+    divisor = QUICK_DIVISOR if args.quick else 1
+    benchmarks = {
+        "cda_throughput": lambda: bench_cda_throughput(FLOW_EVENTS // divisor, args.seed),
+        "book_depth": lambda: bench_book_depth(
+            tuple(depth // divisor for depth in BOOK_DEPTHS), DEPTH_PROBES // divisor, args.seed
+        ),
+        "spsb_bid": lambda: bench_spsb(tuple(count // divisor for count in SPSB_BIDDERS), args.seed),
+        "bid_history": lambda: bench_bid_history(HISTORY_ROWS // divisor, HISTORY_CHECKPOINTS, args.seed),
+        "trade_tape": lambda: bench_trade_tape(HISTORY_ROWS // divisor, args.seed),
+    }
+
+    results = []
+    for name, run in benchmarks.items():
+        if args.only and name not in args.only:
+            continue
+        start = perf_counter()
+        for result in run():
+            results.append(result)
+            print(f"{get_result_key(result)}: {json.dumps(result['metrics'])}")
+        print(f"{name} finished in {perf_counter() - start:.1f}s")
+
+    environment = get_environment()
+    output = {
+        "environment": environment,
+        "settings": {"seed": args.seed, "quick": args.quick},
+        "results": results,
+    }
+    if args.output:
+        path = Path(args.output)
+    else:
+        name = (environment["commit"] or "unknown")[:12] + ("-dirty" if environment["dirty"] else "")
+        path = RESULTS_DIR / f"{name}{'-quick' if args.quick else ''}.json"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(output, indent=2))
+    print(f"Results written to {path}")
+
+    if args.compare:
+        compare(output, json.loads(Path(args.compare).read_text()))
+
+
+if __name__ == "__main__":
+    main()
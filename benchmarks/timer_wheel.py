@@ -0,0 +1,53 @@
+# Cost of keeping every room's deadline on the shared timer wheel.
+# Schedules one timer per room, extends deadlines as English bids would, then turns the wheel through them all.
+# Run from the repository root with: python -m benchmarks.timer_wheel
+import random
+from time import perf_counter
+
+from sim.clocks import VirtualClock
+from sim.timer_wheel import TimerWheel
+
+ROOM_COUNTS = (1000, 10000, 100000)
+EXTENSIONS_PER_ROOM = 10
+
+
+def run(room_count: int, seed: int = 0) -> tuple[float, float, float]:
+    random.seed(seed)
+    start_time = 1_000_000.0
+    wheel = TimerWheel(clock=VirtualClock(start_time))
+    fired = []
+
+    start = perf_counter()
+    timers = [
+        wheel.schedule(start_time + random.uniform(30, 300), fired.append, room)
+        for room in range(room_count)
+    ]
+    schedule_time = perf_counter() - start
+
+    start = perf_counter()
+    for _ in range(EXTENSIONS_PER_ROOM):
+        for timer in timers:
+            wheel.reschedule(timer, timer.deadline + random.uniform(0, 30))
+    reschedule_time = perf_counter() - start
+
+    start = perf_counter()
+    wheel.advance(start_time + 700)
+    advance_time = perf_counter() - start
+
+    assert len(fired) == room_count
+    return schedule_time, reschedule_time, advance_time
+
+
+def main():
+    print(f"{'rooms':>8} {'schedule':>12} {'reschedule':>12} {'fire all':>10}")
+    for room_count in ROOM_COUNTS:
+        schedule_time, reschedule_time, advance_time = run(room_count)
+        print(
+            f"{room_count:>8} {schedule_time / room_count * 1e6:>10.2f}us"
+            f" {reschedule_time / (room_count * EXTENSIONS_PER_ROOM) * 1e6:>10.2f}us"
+            f" {advance_time * 1e3:>8.1f}ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
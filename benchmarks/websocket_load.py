@@ -0,0 +1,380 @@
+# In-process load test of the auction rooms through dissdjango.asgi.application on the in-memory channel layer,
+# for sizing workers before an event on one machine. Every room gets an admin and N simulated browsers, each sending
+# register_user, update_auction and download_history messages one at a time with seeded think times.
+# Reports end-to-end latency percentiles per message type, from sending a message to receiving its answer, and the
+# fan-out time of every broadcast, from the first browser in the room receiving it to the last.
+# Run from the repository root with: python -m benchmarks.websocket_load [--rooms N] [--browsers N] [--messages N]
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import random
+import shutil
+import tempfile
+from collections import defaultdict
+from pathlib import Path
+from time import perf_counter
+
+import numpy as np
+
+from .order_flow import generate_order_flow
+
+MESSAGE_TYPES = ("register_user", "update_auction", "download_history")
+# Broadcasts are named after the first of these keys they carry, merged broadcasts usually carry several
+BROADCAST_TYPES = (
+    "auction_end",
+    "book_update",
+    "batch_result",
+    "price_tick",
+    "price_update",
+    "limit_price",  # Someone (re)registered
+    "update_user_count",
+)
+# Frames sent only to the browser that asked, everything else reaches the whole room
+REPLY_KEYS = frozenset(("update_results", "book_snapshot", "download_history"))
+REPLY_TIMEOUT = 30.0
+# A broadcast arrives as the same text at every browser in the room, so it is only parsed by the first
+PARSE_CACHE_SIZE = 10_000
+
+
+def setup_django(journal_dir: str | None):
+    # Imported here so the journal directory is in place before the settings and consumers read it
+    if journal_dir is not None:
+        os.environ["SIM_JOURNAL_DIR"] = journal_dir
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "dissdjango.settings")
+    import django
+
+    django.setup()
+    from dissdjango.asgi import application
+    from sim import websocket_consumers
+
+    if journal_dir is None:
+        websocket_consumers.JOURNAL_DIR = None
+    return application, websocket_consumers
+
+
+def get_latency_summary(latencies: list[float]) -> dict:
+    # Milliseconds
+    if not latencies:
+        return {"count": 0}
+    values = np.asarray(latencies) * 1000
+    p50, p95, p99 = np.percentile(values, (50, 95, 99))
+    return {
+        "count": len(latencies),
+        "p50_ms": float(p50),
+        "p95_ms": float(p95),
+        "p99_ms": float(p99),
+        "max_ms": float(values.max()),
+    }
+
+
+def get_broadcast_type(message: dict) -> str:
+    for key in BROADCAST_TYPES:
+        if key in message:
+            return key
+    return next(iter(message), "empty")
+
+
+class LoadStats:
+    # Shared by every browser, times are perf_counter seconds on the one event loop the whole test runs on
+    latencies: dict[str, list[float]]
+    timeouts: dict[str, int]
+    # (room, frame text, occurrence) to the times each browser in the room received that broadcast
+    receipts: dict[tuple, list[float]]
+    broadcast_types: dict[tuple, str]
+    parsed: dict[str, dict]
+    frames: int
+
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.timeouts = defaultdict(int)
+        self.receipts = defaultdict(list)
+        self.broadcast_types = {}
+        self.parsed = {}
+        self.frames = 0
+
+    def parse(self, text: str) -> dict:
+        frame = self.parsed.get(text)
+        if frame is None:
+            if len(self.parsed) >= PARSE_CACHE_SIZE:
+                self.parsed.clear()
+            frame = self.parsed[text] = json.loads(text)
+        return frame
+
+    def get_fan_out(self, room_sizes: dict[str, int]) -> dict:
+        fan_out, deliveries, expected = defaultdict(list), defaultdict(int), defaultdict(int)
+        for key, times in self.receipts.items():
+            broadcast_type = self.broadcast_types[key]
+            fan_out[broadcast_type].append(max(times) - min(times))
+            deliveries[broadcast_type] += len(times)
+            expected[broadcast_type] += room_sizes[key[0]]
+        return {
+            broadcast_type: {
+                **get_latency_summary(times),
+                # Below 1 when full channels dropped broadcasts, as the in-memory layer does past its capacity
+                "delivered": deliveries[broadcast_type] / expected[broadcast_type],
+            }
+            for broadcast_type, times in fan_out.items()
+        }
+
+
+class Browser:
+    # One simulated auction page. A reader task timestamps every frame the page is sent while the page sends its
+    # messages one at a time, each waiting for the frame that answers it.
+    room_id: str
+    username: str
+    is_admin: bool
+    communicator: object
+    stats: LoadStats
+    rng: random.Random
+    events: list[tuple]  # Order flow of a double auction room, see generate_order_flow
+    order_ids: dict[int, int]  # Index in events to the id the order was given
+    next_event: int
+    history_cursor: int
+    waiting: str | None  # Message type awaiting its answer
+    answer: asyncio.Future | None
+    occurrences: dict[str, int]
+    reader: asyncio.Task | None
+
+    def __init__(self, communicator, room_id: str, username: str, stats: LoadStats, seed: int, messages: int):
+        self.room_id = room_id
+        self.username = username
+        self.is_admin = username == room_id
+        self.communicator = communicator
+        self.stats = stats
+        self.rng = random.Random(seed)
+        self.events = generate_order_flow(messages, [username], seed, distribution="normal")
+        self.order_ids = {}
+        self.next_event = 0
+        self.history_cursor = 0
+        self.waiting = None
+        self.answer = None
+        self.occurrences = defaultdict(int)
+        self.reader = None
+
+    async def read(self):
+        while True:
+            output = await self.communicator.receive_output(timeout=None)
+            received = perf_counter()
+            if output["type"] != "websocket.send":
+                return
+            self.stats.frames += 1
+            text = output["text"]
+            frame = self.stats.parse(text)
+            message, username = frame["message"], frame["username"]
+
+            if REPLY_KEYS.isdisjoint(message):
+                # Identical broadcasts are told apart by how many of them this room has seen so far
+                self.occurrences[text] += 1
+                key = (self.room_id, text, self.occurrences[text])
+                self.stats.receipts[key].append(received)
+                self.stats.broadcast_types.setdefault(key, get_broadcast_type(message))
+
+            if username != self.username or self.answer is None or self.answer.done():
+                continue
+            if self.waiting == "register_user" and "limit_price" in message:
+                self.answer.set_result(received)
+            elif self.waiting == "update_auction" and "update_results" in message:
+                self.record_orders(message["update_results"])
+                self.answer.set_result(received)
+            elif self.waiting == "download_history" and "download_history" in message:
+                self.history_cursor = message["download_history"]["cursor"]
+                if message["download_history"]["done"]:
+                    self.answer.set_result(received)
+
+    def record_orders(self, results: list[dict]):
+        report = results[0].get("execution_report")
+        if report is not None:
+            self.order_ids[self.next_event - 1] = report["order_id"]
+
+    def get_instruction(self, room_type: str) -> dict:
+        if room_type != "CDA":
+            return {"method": "bid", "price": self.rng.randint(1, 1000)}
+
+        event = self.events[self.next_event % len(self.events)]
+        self.next_event += 1
+        if event[0] == "cancel":
+            order_id = self.order_ids.get(event[1])
+            if order_id is not None:
+                return {"method": "cancel", "order_id": order_id}
+            event = ("bid", 1, 500, self.username)
+        return {"method": event[0], "quantity": event[1], "price": event[2], "order_type": "LIMIT"}
+
+    def get_message(self, message_type: str, room_type: str, timer: int) -> dict:
+        if message_type == "register_user":
+            message = {"register_user": True}
+            if self.is_admin:
+                message["window_search"] = f"?time={timer}"
+            return message
+        if message_type == "download_history":
+            return {"download_history": {"cursor": self.history_cursor}}
+        # A list of one instruction, rather than the bare instruction pages send, so every update is answered
+        return {"update_auction": [self.get_instruction(room_type)]}
+
+    async def send(self, message_type: str, message: dict):
+        self.waiting = message_type
+        self.answer = asyncio.get_running_loop().create_future()
+        start = perf_counter()
+        await self.communicator.send_to(text_data=json.dumps({"username": self.username, "message": message}))
+        try:
+            received = await asyncio.wait_for(self.answer, REPLY_TIMEOUT)
+        except asyncio.TimeoutError:
+            self.stats.timeouts[message_type] += 1
+        else:
+            self.stats.latencies[message_type].append(received - start)
+        finally:
+            self.waiting = None
+
+    async def connect(self, room_type: str, timer: int):
+        start = perf_counter()
+        connected, _ = await self.communicator.connect()
+        if not connected:
+            raise RuntimeError(f"{self.username} could not connect to room {self.room_id}")
+        self.stats.latencies["connect"].append(perf_counter() - start)
+        self.reader = asyncio.create_task(self.read())
+        await self.send("register_user", self.get_message("register_user", room_type, timer))
+
+    async def run(self, messages: int, weights: list[float], think_time: float, room_type: str, timer: int):
+        for _ in range(messages):
+            if think_time > 0:
+                await asyncio.sleep(self.rng.expovariate(1 / think_time))
+            message_type = self.rng.choices(MESSAGE_TYPES, weights)[0]
+            await self.send(message_type, self.get_message(message_type, room_type, timer))
+
+    async def close(self):
+        await self.communicator.disconnect()
+        if self.reader is not None:
+            self.reader.cancel()
+
+
+async def run_load(application, args) -> dict:
+    from channels.testing import WebsocketCommunicator
+    from django.conf import settings
+
+    origin = f"https://{settings.ALLOWED_HOSTS[0]}".encode()
+    stats = LoadStats()
+    weights = [args.register_weight, args.update_weight, args.history_weight]
+
+    rooms = {}
+    for room in range(args.rooms):
+        room_id = f"load{room}"
+        usernames = [room_id, *(f"{room_id}_browser{index}" for index in range(args.browsers))]
+        rooms[room_id] = [
+            Browser(
+                WebsocketCommunicator(
+                    application, f"/ws/{args.room_type}/{room_id}/", headers=[(b"origin", origin)]
+                ),
+                room_id,
+                username,
+                stats,
+                args.seed * 1_000_003 + room * 1009 + index,
+                args.messages,
+            )
+            for index, username in enumerate(usernames)
+        ]
+
+    # Admins create their rooms before anyone else joins, then every other browser joins at once
+    await asyncio.gather(*(browsers[0].connect(args.room_type, args.timer) for browsers in rooms.values()))
+    await asyncio.gather(
+        *(browser.connect(args.room_type, args.timer) for browsers in rooms.values() for browser in browsers[1:])
+    )
+    # Only traffic once everyone is in the room counts towards fan-out
+    await asyncio.sleep(0.1)
+    stats.receipts.clear()
+    stats.broadcast_types.clear()
+    connect_latencies = {name: list(stats.latencies.pop(name)) for name in ("connect", "register_user")}
+
+    start = perf_counter()
+    await asyncio.gather(
+        *(
+            browser.run(args.messages, weights, args.think_time, args.room_type, args.timer)
+            for browsers in rooms.values()
+            for browser in browsers
+        )
+    )
+    elapsed = perf_counter() - start
+    # Broadcasts still on their way are given a moment to arrive
+    await asyncio.sleep(0.2)
+
+    sent = sum(len(latencies) for latencies in stats.latencies.values()) + sum(stats.timeouts.values())
+    result = {
+        "settings": vars(args),
+        "seconds": elapsed,
+        "messages_per_second": sent / elapsed,
+        "frames_per_second": stats.frames / elapsed,
+        "join": {name: get_latency_summary(latencies) for name, latencies in connect_latencies.items()},
+        "messages": {
+            message_type: {**get_latency_summary(stats.latencies[message_type]), "timeouts": stats.timeouts[message_type]}
+            for message_type in MESSAGE_TYPES
+        },
+        "fan_out": stats.get_fan_out({room_id: len(browsers) for room_id, browsers in rooms.items()}),
+    }
+
+    await asyncio.gather(*(browser.close() for browsers in rooms.values() for browser in browsers))
+    return result
+
+
+def print_report(result: dict):
+    def row(name: str, summary: dict, extra: str = "") -> str:
+        if not summary.get("count"):
+            return f"{name:>18} {0:>7}"
+        return (
+            f"{name:>18} {summary['count']:>7} {summary['p50_ms']:>8.2f} {summary['p95_ms']:>8.2f} "
+            f"{summary['p99_ms']:>8.2f} {summary['max_ms']:>8.2f}{extra}"
+        )
+
+    header = f"{'':>18} {'count':>7} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8}"
+    settings = result["settings"]
+    print(
+        f"{settings['rooms']} {settings['room_type']} rooms x {settings['browsers']} browsers, "
+        f"{result['messages_per_second']:,.0f} messages/s, {result['frames_per_second']:,.0f} frames/s "
+        f"over {result['seconds']:.1f}s"
+    )
+    print(f"\nJoining\n{header}")
+    for name, summary in result["join"].items():
+        print(row(name, summary))
+    print(f"\nEnd-to-end latency\n{header}")
+    for name, summary in result["messages"].items():
+        print(row(name, summary, f"  {summary['timeouts']} timed out" if summary.get("timeouts") else ""))
+    print(f"\nBroadcast fan-out\n{header}")
+    for name, summary in sorted(result["fan_out"].items()):
+        print(row(name, summary, f"  {100 * summary['delivered']:.1f}% delivered"))
+
+
+def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(description="Load test auction rooms in process on the in-memory channel layer")
+    parser.add_argument("--rooms", type=int, default=10)
+    parser.add_argument("--browsers", type=int, default=20, help="Browsers per room besides its admin")
+    parser.add_argument("--messages", type=int, default=20, help="Messages sent by each browser")
+    parser.add_argument("--room-type", choices=("CDA", "english", "FPSB", "SPSB"), default="CDA")
+    parser.add_argument("--think-time", type=float, default=0.5, help="Mean seconds between a browser's messages")
+    parser.add_argument("--register-weight", type=float, default=0.05)
+    parser.add_argument("--update-weight", type=float, default=0.9)
+    parser.add_argument("--history-weight", type=float, default=0.05)
+    parser.add_argument("--timer", type=int, default=3600, help="Auction length, long enough to outlast the test")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-journal", action="store_true", help="Run without the rooms' write-ahead journals")
+    parser.add_argument("--output", help="Also write the results as JSON to this file")
+    parser.add_argument("--verbose", action="store_true", help="Keep the consumers' printing of every broadcast")
+    args = parser.parse_args(argv)
+
+    # Rooms are journalled as in production, to a directory of their own so no real room is recovered from it
+    journal_dir = None if args.no_journal else tempfile.mkdtemp(prefix="websocket_load_")
+    try:
+        application, _ = setup_django(journal_dir)
+        with contextlib.ExitStack() as stack:
+            if not args.verbose:
+                stack.enter_context(contextlib.redirect_stdout(stack.enter_context(open(os.devnull, "w"))))
+            result = asyncio.run(run_load(application, args))
+    finally:
+        if journal_dir is not None:
+            shutil.rmtree(journal_dir, ignore_errors=True)
+
+    print_report(result)
+    if args.output:
+        Path(args.output).write_text(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+# Parse and encode cost of the JSON and MessagePack wire formats on typical CDA frames.
+# Inbound is a batched order instruction from a client, outbound a book delta with an execution report.
+# Run from the repository root with: python -m benchmarks.wire_format
+import json
+from time import perf_counter
+
+from sim.encoding import msgpack, orjson
+
+from .broadcast import sample_book_update
+
+REPEATS = 20000
+
+
+def sample_command() -> dict:
+    return {
+        "username": "trader_7",
+        "message": {
+            "update_auction": [
+                {"method": "bid", "quantity": 10, "price": 512, "order_type": "LIMIT"},
+                {"method": "cancel", "order_id": 1042},
+            ]
+        },
+    }
+
+
+def codecs() -> dict:
+    available = {"json": (lambda obj: json.dumps(obj).encode(), json.loads)}
+    if orjson is not None:
+        available["orjson"] = (orjson.dumps, orjson.loads)
+    if msgpack is not None:
+        available["msgpack"] = (
+            lambda obj: msgpack.packb(obj, use_bin_type=True),
+            lambda data: msgpack.unpackb(data, raw=False),
+        )
+    return available
+
+
+def time_per_call(function, argument) -> float:
+    start = perf_counter()
+    for _ in range(REPEATS):
+        function(argument)
+    return (perf_counter() - start) / REPEATS
+
+
+def main():
+    payloads = {
+        "inbound command": sample_command(),
+        "outbound book delta": {"message": sample_book_update(), "username": "trader_19"},
+    }
+    for label, payload in payloads.items():
+        print(label)
+        print(f"{'codec':>10} {'bytes':>7} {'encode':>10} {'decode':>10}")
+        for name, (encode, decode) in codecs().items():
+            data = encode(payload)
+            print(
+                f"{name:>10} {len(data):>7} {time_per_call(encode, payload) * 1e6:>8.2f}us"
+                f" {time_per_call(decode, data) * 1e6:>8.2f}us"
+            )
+
+
+if __name__ == "__main__":
+    main()
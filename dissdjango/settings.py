@@ -42,6 +42,7 @@ INSTALLED_APPS = [
     "django.contrib.messages",
     "daphne",
     "channels",
+    "sim",
 ]
 
 MIDDLEWARE = [
@@ -138,3 +139,12 @@ STATIC_URL = ""
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
 CHANNEL_LAYERS = {"default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}}
+
+# Write-ahead journals and snapshots of live rooms, rebuilt on startup after a restart or crash. Unset disables them
+SIM_JOURNAL_DIR = os.environ.get("SIM_JOURNAL_DIR")
+# Seconds a journalled room may stand empty before its journal is deleted
+SIM_ROOM_EXPIRY = 3600
+# Journal records between snapshots, which bounds how much has to be replayed on recovery
+SIM_SNAPSHOT_INTERVAL = 50_000
+# Finished rooms are kept here as sessions that python -m sim.replay can replay and verify, unset to discard them
+SIM_SESSION_DIR = os.environ.get("SIM_SESSION_DIR")
@@ -0,0 +1,188 @@
+import math
+from random import Random
+
+
+class Agent:
+    # An automated trader standing in for a browser in a headless simulation. Each round it is handed the limit price
+    # the auction drew for its user and the number of units it may trade, and is then asked for prices by the engine.
+    # Buyers value units at their limit price, sellers' limit price is their cost, so neither side trades at a loss.
+    strategy: str = "agent"
+    username: str
+    is_buyer: bool
+    rng: Random
+    # Bounds of the prices the market allows, zero intelligence traders draw from between these and their limit
+    price_floor: int
+    price_ceiling: int
+    limit_price: int
+    units: int  # Units still to trade this round
+    order_id: int | None  # The agent's resting order in a double auction, if any
+    # Totals over every round the agent has taken part in
+    profits: int
+    trades: int
+
+    def __init__(
+        self,
+        username: str,
+        is_buyer: bool,
+        rng: Random,
+        price_floor: int = 1,
+        price_ceiling: int = 1000,
+    ):
+        self.username = username
+        self.is_buyer = is_buyer
+        self.rng = rng
+        self.price_floor = price_floor
+        self.price_ceiling = price_ceiling
+        self.limit_price = 0
+        self.units = 0
+        self.order_id = None
+        self.profits = 0
+        self.trades = 0
+
+    def start_round(self, limit_price: int, units: int = 1):
+        self.limit_price = limit_price
+        self.units = units
+        self.order_id = None
+
+    def quote(self, minimum: int | None = None) -> int | None:
+        # The price the agent shouts now, or None to stay out. With a minimum (the next acceptable ascending bid)
+        # the quote is at least that much, otherwise it is the agent's own price for a sealed bid, offer or order.
+        ...
+
+    def observe(self, trade_price: int | None, competing_price: int | None):
+        # Market activity seen since the agent last acted: the latest trade price, if there was a trade,
+        # and the best quote on the agent's own side of the book that it has to compete with
+        return
+
+    def end_round(self, price: int | None, won: bool):
+        # The price the round's item went for, if it sold, and whether this agent bought it
+        return
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.username}, {'buyer' if self.is_buyer else 'seller'})"
+
+
+class TruthfulAgent(Agent):
+    # Always bids its true value: its limit price in sealed bids and orders, and in ascending auctions
+    # the minimum raise for as long as that stays within its limit
+    strategy = "truthful"
+
+    def quote(self, minimum: int | None = None) -> int | None:
+        if minimum is None:
+            return self.limit_price
+        return minimum if minimum <= self.limit_price else None
+
+
+class ZICAgent(Agent):
+    # Gode and Sunder's zero intelligence constrained trader, a uniformly random price that never crosses its limit.
+    # Buyers draw between the price floor and their limit, sellers between their limit and the price ceiling.
+    strategy = "zic"
+
+    def quote(self, minimum: int | None = None) -> int | None:
+        if minimum is not None:
+            if minimum > self.limit_price:
+                return None
+            return self.rng.randint(minimum, self.limit_price)
+
+        if self.is_buyer:
+            return self.rng.randint(min(self.price_floor, self.limit_price), self.limit_price)
+        return self.rng.randint(self.limit_price, max(self.price_ceiling, self.limit_price))
+
+
+class ZIPAgent(Agent):
+    # Cliff's zero intelligence plus trader, which shouts its limit price shaded by a profit margin and adapts the
+    # margin towards prices seen in the market with a Widrow-Hoff rule and momentum.
+    # Rather than reacting to every shout in the market, an agent catches up on what it missed when it next acts,
+    # which keeps the cost of a market action independent of the number of agents.
+    strategy = "zip"
+    margin: float  # Fraction of the limit price given up (buyers) or added (sellers), never negative
+    learning_rate: float
+    momentum_rate: float
+    momentum: float
+
+    def __init__(
+        self,
+        username: str,
+        is_buyer: bool,
+        rng: Random,
+        price_floor: int = 1,
+        price_ceiling: int = 1000,
+    ):
+        super().__init__(username, is_buyer, rng, price_floor, price_ceiling)
+        self.margin = rng.uniform(0.05, 0.35)
+        self.learning_rate = rng.uniform(0.1, 0.5)
+        self.momentum_rate = rng.uniform(0.0, 0.1)
+        self.momentum = 0.0
+
+    def shout_price(self) -> float:
+        if self.is_buyer:
+            return self.limit_price * (1 - self.margin)
+        return self.limit_price * (1 + self.margin)
+
+    def adapt(self, target: float):
+        # Moves the shout price a step towards target, then works the margin back out of the new price
+        price = self.shout_price()
+        self.momentum = self.momentum_rate * self.momentum + (1 - self.momentum_rate) * (
+            self.learning_rate * (target - price)
+        )
+        price += self.momentum
+        if self.limit_price <= 0:
+            return
+        if self.is_buyer:
+            self.margin = max(1 - price / self.limit_price, 0.0)
+        else:
+            self.margin = max(price / self.limit_price - 1, 0.0)
+
+    def perturbation(self, price: float, upwards: bool) -> float:
+        # A target a little past price, so the shout overshoots what it is chasing rather than creeping up on it
+        if upwards:
+            return price * self.rng.uniform(1.0, 1.05) + self.rng.uniform(0.0, 0.01) * self.limit_price
+        return price * self.rng.uniform(0.95, 1.0) - self.rng.uniform(0.0, 0.01) * self.limit_price
+
+    def raise_margin(self, price: float):
+        # Buyers aim below price and sellers above it
+        self.adapt(self.perturbation(price, not self.is_buyer))
+
+    def lower_margin(self, price: float):
+        self.adapt(self.perturbation(price, self.is_buyer))
+
+    def quote(self, minimum: int | None = None) -> int | None:
+        if minimum is not None:
+            if minimum > self.limit_price:
+                return None
+            if self.shout_price() < minimum:
+                # Being priced out below its limit means the margin is too greedy
+                self.lower_margin(minimum)
+            return minimum if self.shout_price() >= minimum else None
+
+        if self.is_buyer:
+            return max(math.floor(self.shout_price()), 0)
+        return math.ceil(self.shout_price())
+
+    def observe(self, trade_price: int | None, competing_price: int | None):
+        price = self.shout_price()
+        if trade_price is not None:
+            # A trade at a price the agent would have beaten means it could ask for more, otherwise it asks for less
+            if price >= trade_price if self.is_buyer else price <= trade_price:
+                self.raise_margin(trade_price)
+            else:
+                self.lower_margin(trade_price)
+        elif competing_price is not None and (
+            price <= competing_price if self.is_buyer else price >= competing_price
+        ):
+            # Outbid without a trade, the agent is not competitive enough to be traded with
+            self.lower_margin(competing_price)
+
+    def end_round(self, price: int | None, won: bool):
+        if price is None:
+            return
+        if won:
+            self.raise_margin(price)
+        elif price < self.limit_price if self.is_buyer else price > self.limit_price:
+            # Lost an item that was worth having at the price it went for
+            self.lower_margin(price)
+
+
+AGENT_TYPES: dict[str, type[Agent]] = {
+    agent_type.strategy: agent_type for agent_type in (TruthfulAgent, ZICAgent, ZIPAgent)
+}
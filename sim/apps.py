@@ -0,0 +1,11 @@
+from django.apps import AppConfig
+
+
+class SimConfig(AppConfig):
+    name = "sim"
+
+    def ready(self):
+        # Journalled rooms are rebuilt once as the worker starts, not whenever the consumers happen to be imported
+        from .websocket_consumers import recover_rooms
+
+        recover_rooms()
@@ -1,9 +1,19 @@
-from collections import deque
+import heapq
 from random import randint
-from time import time
+import numpy as np
 from sortedcontainers import SortedDict
 
-from .limit_order_book import LimitLevel, Order, OrderType
+from .batch_clearing import ALLOCATION_RULES, allocate, clearing_price, pair_fills
+from .clocks import wall_clock
+from .limit_order_book import (
+    ExecutionReport,
+    LimitLevel,
+    NON_RESTING_ORDER_TYPES,
+    Order,
+    OrderType,
+)
+from .top_k import TopKBids
+from .trade_tape import TradeTape
 
 
 class AuctionUser:
@@ -49,24 +59,40 @@ class Auction:
     users: dict[str, AuctionUser]
     auctioneer: str | None = None
     timestamp: int
+    # Seconds after timestamp at which timed auctions close, None if only the auctioneer can end the auction
+    time_difference: int | None = None
     limit_price_distribution: tuple[callable, int, int]
+    # Where the auction reads the time, a VirtualClock lets simulations and replays run without waiting out timers
+    clock: callable
 
     def __init__(
         self,
         users: list[str],
         limit_price_distribution: tuple[callable, int, int],
         money_range: tuple[int, int] = (1000, 2000),
+        clock: callable = None,
     ):
+        self.clock = wall_clock if clock is None else clock
         self.users = {
             username: AuctionUser(username, limit_price_distribution, money_range)
             for username in users
         }
         self.money_range = money_range
-        self.timestamp = int(time())
+        self.timestamp = int(self.clock())
         self.limit_price_distribution = limit_price_distribution
 
     def bid(self, *args) -> bool: ...
 
+    def get_deadline(self) -> float | None:
+        # Unix timestamp at which the auction closes on its own
+        if self.time_difference is None:
+            return None
+        return self.timestamp + int(self.time_difference)
+
+    def end_auction(self) -> bool:
+        # Closes the auction and settles it if its deadline has passed, True only for the call that closed it
+        return False
+
     def add_user(self, username, limit_price_distribution):
         if username not in self.users:
             self.users[username] = AuctionUser(
@@ -85,16 +111,30 @@ class DutchAuction(Auction):
     auction_price: int | None = None
     # Username maps to money amount and quantity of items owned
     users: dict[str, AuctionUser]
-    bid_history: list[tuple[str, int, int]]
+    # Offers made by the auctioneer and the bid that accepted one, sold marks the accepting bid
+    bid_history: TradeTape
+    # Descending clock, the offer drops by clock_decrement every clock_interval seconds until it reaches clock_floor.
+    # It is stopped by the first successful bid, so a tick can never lower the price of an item already sold.
+    clock_running: bool = False
+    clock_decrement: int = 0
+    clock_interval: float = 1.0
+    clock_floor: int = 0
 
     def __init__(
         self,
         users: list[str],
         limit_price_distribution: tuple[callable, int, int],
         money_range: tuple[int, int] = (1000, 2000),
+        clock: callable = None,
     ):
-        super().__init__(users, limit_price_distribution, money_range)
-        self.bid_history = [("username", "price_bid", "limit_price")]
+        super().__init__(users, limit_price_distribution, money_range, clock)
+        self.bid_history = TradeTape(
+            ("username", str),
+            ("price_bid", int),
+            ("limit_price", int),
+            ("sold", bool),
+            ("timestamp", float),
+        )
 
     def bid(self, account: str) -> bool:
         if account != self.auctioneer and account in self.users.keys():
@@ -110,14 +150,84 @@ class DutchAuction(Auction):
                 auctioneer.profits -= auctioneer.limit_price - self.auction_price
 
                 self.bid_history.append(
-                    (account, self.auction_price, current_user.limit_price)
+                    account,
+                    self.auction_price,
+                    current_user.limit_price,
+                    True,
+                    self.clock(),
                 )
-                self.bid_history.append(tuple())
 
                 self.auction_price = None
+                self.clock_running = False
                 return True
         return False
 
+    def get_deadline(self) -> None:
+        # Dutch auctions end when the item sells, however long that takes
+        return None
+
+    def configure_clock(self, decrement: int, interval: float, floor: int = 0) -> bool:
+        try:
+            decrement, interval, floor = int(decrement), float(interval), int(floor)
+        except (TypeError, ValueError):
+            return False
+
+        if decrement <= 0 or interval <= 0 or floor < 0:
+            return False
+
+        self.clock_decrement = decrement
+        self.clock_interval = interval
+        self.clock_floor = floor
+        return True
+
+    def start_clock(self, account: str, start_price: int) -> bool:
+        # Offers the item at start_price, the configured clock then lowers the offer on its own
+        try:
+            start_price = int(start_price)
+        except (TypeError, ValueError):
+            return False
+
+        if (
+            account != self.auctioneer
+            or self.clock_decrement <= 0
+            or start_price <= self.clock_floor
+        ):
+            return False
+
+        self.auction_price = start_price
+        self.bid_history.append(
+            account, start_price, self.users[account].limit_price, False, self.clock()
+        )
+        self.clock_running = True
+        return True
+
+    def stop_clock(self, account: str) -> bool:
+        if account != self.auctioneer or not self.clock_running:
+            return False
+
+        self.clock_running = False
+        return True
+
+    def tick_clock(self) -> bool:
+        # Lowers the offer by one step, returns False if the clock has stopped in the meantime
+        if not self.clock_running or self.auction_price is None:
+            self.clock_running = False
+            return False
+
+        self.auction_price = max(
+            int(self.auction_price) - self.clock_decrement, self.clock_floor
+        )
+        self.bid_history.append(
+            self.auctioneer,
+            self.auction_price,
+            self.users[self.auctioneer].limit_price,
+            False,
+            self.clock(),
+        )
+        # The clock stays at the floor until someone buys or the auctioneer restarts it
+        self.clock_running = self.auction_price > self.clock_floor
+        return True
+
     def auctioneer_update_offer(self, account: str, price: int) -> bool:
         try:
             price = int(price)
@@ -129,7 +239,7 @@ class DutchAuction(Auction):
         ):
             self.auction_price = price
             self.bid_history.append(
-                (account, price, self.users[account].limit_price)
+                account, price, self.users[account].limit_price, False, self.clock()
             )
             return True
         return False
@@ -143,8 +253,15 @@ class EnglishAuction(Auction):
     # Unix timestamp of last bid to calculate whether the auction has finished
     timestamp: float | None = None
     time_difference: int | None = None
-    # List in order of bids, with sub tuples containing bidding username, bid amount and the bidding user's limit price
-    bid_history: list[tuple[str, int, int]]
+    # Bids in order, with the bidding username, bid amount and the bidding user's limit price
+    bid_history: TradeTape
+    auction_over: bool = False
+    # Proxy bids, each user's private maximum which the server bids up to on their behalf in steps of increment.
+    # The heap holds (-maximum, arrival order, username), entries replaced by a higher maximum are skipped when popped.
+    increment: int
+    proxies: list[tuple[int, int, str]]
+    proxy_maximums: dict[str, int]
+    proxy_count: int
 
     def __init__(
         self,
@@ -152,10 +269,21 @@ class EnglishAuction(Auction):
         limit_price_distribution: tuple[callable, int, int],
         money_range: tuple[int, int] = (1000, 2000),
         timer: int = 30,  # Default timer is 10 seconds
+        increment: int = 1,
+        clock: callable = None,
     ):
-        super().__init__(users, limit_price_distribution, money_range)
-        self.bid_history = [("username", "price_bid", "limit_price")]
+        super().__init__(users, limit_price_distribution, money_range, clock)
+        self.bid_history = TradeTape(
+            ("username", str),
+            ("price_bid", int),
+            ("limit_price", int),
+            ("timestamp", float),
+        )
         self.time_difference = int(timer)
+        self.increment = increment
+        self.proxies = []
+        self.proxy_maximums = {}
+        self.proxy_count = 0
 
     def bid(self, account: str, amount: int) -> bool:
         try:
@@ -167,31 +295,129 @@ class EnglishAuction(Auction):
             account != self.auctioneer
             and account in self.users.keys()
             and self.users[account] != self.auction_leader
+            and not self.auction_over
         ):
             current_user = self.users[account]
             # Can a user pay for the asset
             if (
                 self.timestamp is None
-                or self.timestamp + int(self.time_difference) >= time()
+                or self.timestamp + int(self.time_difference) >= self.clock()
             ) and current_user.money >= amount:
                 if self.auction_price is None or amount > self.auction_price:
-                    self.bid_history.append((account, amount, current_user.limit_price))
-                    # Transfer money from buyer to auctioneer
-                    self.auction_price = amount
-                    self.auction_leader = self.users[account]
-                    self.timestamp = time()
+                    self.record_bid(account, amount)
+                    # Other users' proxies answer the new bid straight away
+                    self.resolve_proxies()
                     # Broadcast this change to all participants of the room
                     return True
 
         return False
 
+    def record_bid(self, account: str, amount: int):
+        self.bid_history.append(
+            account, amount, self.users[account].limit_price, self.clock()
+        )
+        # Transfer money from buyer to auctioneer
+        self.auction_price = amount
+        self.auction_leader = self.users[account]
+        self.timestamp = self.clock()
+
+    def proxy_bid(self, account: str, maximum: int) -> bool:
+        # Registers or raises a user's private maximum, the server then bids for them only as far as competition requires.
+        # Returns True if the bid was accepted, the price and leader may or may not have changed as a result.
+        try:
+            maximum = int(maximum)
+        except (TypeError, ValueError):
+            return False
+
+        if (
+            account == self.auctioneer
+            or account not in self.users.keys()
+            or self.auction_over
+            or self.bidding_finished()
+            or maximum > self.users[account].money
+            or maximum <= self.proxy_maximums.get(account, 0)
+            or (self.auction_price is not None and maximum <= self.auction_price)
+        ):
+            return False
+
+        self.proxy_maximums[account] = maximum
+        heapq.heappush(self.proxies, (-maximum, self.proxy_count, account))
+        self.proxy_count += 1
+        self.resolve_proxies()
+        return True
+
+    def peek_proxy(self) -> tuple[int, str] | None:
+        # The highest live proxy as (maximum, username), dropping replaced ones and ones the price has passed
+        while self.proxies:
+            negative_maximum, _, account = self.proxies[0]
+            maximum = -negative_maximum
+            if self.proxy_maximums.get(account) == maximum and (
+                self.auction_price is None
+                or maximum > self.auction_price
+                or self.users[account] is self.auction_leader
+            ):
+                return maximum, account
+
+            heapq.heappop(self.proxies)
+            if self.proxy_maximums.get(account) == maximum:
+                del self.proxy_maximums[account]
+        return None
+
+    def resolve_proxies(self):
+        # Settles competing proxies at once, the highest maximum wins at the second highest maximum plus one increment.
+        # Only the decisive steps are recorded, the runner-up bidding its maximum and the winner's answer to it,
+        # rather than every increment the two would have traded by hand.
+        top = self.peek_proxy()
+        if top is None:
+            return
+        top_maximum, top_account = top
+
+        # The runner-up is the next highest live proxy, which always belongs to somebody else
+        entry = heapq.heappop(self.proxies)
+        runner_up = self.peek_proxy()
+        heapq.heappush(self.proxies, entry)
+
+        price = self.auction_price
+        leader = None if self.auction_leader is None else self.auction_leader.username
+
+        if runner_up is not None and (price is None or runner_up[0] > price):
+            if runner_up[0] == top_maximum:
+                # Equal maximums go to the earlier proxy, at that maximum
+                self.record_bid(top_account, top_maximum)
+                return
+            # Recorded even when the runner-up already leads, its proxy still raised it to its maximum before losing
+            self.record_bid(runner_up[1], runner_up[0])
+            price, leader = runner_up[0], runner_up[1]
+
+        if leader == top_account:
+            return
+
+        # Nobody else has bid yet, so the proxy opens the auction at one increment
+        target = min(top_maximum, self.increment if price is None else price + self.increment)
+        if price is None or target > price:
+            self.record_bid(top_account, target)
+
     def bidding_finished(self) -> bool:
         # Returns a boolean indicating whether the auction is finished, in this case only time can end it.
         return (
             self.timestamp is not None
-            and self.timestamp + int(self.time_difference) < time()
+            and self.timestamp + int(self.time_difference) < self.clock()
         )
 
+    def end_auction(self) -> bool:
+        if self.auction_over or not self.bidding_finished():
+            return False
+
+        self.auction_over = True
+        if self.auction_leader is not None:
+            # The leader buys at their last bid
+            self.auction_leader.profits += (
+                self.auction_leader.limit_price - self.auction_price
+            )
+            auctioneer = self.users[self.auctioneer]
+            auctioneer.profits -= auctioneer.limit_price - self.auction_price
+        return True
+
 
 class FirstPriceSealedBidAuction(Auction):
     auction_price: int | None = 0
@@ -204,7 +430,9 @@ class FirstPriceSealedBidAuction(Auction):
     # A set of the users that have bid already (no double bidding!)
     users_seen: set[str]
     auction_over: bool = False
-    bid_history: list[str, int, int]  # Username, price bid, limit price
+    # Whether the winner has been paid out, an auction found to be over more than once is only settled once
+    settled: bool = False
+    bid_history: TradeTape  # Username, price bid, limit price, timestamp
 
     def __init__(
         self,
@@ -212,11 +440,17 @@ class FirstPriceSealedBidAuction(Auction):
         limit_price_distribution: tuple[callable, int, int],
         money_range: tuple[int, int] = (1000, 2000),
         timer: int = 90,  # Default timer is 90 seconds
+        clock: callable = None,
     ):
-        super().__init__(users, limit_price_distribution, money_range)
+        super().__init__(users, limit_price_distribution, money_range, clock)
         self.users_seen = set()
         self.time_difference = int(timer)
-        self.bid_history = [("username", "price_bid", "limit_price")]
+        self.bid_history = TradeTape(
+            ("username", str),
+            ("price_bid", int),
+            ("limit_price", int),
+            ("timestamp", float),
+        )
 
     def bid(self, account: str, amount: int) -> bool:
         try:
@@ -230,6 +464,7 @@ class FirstPriceSealedBidAuction(Auction):
             account != self.auctioneer
             and account in self.users.keys()
             and account not in self.users_seen
+            and not self.auction_over
         ):
             current_user = self.users[account]
             self.num_bids += (
@@ -237,43 +472,97 @@ class FirstPriceSealedBidAuction(Auction):
             )
             self.users_seen.add(account)
             made_bid = True
-            self.bid_history.append([account, amount, current_user.limit_price])
+            self.bid_history.append(
+                account, amount, current_user.limit_price, self.clock()
+            )
             # Can a user pay for the asset
             if (
                 self.timestamp is None
-                or self.timestamp + int(self.time_difference) >= time()
+                or self.timestamp + int(self.time_difference) >= self.clock()
             ) and current_user.money >= amount > self.auction_price:
                 # Transfer money from buyer to auctioneer
                 self.auction_price = amount
                 self.auction_leader = current_user
-                print(
-                    f"FPSB UPDATED: LEADER = {self.auction_leader}, PRICE = {self.auction_price}"
-                )
 
         self.auction_over = (
-            (  # indicate the auction is over if all users have bid when this is called
+            self.auction_over
+            or (  # indicate the auction is over if all users have bid when this is called
                 self.num_bids >= len(self.users) - 1
             )
-            or self.timestamp + int(self.time_difference) < time()
+            or self.timestamp + int(self.time_difference) < self.clock()
         )
 
         if self.auction_over:
+            self.settle()
+
+        return made_bid
+        # Only broadcast if all users have bid or the time is up (i.e. auction over)
+
+    def end_auction(self) -> bool:
+        # Ends the auction when the timer runs out without every user having bid
+        if self.auction_over or self.get_deadline() >= self.clock():
+            return False
+
+        self.auction_over = True
+        self.settle()
+        return True
+
+    def settle(self):
+        if self.settled:
+            return
+        self.settled = True
+
+        if self.auction_leader is not None:
             self.auction_leader.profits += (
                 self.auction_leader.limit_price - self.auction_price
             )
             auctioneer = self.users[self.auctioneer]
             auctioneer.profits -= auctioneer.limit_price - self.auction_price
 
-        print("FPSB FINISHED", self.auction_over)
-
-        return made_bid
-        # Only broadcast if all users have bid or the time is up (i.e. auction over)
-
 
-class SecondPriceSealedBidAuction(FirstPriceSealedBidAuction):
-    auction_leader: deque = deque([None, None])
-    auction_price: deque = deque([0, 0])
+class MultiUnitSealedBidAuction(FirstPriceSealedBidAuction):
+    # Sealed bids for units identical items, each bidder wanting one. The units highest bids win.
+    # "discriminatory" pricing has every winner pay their own bid, "uniform" has them all pay the highest losing bid.
+    units: int
+    pricing: str
+    # The units + 1 highest bids, the extra one being the highest losing bid that sets the uniform price
+    top_bids: TopKBids
+    # Bids must beat this, the price paid when there are not enough losing bids to set one
+    reserve_price: int
 
+    def __init__(
+        self,
+        users: list[str],
+        limit_price_distribution: tuple[callable, int, int],
+        money_range: tuple[int, int] = (1000, 2000),
+        timer: int = 90,
+        units: int = 1,
+        pricing: str = "discriminatory",
+        clock: callable = None,
+    ):
+        super().__init__(users, limit_price_distribution, money_range, timer, clock)
+        if pricing not in ("discriminatory", "uniform"):
+            raise ValueError(f"Unknown pricing {pricing}")
+        self.units = max(int(units), 1)
+        self.pricing = pricing
+        self.top_bids = TopKBids(self.units + 1)
+        self.reserve_price = 0
+
+    @property
+    def auction_price(self) -> int:
+        # The price paid for the highest winning bid
+        winners = self.get_winners()
+        return winners[0][0] if winners else self.reserve_price
+
+    @auction_price.setter
+    def auction_price(self, price: int):
+        # A starting bid acts as the reserve
+        self.reserve_price = int(price)
+
+    @property
+    def auction_leader(self) -> AuctionUser | None:
+        ranked = self.top_bids.ranked()
+        return self.users[ranked[0][1]] if ranked else None
 
     def bid(self, account: str, amount: int) -> bool:
         try:
@@ -282,70 +571,100 @@ class SecondPriceSealedBidAuction(FirstPriceSealedBidAuction):
             return False
 
         made_bid = False
-        # Can a user pay for the asset
         if (
             account != self.auctioneer
             and account in self.users.keys()
             and account not in self.users_seen
+            and not self.auction_over
         ):
             current_user = self.users[account]
             self.num_bids += (
                 1  # Always increase the number of bids even if it isnt the highest
             )
             self.users_seen.add(account)
-            self.bid_history.append([account, amount, current_user.limit_price])
+            self.bid_history.append(
+                account, amount, current_user.limit_price, self.clock()
+            )
             made_bid = True
             # Can a user pay for the asset
             if (
                 self.timestamp is None
-                or self.timestamp + int(self.time_difference) >= time()
-            ) and current_user.money >= amount:
-                # The highest price is on the right
-                if len(self.auction_price) != 0 and (
-                    amount > self.auction_price[-1] or self.auction_price[-1] is None
-                ):
-                    # The new bid is the highest
-                    self.auction_price.popleft()
-                    self.auction_price.append(amount)
-                    self.auction_leader.popleft()
-                    self.auction_leader.append(current_user)
-                elif len(self.auction_price) > 1 and (
-                    amount > self.auction_price[0] or self.auction_price[0] is None
-                ):
-                    # The new bid is the second highest
-                    self.auction_price.popleft()
-                    self.auction_price.appendleft(amount)
-                    self.auction_leader.popleft()
-                    self.auction_leader.appendleft(current_user)
+                or self.timestamp + int(self.time_difference) >= self.clock()
+            ) and current_user.money >= amount > self.reserve_price:
+                self.top_bids.push(amount, account)
 
         self.auction_over = (
-            (  # indicate the auction is over if all users have bid when this is called
+            self.auction_over
+            or (  # indicate the auction is over if all users have bid when this is called
                 self.num_bids >= len(self.users) - 1
             )
-            or self.timestamp + int(self.time_difference) < time()
+            or self.timestamp + int(self.time_difference) < self.clock()
         )
 
         if self.auction_over:
-            self.auction_leader[-1].profits += (
-                self.auction_leader[-1].limit_price - self.auction_price[0]
-            )
-            auctioneer = self.users[self.auctioneer]
-            auctioneer.profits -= auctioneer.limit_price - self.auction_price[0]
+            self.settle()
 
         return made_bid
         # Only broadcast if all users have bid or the time is up (i.e. auction over)
 
+    def get_winners(self) -> list[tuple[int, AuctionUser]]:
+        # (price paid, winner) for each unit sold, highest bid first, worked out in one pass over the kept bids
+        ranked = self.top_bids.ranked()
+        winning, losing = ranked[: self.units], ranked[self.units :]
+        if self.pricing == "uniform":
+            clearing_price = losing[0][0] if losing else self.reserve_price
+            return [(clearing_price, self.users[username]) for _, username in winning]
+        return [(amount, self.users[username]) for amount, username in winning]
+
+    def settle(self):
+        if self.settled:
+            return
+        self.settled = True
+
+        auctioneer = self.users[self.auctioneer]
+        for price, winner in self.get_winners():
+            winner.profits += winner.limit_price - price
+            auctioneer.profits -= auctioneer.limit_price - price
+
+
+class SecondPriceSealedBidAuction(MultiUnitSealedBidAuction):
+    # The highest bidder wins and pays the second highest bid, the single unit case of uniform pricing
+    def __init__(
+        self,
+        users: list[str],
+        limit_price_distribution: tuple[callable, int, int],
+        money_range: tuple[int, int] = (1000, 2000),
+        timer: int = 90,
+        units: int = 1,
+        clock: callable = None,
+    ):
+        super().__init__(
+            users, limit_price_distribution, money_range, timer, units, "uniform", clock
+        )
+
 
 class ContinuousDoubleAuction(Auction):
     bids: SortedDict[int, LimitLevel]
     asks: SortedDict[int, LimitLevel]
     orders: dict[int, Order]
+    # Ids of each trader's resting orders, so cancelling all of a trader's orders is O(their order count)
+    trader_orders: dict[str, set[int]]
     order_id: int
-    bid_history: list[str, str, int, int]  # buyer, seller, quantity, price
+    bid_history: TradeTape  # buyer, seller, quantity, price, timestamp
+    # Sequence number of the last book update handed out, clients use it to detect missed deltas
+    sequence: int
+    # Price levels touched since the last book update, keyed by (is_bid, price) in insertion order
+    changed_levels: dict[tuple[bool, int], None]
+    # Number of bid_history rows already included in a book update
+    reported_trades: int
 
     # Unix timestamp of last bid to calculate whether the auction has finished
     timestamp: float | None = None
     time_difference: int | None = None
+    # Whether a trader's resting orders are cancelled when they disconnect from the room
+    cancel_on_disconnect: bool = False
+    # Set once the timer runs out, no more orders are accepted after that
+    auction_over: bool = False
 
     def __init__(
         self,
@@ -353,92 +672,107 @@ class ContinuousDoubleAuction(Auction):
         limit_price_distribution: tuple[callable, int, int],
         money_range: tuple[int, int] = (1000, 2000),
         timer: int = 300,
+        clock: callable = None,
     ):
-        super().__init__(users, limit_price_distribution, money_range)
+        super().__init__(users, limit_price_distribution, money_range, clock)
         self.bids = SortedDict()
         self.asks = SortedDict()
         self.orders = {}
+        self.trader_orders = {}
         self.order_id = 0
-        self.bid_history = [("buyer_username", "seller_username", "quantity_bid", "price_bid")]
+        self.bid_history = TradeTape(
+            ("buyer_username", str),
+            ("seller_username", str),
+            ("quantity_bid", int),
+            ("price_bid", int),
+            ("timestamp", float),
+        )
         self.time_difference = int(timer)
+        self.sequence = 0
+        self.changed_levels = {}
+        self.reported_trades = len(self.bid_history)
+
+    def new_order(
+        self,
+        is_bid: bool,
+        quantity: int,
+        price: int,
+        order_type: OrderType,
+        trader_id: str,
+    ) -> Order:
+        order = Order(is_bid, quantity, price, self.order_id, order_type, trader_id)
+        self.order_id += 1
+        return order
 
     def get_side(self, is_bid: bool) -> SortedDict[int, LimitLevel]:
         return self.bids if is_bid else self.asks
 
-    def add_order(self, order: Order | None):
-        order_tree = self.get_side(order.is_bid)
-        best_ask = self.get_best_ask()
-        best_bid = self.get_best_bid()
+    def add_order(self, order: Order) -> ExecutionReport:
+        report = ExecutionReport(order)
+        self.match_orders(order, report)
+        report.residual = order.quantity
 
-        if order.is_bid and best_ask is not None and best_ask.price <= order.price:
-            self.match_orders(order, best_ask)
-            return
-        elif (
-            not order.is_bid and best_bid is not None and best_bid.price >= order.price
-        ):
-            self.match_orders(order, best_bid)
-            return
-
-        if order is not None:
-            if order.quantity > 0 and order.order_type != OrderType.fill_and_kill:
-                self.orders[order.id] = order
-
-                if order.price in order_tree:
-                    order_tree[order.price].append(order)
-                else:
-                    order_tree[order.price] = LimitLevel(order)
-
-    def match_orders(self, order: Order | None, best_value: LimitLevel | None):
-        if best_value is None:
-            return
+        if order.quantity > 0 and order.order_type not in NON_RESTING_ORDER_TYPES:
+            order_tree = self.get_side(order.is_bid)
+            self.orders[order.id] = order
+            self.trader_orders.setdefault(order.trader_id, set()).add(order.id)
 
-        while (
-            best_value.quantity > 0
-            and order.quantity > 0
-            and best_value.get_length() > 0
-        ):
-            head_order: Order = best_value.get_head()
-
-            if order.quantity <= head_order.quantity:
-                self.bid_history.append(
-                    [
-                        order.trader_id if order.is_bid else head_order.trader_id,
-                        head_order.trader_id if order.is_bid else order.trader_id,
-                        order.quantity,
-                        head_order.price,
-                    ]
-                )
-
-                head_order.quantity -= order.quantity
-                best_value.quantity -= order.quantity
-                order.quantity = 0
+            if order.price in order_tree:
+                order_tree[order.price].append(order)
             else:
-                self.bid_history.append(
-                    [
-                        order.trader_id if order.is_bid else head_order.trader_id,
-                        head_order.trader_id if order.is_bid else order.trader_id,
-                        head_order.quantity,
-                        head_order.price,
-                    ]
-                )
-                order.quantity -= head_order.quantity
-                best_value.quantity -= head_order.quantity
-                head_order.quantity = 0
-
-            if order.quantity == 0 and order.id in self.orders:
-                self.cancel(order.id, order.trader_id)
-
-            if head_order.quantity == 0:
-                del self.orders[head_order.id]
-                best_value.pop_left()
+                order_tree[order.price] = LimitLevel(order)
+
+            self.changed_levels[(order.is_bid, order.price)] = None
+            report.rested = True
+
+        return report
+
+    def match_orders(self, order: Order, report: ExecutionReport):
+        # Sweeps the opposite side one level at a time until the order is filled or stops crossing
+        order_tree = self.get_side(not order.is_bid)
+
+        while order.quantity > 0:
+            best_value = self.get_best_ask() if order.is_bid else self.get_best_bid()
+            if best_value is None or (
+                order.order_type != OrderType.market
+                and not self.crosses(order.is_bid, order.price, best_value.price)
+            ):
+                break
+
+            report.levels_touched += 1
+            self.changed_levels[(not order.is_bid, best_value.price)] = None
+
+            while order.quantity > 0 and best_value.get_length() > 0:
+                head_order: Order = best_value.get_head()
+                quantity = min(order.quantity, head_order.quantity)
+                fill = [
+                    order.trader_id if order.is_bid else head_order.trader_id,
+                    head_order.trader_id if order.is_bid else order.trader_id,
+                    quantity,
+                    head_order.price,
+                ]
+                self.bid_history.append(*fill, self.clock())
+                report.fills.append(fill)
+
+                head_order.quantity -= quantity
+                best_value.quantity -= quantity
+                order.quantity -= quantity
+
+                if head_order.quantity == 0:
+                    del self.orders[head_order.id]
+                    self.trader_orders[head_order.trader_id].discard(head_order.id)
+                    best_value.pop_left()
 
             if best_value.quantity == 0:
-                order_tree = self.get_side(not order.is_bid)
-                if best_value.price in order_tree:
-                    del order_tree[best_value.price]
+                del order_tree[best_value.price]
 
-        if order is not None and order.quantity > 0:
-            self.add_order(order)
+    @staticmethod
+    def crosses(is_bid: bool, price: int, opposite_price: int) -> bool:
+        return opposite_price <= price if is_bid else opposite_price >= price
+
+    def would_take(self, is_bid: bool, price: int) -> bool:
+        best_value = self.get_best_ask() if is_bid else self.get_best_bid()
+        return best_value is not None and self.crosses(is_bid, price, best_value.price)
 
     def get_best_ask(self) -> LimitLevel | None:
         if len(self.asks) != 0:
@@ -452,70 +786,303 @@ class ContinuousDoubleAuction(Auction):
         else:
             return None
 
-    def cancel(self, id_: int, trader_id: str):
+    def remove_order(self, order: Order):
+        # Takes a resting order out of the book and the order indexes without recycling it
+        order_tree = self.get_side(order.is_bid)
+
+        if order.price in order_tree:
+            price_level: LimitLevel = order_tree[order.price]
+            price_level.remove(order)
+            self.changed_levels[(order.is_bid, order.price)] = None
+
+            if price_level.quantity <= 0:
+                del order_tree[price_level.price]
+
+        del self.orders[order.id]
+        self.trader_orders[order.trader_id].discard(order.id)
+
+    def cancel(self, id_: int, trader_id: str) -> bool:
+        try:
+            id_ = int(id_)
+        except (TypeError, ValueError):
+            return False
+
         if id_ in self.orders and self.orders[id_].trader_id == trader_id:
             current_order = self.orders[id_]
-            order_tree = self.get_side(current_order.is_bid)
+            self.remove_order(current_order)
+            return True
 
-            if current_order.price in order_tree:
-                price_level: LimitLevel = order_tree[current_order.price]
-                price_level.remove(current_order)
+        return False
 
-                if price_level.quantity <= 0:
-                    del order_tree[price_level.price]
+    def cancel_all(self, trader_id: str) -> int:
+        # Returns the number of orders cancelled
+        order_ids = list(self.trader_orders.get(trader_id, ()))
+        for id_ in order_ids:
+            current_order = self.orders[id_]
+            self.remove_order(current_order)
 
-            del self.orders[id_]
+        return len(order_ids)
 
-    def bid(
-        self, quantity: int, price: int, order_type: OrderType, trader_id: str
-    ) -> int:
+    def amend(
+        self,
+        id_: int,
+        trader_id: str,
+        quantity: int | None = None,
+        price: int | None = None,
+    ) -> ExecutionReport | None:
+        # Reducing quantity at the same price keeps the order's place in its level's queue.
+        # Any other change requeues it at the back of the new level, where it may also trade.
         try:
-            price = int(price)
-            quantity = int(quantity)
-        except ValueError:
-            return -1
+            id_ = int(id_)
+            current_order = self.orders[id_] if id_ in self.orders else None
+            if current_order is None or current_order.trader_id != trader_id:
+                return None
+            quantity = current_order.quantity if quantity in (None, "") else int(quantity)
+            price = current_order.price if price in (None, "") else int(price)
+        except (TypeError, ValueError):
+            return None
 
-        if (
-            trader_id != self.auctioneer
-            and trader_id in self.users.keys()
-            and price >= 0
-            and quantity > 0
+        if quantity <= 0 or price < 0 or self.auction_over:
+            return None
+
+        if price == current_order.price and quantity <= current_order.quantity:
+            price_level: LimitLevel = self.get_side(current_order.is_bid)[price]
+            price_level.quantity -= current_order.quantity - quantity
+            current_order.quantity = quantity
+            self.changed_levels[(current_order.is_bid, price)] = None
+
+            report = ExecutionReport(current_order)
+            report.rested = True
+            return report
+
+        if current_order.order_type == OrderType.post_only and self.would_take(
+            current_order.is_bid, price
         ):
-            order = Order(
-                True, quantity, price, self.order_id, order_type, trader_id
-            )
-            self.order_id += 1
-            self.add_order(order)
-            return self.order_id - 1
+            return None
 
-        return -1
+        self.remove_order(current_order)
+        current_order.quantity = quantity
+        current_order.price = price
+        return self.add_order(current_order)
+
+    def get_book_update(self) -> dict | None:
+        # Collects every level changed since the last call into a single delta.
+        # A quantity of 0 means the level has been removed from the book.
+        if not self.changed_levels and self.reported_trades == len(self.bid_history):
+            return None
+
+        self.sequence += 1
+        update = {
+            "sequence": self.sequence,
+            "bids": [],
+            "asks": [],
+            "trades": self.bid_history[self.reported_trades :],
+        }
+
+        for is_bid, price in self.changed_levels:
+            order_tree = self.get_side(is_bid)
+            quantity = order_tree[price].quantity if price in order_tree else 0
+            update["bids" if is_bid else "asks"].append([quantity, price])
+
+        self.changed_levels.clear()
+        self.reported_trades = len(self.bid_history)
+        return update
+
+    def get_book_snapshot(self) -> dict:
+        # Full depth of both sides, best price first, tagged with the sequence of the last update
+        return {
+            "sequence": self.sequence,
+            "bids": [[bid.quantity, bid.price] for bid in reversed(self.bids.values())],
+            "asks": [[ask.quantity, ask.price] for ask in self.asks.values()],
+        }
+
+    def submit_order(
+        self,
+        is_bid: bool,
+        quantity: int,
+        price: int,
+        order_type: OrderType,
+        trader_id: str,
+    ) -> ExecutionReport | None:
+        # Returns None if the order was rejected, otherwise the report of how it executed
+        if order_type == OrderType.market:
+            # Market orders take whatever is on the other side, so any provided price is ignored
+            price = 0
 
-    def ask(
-        self, quantity: int, price: int, order_type: OrderType, trader_id: str
-    ) -> int:
         try:
             price = int(price)
             quantity = int(quantity)
-        except ValueError:
-            return -1
+        except (TypeError, ValueError):
+            return None
 
         if (
             trader_id != self.auctioneer
             and trader_id in self.users.keys()
+            and not self.auction_over
             and price >= 0
             and quantity > 0
+            and not (order_type == OrderType.post_only and self.would_take(is_bid, price))
         ):
-            order = Order(
-                False, quantity, price, self.order_id, order_type, trader_id
-            )
-            self.order_id += 1
-            self.add_order(order)
-            return self.order_id - 1
+            order = self.new_order(is_bid, quantity, price, order_type, trader_id)
+            return self.add_order(order)
+
+        return None
+
+    def end_auction(self) -> bool:
+        # Trades settle as they happen, so closing the market only stops new orders
+        if self.auction_over or self.get_deadline() >= self.clock():
+            return False
 
-        return -1
+        self.auction_over = True
+        return True
+
+    def bid(
+        self, quantity: int, price: int, order_type: OrderType, trader_id: str
+    ) -> ExecutionReport | None:
+        return self.submit_order(True, quantity, price, order_type, trader_id)
+
+    def ask(
+        self, quantity: int, price: int, order_type: OrderType, trader_id: str
+    ) -> ExecutionReport | None:
+        return self.submit_order(False, quantity, price, order_type, trader_id)
 
     def __repr__(self):
         return f"LimitOrderBook(bid count={len(self.bids)}, ask count={len(self.asks)})"
 
     def __str__(self):
         return self.__repr__()
+
+
+class FrequentBatchAuction(ContinuousDoubleAuction):
+    # A call market run every batch_interval seconds. Orders rest in the book without trading, then the whole book
+    # is cleared at once at a single price from cumulative supply and demand, in one vectorized pass per batch.
+    # The book, cancels, amends and book updates are those of the continuous auction, only matching differs.
+    batch_interval: float
+    allocation: str  # "pro_rata" or "time", how the orders at the clearing price share what is left for them
+    batch_number: int
+
+    def __init__(
+        self,
+        users: list[str],
+        limit_price_distribution: tuple[callable, int, int],
+        money_range: tuple[int, int] = (1000, 2000),
+        timer: int = 300,
+        batch_interval: float = 1.0,
+        allocation: str = "pro_rata",
+        clock: callable = None,
+    ):
+        super().__init__(
+            users,
+            limit_price_distribution,
+            money_range,
+            timer,
+            clock,
+        )
+        if allocation not in ALLOCATION_RULES:
+            raise ValueError(f"Unknown allocation rule {allocation}")
+        self.batch_interval = batch_interval
+        self.allocation = allocation
+        self.batch_number = 0
+
+    def match_orders(self, order: Order, report: ExecutionReport):
+        # Orders only ever trade when the batch clears
+        return
+
+    def submit_order(
+        self,
+        is_bid: bool,
+        quantity: int,
+        price: int,
+        order_type: OrderType,
+        trader_id: str,
+    ) -> ExecutionReport | None:
+        # Only limit orders make sense in a call market, anything else would never rest to be cleared
+        if order_type != OrderType.limit:
+            return None
+        return super().submit_order(is_bid, quantity, price, order_type, trader_id)
+
+    def get_crossing_levels(self, is_bid: bool, limit: int) -> list[LimitLevel]:
+        # The levels on one side priced to trade against limit, best first. Anything behind limit cannot trade this batch.
+        levels = reversed(self.bids.values()) if is_bid else self.asks.values()
+        crossing = []
+        for level in levels:
+            if not self.crosses(is_bid, level.price, limit):
+                break
+            crossing.append(level)
+        return crossing
+
+    @staticmethod
+    def get_filled_orders(levels: list[LimitLevel], volume: int) -> list[Order]:
+        # Orders of the best levels holding volume between them, the only ones that can receive a fill.
+        # Each level's orders are in time priority, so their positions also carry time priority for the allocation.
+        orders = []
+        for level in levels:
+            if volume <= 0:
+                break
+            volume -= level.quantity
+            order = level.get_head()
+            while order is not None:
+                orders.append(order)
+                order = order.next
+        return orders
+
+    def clear(self) -> dict | None:
+        # Clears the batch, returning its price and volume, or None if nothing traded.
+        # The price comes from level totals alone, individual orders are only visited in levels that trade.
+        self.batch_number += 1
+        best_bid, best_ask = self.get_best_bid(), self.get_best_ask()
+        if best_bid is None or best_ask is None or best_bid.price < best_ask.price:
+            return None
+
+        bid_levels = self.get_crossing_levels(True, best_ask.price)
+        ask_levels = self.get_crossing_levels(False, best_bid.price)
+        price, volume = clearing_price(
+            np.fromiter((level.price for level in bid_levels), np.int64, len(bid_levels)),
+            np.fromiter((level.quantity for level in bid_levels), np.int64, len(bid_levels)),
+            np.fromiter((level.price for level in ask_levels), np.int64, len(ask_levels)),
+            np.fromiter((level.quantity for level in ask_levels), np.int64, len(ask_levels)),
+        )
+        if volume == 0:
+            return None
+
+        bid_orders = self.get_filled_orders(bid_levels, volume)
+        ask_orders = self.get_filled_orders(ask_levels, volume)
+        bid_fills = allocate(
+            np.fromiter((order.price for order in bid_orders), np.int64, len(bid_orders)),
+            np.fromiter((order.quantity for order in bid_orders), np.int64, len(bid_orders)),
+            volume,
+            True,
+            self.allocation,
+        )
+        ask_fills = allocate(
+            np.fromiter((order.price for order in ask_orders), np.int64, len(ask_orders)),
+            np.fromiter((order.quantity for order in ask_orders), np.int64, len(ask_orders)),
+            volume,
+            False,
+            self.allocation,
+        )
+
+        timestamp = self.clock()
+        for buyer, seller, quantity in zip(*pair_fills(bid_fills, ask_fills)):
+            self.bid_history.append(
+                bid_orders[buyer].trader_id,
+                ask_orders[seller].trader_id,
+                int(quantity),
+                price,
+                timestamp,
+            )
+
+        for orders, fills in ((bid_orders, bid_fills), (ask_orders, ask_fills)):
+            for index in np.flatnonzero(fills):
+                self.fill_resting_order(orders[index], int(fills[index]))
+
+        return {"batch": self.batch_number, "price": price, "volume": volume}
+
+    def fill_resting_order(self, order: Order, quantity: int):
+        if quantity >= order.quantity:
+            self.remove_order(order)
+            return
+
+        order.quantity -= quantity
+        self.get_side(order.is_bid)[order.price].quantity -= quantity
+        self.changed_levels[(order.is_bid, order.price)] = None
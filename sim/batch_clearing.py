@@ -0,0 +1,102 @@
+import numpy as np
+
+# How the quantity available at the clearing price is shared between the orders at that price
+ALLOCATION_RULES = ("pro_rata", "time")
+
+
+def level_totals(prices: np.ndarray, quantities: np.ndarray, size: int) -> np.ndarray:
+    # Total quantity at every tick of the price grid
+    return np.bincount(prices, weights=quantities, minlength=size).astype(np.int64)
+
+
+def grouped_cumsum(values: np.ndarray, first: np.ndarray) -> np.ndarray:
+    # Running total of values that restarts wherever first is True
+    totals = np.cumsum(values)
+    starts = np.maximum.accumulate(np.where(first, totals - values, 0))
+    return totals - starts
+
+
+def clearing_price(
+    bid_prices: np.ndarray,
+    bid_quantities: np.ndarray,
+    ask_prices: np.ndarray,
+    ask_quantities: np.ndarray,
+) -> tuple[int, int]:
+    # The uniform price and volume that clear the batch, from cumulative demand and supply over the whole price grid.
+    # Volume is maximised first, then the imbalance between the two sides, and ties take the middle of what is left.
+    if len(bid_prices) == 0 or len(ask_prices) == 0:
+        return 0, 0
+
+    size = int(max(bid_prices.max(), ask_prices.max())) + 1
+    demand = level_totals(bid_prices, bid_quantities, size)[::-1].cumsum()[::-1]  # Bid at the price or higher
+    supply = level_totals(ask_prices, ask_quantities, size).cumsum()  # Offered at the price or lower
+    volume = np.minimum(demand, supply)
+
+    best_volume = int(volume.max())
+    if best_volume <= 0:
+        return 0, 0
+
+    candidates = np.flatnonzero(volume == best_volume)
+    imbalance = np.abs(demand[candidates] - supply[candidates])
+    candidates = candidates[imbalance == imbalance.min()]
+    return int(candidates[len(candidates) // 2]), best_volume
+
+
+def allocate(
+    prices: np.ndarray,
+    quantities: np.ndarray,
+    volume: int,
+    is_bid: bool,
+    rule: str = "pro_rata",
+) -> np.ndarray:
+    # Fills for one side's orders, which must be given in time priority within each price.
+    # Better priced levels are filled completely first and the marginal level is rationed by rule.
+    if rule not in ALLOCATION_RULES:
+        raise ValueError(f"Unknown allocation rule {rule}")
+    if len(prices) == 0 or volume <= 0:
+        return np.zeros(len(prices), dtype=np.int64)
+
+    totals = level_totals(prices, quantities, int(prices.max()) + 1)
+    if is_bid:
+        better = totals[::-1].cumsum()[::-1] - totals
+    else:
+        better = totals.cumsum() - totals
+    level_allocation = np.clip(volume - better, 0, totals)
+
+    # Group orders by price, keeping their time priority within each price
+    order = np.lexsort((np.arange(len(prices)), prices))
+    sorted_prices = prices[order]
+    sorted_quantities = quantities[order]
+    first = np.empty(len(order), dtype=bool)
+    first[0] = True
+    first[1:] = sorted_prices[1:] != sorted_prices[:-1]
+    allocation = level_allocation[sorted_prices]
+
+    if rule == "time":
+        ahead = grouped_cumsum(sorted_quantities, first) - sorted_quantities
+        sorted_fills = np.clip(allocation - ahead, 0, sorted_quantities)
+    else:
+        sorted_fills = sorted_quantities * allocation // np.maximum(totals[sorted_prices], 1)
+        # Rounding down leaves a few units per level, which go one each to the earliest orders with room for them
+        leftover = level_allocation - level_totals(sorted_prices, sorted_fills, len(totals))
+        has_room = sorted_fills < sorted_quantities
+        rank = grouped_cumsum(has_room.astype(np.int64), first)
+        sorted_fills += has_room & (rank <= leftover[sorted_prices])
+
+    fills = np.empty_like(sorted_fills)
+    fills[order] = sorted_fills
+    return fills
+
+
+def pair_fills(
+    bid_fills: np.ndarray, ask_fills: np.ndarray
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    # Matches filled bids to filled asks as (buyer index, seller index, quantity) trades, walking both in order
+    bid_totals = np.cumsum(bid_fills)
+    ask_totals = np.cumsum(ask_fills)
+    ends = np.union1d(bid_totals, ask_totals)
+    ends = ends[ends > 0]
+    starts = np.concatenate(([0], ends[:-1]))
+    buyers = np.searchsorted(bid_totals, starts, side="right")
+    sellers = np.searchsorted(ask_totals, starts, side="right")
+    return buyers, sellers, ends - starts
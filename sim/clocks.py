@@ -0,0 +1,41 @@
+from time import time
+
+
+class WallClock:
+    # Real unix time, what live rooms run on
+    def __call__(self) -> float:
+        return time()
+
+    def __repr__(self):
+        return "WallClock()"
+
+
+class VirtualClock:
+    # Time that only moves when the caller moves it, so simulations and replays can run hours of auction time
+    # in milliseconds. Auctions compare it against their deadlines exactly as they would the wall clock.
+    now: float
+
+    def __init__(self, start: float = 0.0):
+        self.now = start
+
+    def __call__(self) -> float:
+        return self.now
+
+    def advance(self, seconds: float) -> float:
+        if seconds < 0:
+            raise ValueError("VirtualClock cannot go backwards")
+        self.now += seconds
+        return self.now
+
+    def advance_to(self, timestamp: float) -> float:
+        if timestamp < self.now:
+            raise ValueError("VirtualClock cannot go backwards")
+        self.now = timestamp
+        return self.now
+
+    def __repr__(self):
+        return f"VirtualClock(now={self.now})"
+
+
+# Shared by everything not given a clock of its own
+wall_clock = WallClock()
@@ -0,0 +1,281 @@
+import random
+
+from .auctions import (
+    Auction,
+    ContinuousDoubleAuction,
+    DutchAuction,
+    EnglishAuction,
+    FirstPriceSealedBidAuction,
+    FrequentBatchAuction,
+    MultiUnitSealedBidAuction,
+    SecondPriceSealedBidAuction,
+)
+from .batch_clearing import ALLOCATION_RULES
+from .clocks import VirtualClock
+from .limit_order_book import ExecutionReport, OrderType
+from .simulation import get_limit_distribution
+
+# Batches cannot clear more often than the server's timer wheel turns
+MIN_BATCH_INTERVAL = 0.1
+
+
+def get_instruction_error(sim: Auction, instruction: dict) -> str | None:
+    # Why an instruction is malformed, None if it is not. Required values only have to be numbers or strings,
+    # the auctions convert them themselves and reject the ones that do not convert.
+    if not isinstance(instruction, dict) or not isinstance(instruction.get("method"), str):
+        return "Instructions must be objects with a method"
+
+    method = instruction["method"]
+    if method == "ask" or (method == "bid" and isinstance(sim, ContinuousDoubleAuction)):
+        required = ("quantity",)
+    elif method == "bid" and not isinstance(sim, DutchAuction):
+        required = ("price",)
+    elif method in ("cancel", "amend"):
+        required = ("order_id",)
+    elif method == "update_offer":
+        required = ("price",)
+    else:
+        required = ()
+
+    for field in required:
+        if not isinstance(instruction.get(field), (int, float, str)):
+            return f"{method} requires {field}"
+    return None
+
+
+def apply_instruction(
+    sim: Auction, instruction: dict, username: str
+) -> tuple[bool, ExecutionReport | None]:
+    # Each instruction returns a boolean based on whether the auction has been updated
+    # This can be used to determine whether a message should be broadcast
+    # Raises ValueError for a malformed instruction, before the auction is touched
+    auction_updated = False
+    execution_report = None
+    error = get_instruction_error(sim, instruction)
+    if error is not None:
+        raise ValueError(error)
+
+    if instruction["method"] == "ask" and hasattr(sim, "ask"):
+        order_type = get_order_type(instruction)
+        if order_type is not None:
+            execution_report = sim.ask(
+                instruction["quantity"], instruction.get("price"), order_type, username
+            )
+            auction_updated = execution_report is not None
+    elif instruction["method"] == "bid" and hasattr(sim, "bid"):
+        if isinstance(sim, DutchAuction):
+            # Dutch auctions do not require a provided price to bid
+            auction_updated = sim.bid(username)
+        elif isinstance(sim, ContinuousDoubleAuction):
+            order_type = get_order_type(instruction)
+            if order_type is not None:
+                execution_report = sim.bid(
+                    instruction["quantity"],
+                    instruction.get("price"),
+                    order_type,
+                    username,
+                )
+                auction_updated = execution_report is not None
+        else:
+            auction_updated = sim.bid(username, instruction["price"])
+    elif instruction["method"] == "proxy_bid" and hasattr(sim, "proxy_bid"):
+        auction_updated = sim.proxy_bid(username, instruction.get("max"))
+    elif instruction["method"] == "cancel" and hasattr(sim, "cancel"):
+        auction_updated = sim.cancel(instruction["order_id"], username)
+    elif instruction["method"] == "cancel_all" and hasattr(sim, "cancel_all"):
+        auction_updated = sim.cancel_all(username) > 0
+    elif instruction["method"] == "amend" and hasattr(sim, "amend"):
+        execution_report = sim.amend(
+            instruction["order_id"],
+            username,
+            instruction.get("quantity"),
+            instruction.get("price"),
+        )
+        auction_updated = execution_report is not None
+    elif (
+        instruction["method"] == "update_offer"
+        and username == sim.auctioneer
+        and hasattr(sim, "auctioneer_update_offer")
+    ):
+        auction_updated = sim.auctioneer_update_offer(
+            username, instruction["price"]
+        )
+    elif instruction["method"] == "start_clock" and hasattr(sim, "start_clock"):
+        # Steps left out of the instruction keep the clock's current settings
+        if username == sim.auctioneer and sim.configure_clock(
+            instruction.get("decrement", sim.clock_decrement),
+            instruction.get("interval", sim.clock_interval),
+            instruction.get("floor", sim.clock_floor),
+        ):
+            auction_updated = sim.start_clock(username, instruction.get("price"))
+    elif instruction["method"] == "stop_clock" and hasattr(sim, "stop_clock"):
+        auction_updated = sim.stop_clock(username)
+    return auction_updated, execution_report
+
+
+def get_order_type(instruction: dict) -> OrderType | None:
+    # Orders without a type are limit orders, unknown types are rejected
+    try:
+        return OrderType(instruction.get("order_type", OrderType.limit.value))
+    except ValueError:
+        return None
+
+
+def get_units(params: dict) -> int:
+    # Number of identical items sold in a sealed bid room
+    try:
+        return max(int(params.get("units", 1)), 1)
+    except ValueError:
+        return 1
+
+
+def get_room_distribution(params: dict) -> tuple[callable, int, int]:
+    # Limit prices are drawn from a generator seeded by the room's seed, so a recorded room draws the same ones again
+    if "limit_distribution_function" in params and "limit_min" in params and "limit_max" in params:
+        return get_limit_distribution(
+            params["limit_distribution_function"],
+            int(params["limit_min"]),
+            int(params["limit_max"]),
+            int(params["seed"]),
+        )
+    return get_limit_distribution("uniform", 100, 1000, int(params["seed"]))
+
+
+def create_auction(room_type: str, params: dict, clock: callable = None) -> Auction | None:
+    # The auction of a room_type room, None for an unknown type
+    limit_price_distribution = get_room_distribution(params)
+    match room_type:
+        case "english":
+            return EnglishAuction([], limit_price_distribution, clock=clock)
+        case "dutch":
+            return DutchAuction([], limit_price_distribution, clock=clock)
+        case "FPSB" if get_units(params) > 1:
+            # Each winner pays their own bid
+            return MultiUnitSealedBidAuction(
+                [], limit_price_distribution, units=get_units(params), clock=clock
+            )
+        case "FPSB":
+            return FirstPriceSealedBidAuction([], limit_price_distribution, clock=clock)
+        case "SPSB":
+            # With several units every winner pays the highest losing bid
+            return SecondPriceSealedBidAuction(
+                [], limit_price_distribution, units=get_units(params), clock=clock
+            )
+        case "CDA" if params.get("batch_interval") not in ["", None]:
+            # A frequent batch auction, cleared every batch_interval seconds instead of matched continuously
+            allocation = params.get("allocation", "pro_rata")
+            return FrequentBatchAuction(
+                [],
+                limit_price_distribution,
+                batch_interval=max(float(params["batch_interval"]), MIN_BATCH_INTERVAL),
+                allocation=allocation if allocation in ALLOCATION_RULES else "pro_rata",
+                clock=clock,
+            )
+        case "CDA":
+            return ContinuousDoubleAuction([], limit_price_distribution, clock=clock)
+    return None
+
+
+def configure_auction(sim: Auction, params: dict):
+    if "time" in params and params["time"] not in ["", None]:
+        sim.time_difference = params["time"]
+    if "starting_money" in params and params["starting_money"] not in ["", None]:
+        sim.money_range = int(params["starting_money"])
+    if "starting_bid" in params and params["starting_bid"] not in ["", None]:
+        sim.auction_price = int(params["starting_bid"])
+    if "increment" in params and hasattr(sim, "increment"):
+        # The step proxy bids rise by when outbidding each other
+        sim.increment = max(int(params["increment"]), 1)
+    if "clock_decrement" in params and hasattr(sim, "configure_clock"):
+        # The Dutch clock itself starts once the auctioneer has joined, from clock_start
+        sim.configure_clock(
+            params["clock_decrement"],
+            params.get("clock_interval", sim.clock_interval),
+            params.get("clock_floor", sim.clock_floor),
+        )
+    if "cancel_on_disconnect" in params and hasattr(sim, "cancel_on_disconnect"):
+        sim.cancel_on_disconnect = params["cancel_on_disconnect"] in ["true", "1", "on"]
+
+
+def create_room(
+    room_type: str,
+    params: dict,
+    username: str,
+    clock: callable = None,
+    draws: tuple[int, int] | None = None,
+) -> Auction | None:
+    # The auction of a new room as its creator's page parameters describe it, with the creator as its auctioneer.
+    # Live rooms and replayed sessions are both created here, so the same parameters build the same auction.
+    # A room without a seed is given one in params, draws are the creator's (limit_price, money) when replaying.
+    params.setdefault("seed", random.randrange(2**32))
+    sim = create_auction(room_type, params, clock)
+    if sim is None:
+        return None
+
+    configure_auction(sim, params)
+    sim.auctioneer = username
+    sim.add_user(username, sim.limit_price_distribution)
+    if draws is not None:
+        sim.users[username].limit_price, sim.users[username].money = draws
+    if "clock_start" in params and hasattr(sim, "start_clock"):
+        sim.start_clock(username, params["clock_start"])
+    return sim
+
+
+def apply_command(sim: Auction, command: dict):
+    # Applies a command recorded from a live room exactly as SimConsumer applied it, so replaying a room's commands
+    # in order on a clock reading each command's ts rebuilds the same auction. Commands are dicts with a kind:
+    #   join: user joined with their drawn limit_price and money
+    #   update: user sent the list of update_auction instructions
+    #   end: the auction's end was checked, by its deadline or a client
+    #   tick: a step of the Dutch clock
+    #   clear: a frequent batch auction cleared
+    #   disconnect: user left a room that cancels the orders of traders who disconnect
+    kind = command["kind"]
+    if kind == "join":
+        username = command["user"]
+        if username not in sim.users:
+            sim.add_user(username, sim.limit_price_distribution)
+            # The draws made live are used, not new ones
+            sim.users[username].limit_price = command["limit_price"]
+            sim.users[username].money = command["money"]
+    elif kind == "update":
+        auction_updated = False
+        for instruction in command["instructions"]:
+            try:
+                instruction_updated, _ = apply_instruction(sim, instruction, command["user"])
+            except ValueError:
+                # Rejected live as well, and the rest of the list was still applied
+                continue
+            auction_updated = auction_updated or instruction_updated
+        if auction_updated and isinstance(sim, ContinuousDoubleAuction):
+            # The book update broadcast live moves the book's sequence on
+            sim.get_book_update()
+    elif kind == "end":
+        sim.end_auction()
+    elif kind == "tick":
+        sim.tick_clock()
+    elif kind == "clear":
+        if isinstance(sim, FrequentBatchAuction) and sim.clear() is not None:
+            sim.get_book_update()
+    elif kind == "disconnect":
+        if sim.cancel_all(command["user"]) > 0:
+            sim.get_book_update()
+    else:
+        raise ValueError(f"Unknown command kind {kind}")
+
+
+def replay_commands(sim: Auction, commands: list[dict]) -> int:
+    # Applies recorded commands in order, each on a virtual clock reading the ts it was applied at live.
+    # Leaves the auction on that clock and returns the number of commands that failed, as they did live.
+    clock = VirtualClock()
+    sim.clock = clock
+    failed = 0
+    for command in commands:
+        clock.now = command["ts"]
+        try:
+            apply_command(sim, command)
+        except Exception:
+            # The command failed the same way live, having made the same changes before it did
+            failed += 1
+    return failed
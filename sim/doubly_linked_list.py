@@ -9,7 +9,17 @@ class OrderType(Enum):
     post_only = "POST_ONLY"
 
 
+# Order types whose unfilled remainder is discarded instead of resting in the book
+# Fill and kill is the same instruction as immediate or cancel under another exchange's name
+NON_RESTING_ORDER_TYPES = frozenset(
+    (OrderType.fill_and_kill, OrderType.market, OrderType.immediate_or_cancel)
+)
+
+
 class Order:
+    # Slotted because a book can hold a very large number of these
+    __slots__ = ("is_bid", "quantity", "price", "id", "order_type", "trader_id", "prev", "next")
+
     is_bid: bool
     quantity: int
     price: int
@@ -31,6 +41,8 @@ class Order:
 
 
 class DoublyLinkedList:
+    __slots__ = ("head", "tail", "length")
+
     head: Order | None
     tail: Order | None
     length: int
@@ -79,4 +91,7 @@ class DoublyLinkedList:
         else:
             order.next.prev = order.prev
 
+        # Removed orders may be appended again (e.g. when amended), so they must not keep stale links
+        order.prev = None
+        order.next = None
         self.length -= 1
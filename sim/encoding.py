@@ -0,0 +1,62 @@
+import json
+import math
+
+try:
+    import orjson
+except ImportError:  # orjson is an optional, faster drop-in for json
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # Without msgpack the binary subprotocol is simply never negotiated
+    msgpack = None
+
+# Websocket subprotocol clients request to exchange MessagePack frames instead of JSON text
+MSGPACK_SUBPROTOCOL = "msgpack"
+
+
+def encode_message(message: dict, username: str) -> str:
+    # Encodes a message in the {message, username} frame format every auction page expects
+    payload = {"message": message, "username": username}
+    if orjson is not None:
+        return orjson.dumps(
+            payload, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+        ).decode()
+    return json.dumps(payload)
+
+
+def encode_message_binary(message: dict, username: str) -> bytes:
+    # The same frame as encode_message, with integers packed natively rather than as decimal text
+    return msgpack.packb({"message": message, "username": username}, use_bin_type=True)
+
+
+def to_json_types(value):
+    # A decoded MessagePack value as JSON text could have carried it, so commands from binary clients are applied,
+    # journalled and replayed exactly like everyone else's. Anything JSON has no equivalent for raises ValueError.
+    if isinstance(value, bytes):
+        return value.decode("utf-8", errors="replace")
+    if isinstance(value, dict):
+        return {to_json_types(key): to_json_types(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [to_json_types(item) for item in value]
+    if isinstance(value, float) and not math.isfinite(value):
+        raise ValueError(f"{value} has no JSON equivalent")
+    if value is None or isinstance(value, (str, int, float)):
+        return value
+    raise ValueError(f"{type(value).__name__} has no JSON equivalent")
+
+
+def decode_frame(
+    text_data: str | None = None, bytes_data: bytes | None = None, binary: bool = False
+) -> dict | None:
+    # binary is whether the sender negotiated MessagePack, bytes frames from anyone else are ignored with None
+    if bytes_data is not None:
+        if not binary or msgpack is None:
+            return None
+        try:
+            return to_json_types(msgpack.unpackb(bytes_data, raw=False))
+        except ValueError:
+            return None
+    if orjson is not None:
+        return orjson.loads(text_data)
+    return json.loads(text_data)
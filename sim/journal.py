@@ -0,0 +1,320 @@
+import asyncio
+import json
+import os
+import pickle
+from pathlib import Path
+
+from sortedcontainers import SortedDict
+
+from .auctions import Auction, ContinuousDoubleAuction
+from .clocks import wall_clock
+from .commands import replay_commands
+from .limit_order_book import LimitLevel, Order, OrderType
+from .trade_tape import TradeTape
+
+try:
+    import orjson
+except ImportError:  # orjson is an optional, faster drop-in for json
+    orjson = None
+
+# A failed commit is retried this many times in all, each wait twice the last, before the room gives up on it
+COMMIT_ATTEMPTS = 3
+COMMIT_RETRY_DELAY = 0.05
+
+# The book of a double auction is stored as a flat list of orders rather than pickled as linked lists
+BOOK_ATTRIBUTES = frozenset(("bids", "asks", "orders", "trader_orders"))
+
+
+def encode_record(record: dict) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(record) + b"\n"
+    return json.dumps(record, separators=(",", ":")).encode() + b"\n"
+
+
+def decode_record(line: bytes) -> dict:
+    if orjson is not None:
+        return orjson.loads(line)
+    return json.loads(line)
+
+
+def get_book_orders(sim: ContinuousDoubleAuction) -> list[tuple]:
+    # Every resting order as (id, is_bid, price, quantity, order type, trader), each level in queue order
+    orders = []
+    for side in (sim.bids, sim.asks):
+        for level in side.values():
+            order = level.get_head()
+            while order is not None:
+                orders.append(
+                    (
+                        order.id,
+                        order.is_bid,
+                        order.price,
+                        order.quantity,
+                        order.order_type.value,
+                        order.trader_id,
+                    )
+                )
+                order = order.next
+    return orders
+
+
+def get_snapshot_payload(sim: Auction, sequence: int) -> dict:
+    # The auction as of the journal record numbered sequence, ready to pickle. Taken on the event loop, after which
+    # pickling it in a thread is safe: only the room's actor changes the auction, and it waits for the snapshot.
+    if isinstance(getattr(sim, "bid_history", None), TradeTape):
+        # Reading the history flushes its buffer, so it is flushed here rather than during pickling
+        sim.bid_history.flush()
+
+    if isinstance(sim, ContinuousDoubleAuction):
+        state = {
+            name: value for name, value in vars(sim).items() if name not in BOOK_ATTRIBUTES
+        }
+        return {
+            "sequence": sequence,
+            "type": type(sim),
+            "state": state,
+            "orders": get_book_orders(sim),
+        }
+    # Single item auctions hold a few bids at most, so they are pickled whole
+    return {"sequence": sequence, "auction": sim}
+
+
+def restore_auction(data: bytes) -> tuple[Auction, int]:
+    # Returns the auction and the sequence of the last journal record it includes
+    payload = pickle.loads(data)
+    if "auction" in payload:
+        return payload["auction"], payload["sequence"]
+
+    sim = object.__new__(payload["type"])
+    vars(sim).update(payload["state"])
+    sim.bids = SortedDict()
+    sim.asks = SortedDict()
+    sim.orders = {}
+    sim.trader_orders = {}
+
+    # Appending in the order they were saved puts every order back in its place in its level's queue
+    for id_, is_bid, price, quantity, order_type, trader_id in payload["orders"]:
+        order = Order(is_bid, quantity, price, id_, OrderType(order_type), trader_id)
+        side = sim.get_side(is_bid)
+        if price in side:
+            side[price].append(order)
+        else:
+            side[price] = LimitLevel(order)
+        sim.orders[id_] = order
+        sim.trader_orders.setdefault(trader_id, set()).add(id_)
+    return sim, payload["sequence"]
+
+
+def read_records(path: Path) -> tuple[list[dict], int]:
+    # Records in the journal and the length of the file they fill.
+    # A crash can leave the last record half written, it was never committed so it is dropped.
+    records = []
+    valid_length = 0
+    if not path.exists():
+        return records, valid_length
+
+    with open(path, "rb") as journal_file:
+        for line in journal_file:
+            if not line.endswith(b"\n"):
+                break
+            try:
+                records.append(decode_record(line))
+            except ValueError:
+                break
+            valid_length += len(line)
+    return records, valid_length
+
+
+class RoomJournal:
+    # Write-ahead log of one room. Commands are appended as the room's actor applies them and committed together
+    # with one write and one fsync once the batch they belong to has been applied, before anyone hears of the result.
+    # Every snapshot_interval records the auction is snapshotted and the journal emptied, which bounds recovery time.
+    # Rooms kept as sessions also copy every committed record to a log that is never emptied, headed by the room's
+    # create record, so the room can be replayed from its creation.
+    room_id: str
+    journal_path: Path
+    snapshot_path: Path
+    log_path: Path
+    snapshot_interval: int
+    auction: Auction | None
+    file: object
+    log: object | None  # The session log, None if the room is not logged or its log could not be kept
+    sequence: int  # Number of the last record appended
+    snapshot_sequence: int  # Number of the last record included in the snapshot on disk
+    snapshot_due: bool
+    pending: list[bytes]  # Encoded records not yet committed, kept until a commit has written them
+    commits: int
+
+    def __init__(self, directory: str | Path, room_id: str, snapshot_interval: int = 50_000):
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        self.room_id = room_id
+        self.journal_path = directory / f"{room_id}.journal"
+        self.snapshot_path = directory / f"{room_id}.snapshot"
+        self.log_path = directory / f"{room_id}.log"
+        self.snapshot_interval = snapshot_interval
+        self.auction = None
+        self.file = None
+        self.log = None
+        self.sequence = 0
+        self.snapshot_sequence = 0
+        self.snapshot_due = False
+        self.pending = []
+        self.commits = 0
+
+    def start(self, sim: Auction, config: dict | None = None):
+        # Journals a newly created auction, its first snapshot is written with the first commit.
+        # config is how the room was created, see create_room, and starts the session log if given.
+        self.auction = sim
+        # Unbuffered, each commit is a single write and a failed one is taken back exactly
+        self.file = open(self.journal_path, "wb", buffering=0)
+        self.snapshot_due = True
+        if config is not None:
+            self.log = open(self.log_path, "wb", buffering=0)
+            self.write_log(encode_record({"kind": "create", **config}))
+
+    def recover(self) -> Auction | None:
+        # Rebuilds the room's auction from its snapshot and the journal records after it, None if nothing was saved.
+        # Records are replayed on a virtual clock reading the time each was applied live, then the wall clock resumes.
+        if not self.snapshot_path.exists():
+            return None
+
+        sim, self.snapshot_sequence = restore_auction(self.snapshot_path.read_bytes())
+        records, valid_length = read_records(self.journal_path)
+
+        # Records up to the snapshot are left behind by a crash between writing it and emptying the journal
+        records = [record for record in records if record["seq"] > self.snapshot_sequence]
+        replay_commands(sim, records)
+        sim.clock = wall_clock
+        self.sequence = records[-1]["seq"] if records else self.snapshot_sequence
+
+        self.auction = sim
+        self.file = open(
+            self.journal_path, "r+b" if self.journal_path.exists() else "wb", buffering=0
+        )
+        # New records go after the last complete one, overwriting any torn write
+        self.file.truncate(valid_length)
+        self.file.seek(valid_length)
+
+        if self.log_path.exists():
+            log_records, log_length = read_records(self.log_path)
+            if log_records and log_records[-1].get("seq", 0) == self.sequence:
+                self.log = open(self.log_path, "r+b", buffering=0)
+                self.log.truncate(log_length)
+                self.log.seek(log_length)
+            else:
+                # A crash between committing records and logging them, the log can no longer replay the room
+                print(f"Room {self.room_id} session log is incomplete and has been dropped")
+                self.log_path.unlink(missing_ok=True)
+        return sim
+
+    def append(self, kind: str, ts: float, **fields):
+        self.sequence += 1
+        self.pending.append(
+            encode_record({"seq": self.sequence, "ts": ts, "kind": kind, **fields})
+        )
+
+    async def commit(self):
+        # One write and fsync for everything appended since the last commit, in a thread so other rooms carry on.
+        # Raises OSError if the records cannot be written, they stay pending and nothing of them is left in the file.
+        if self.pending:
+            data = b"".join(self.pending)
+            for attempt in range(COMMIT_ATTEMPTS):
+                try:
+                    await asyncio.to_thread(self.write, data)
+                    break
+                except OSError:
+                    if attempt == COMMIT_ATTEMPTS - 1:
+                        raise
+                    await asyncio.sleep(COMMIT_RETRY_DELAY * 2**attempt)
+            self.pending.clear()
+            self.commits += 1
+
+        if self.auction is not None and (
+            self.snapshot_due or self.sequence - self.snapshot_sequence >= self.snapshot_interval
+        ):
+            payload = get_snapshot_payload(self.auction, self.sequence)
+            try:
+                await asyncio.to_thread(self.write_snapshot, payload, self.sequence)
+            except OSError as error:
+                # The commands are already committed, so the room is safe and the snapshot is tried again next commit
+                print(f"Room {self.room_id} snapshot failed: {error!r}")
+
+    def write(self, data: bytes):
+        offset = self.file.tell()
+        try:
+            view = memoryview(data)
+            while view:
+                view = view[self.file.write(view) :]
+            os.fsync(self.file.fileno())
+        except OSError:
+            # Whatever part made it to the file is cut off again, so retrying cannot repeat or tear a record
+            self.file.truncate(offset)
+            self.file.seek(offset)
+            raise
+        self.write_log(data)
+
+    def write_log(self, data: bytes):
+        # The room never depends on its session log, so failing to write to it only drops the log
+        if self.log is None:
+            return
+        try:
+            view = memoryview(data)
+            while view:
+                view = view[self.log.write(view) :]
+        except OSError as error:
+            print(f"Room {self.room_id} session log dropped: {error!r}")
+            self.log.close()
+            self.log = None
+            self.log_path.unlink(missing_ok=True)
+
+    def write_snapshot(self, payload: dict, sequence: int):
+        # Replaces the snapshot atomically, then empties the journal it makes redundant
+        data = pickle.dumps(payload, protocol=pickle.HIGHEST_PROTOCOL)
+        temporary_path = self.snapshot_path.with_suffix(".snapshot.tmp")
+        with open(temporary_path, "wb") as snapshot_file:
+            snapshot_file.write(data)
+            snapshot_file.flush()
+            os.fsync(snapshot_file.fileno())
+        os.replace(temporary_path, self.snapshot_path)
+
+        # Records the snapshot includes are skipped on recovery, so failing to empty the journal loses nothing
+        self.file.truncate(0)
+        self.file.seek(0)
+        os.fsync(self.file.fileno())
+        self.snapshot_sequence = sequence
+        self.snapshot_due = False
+
+    def get_last_write(self) -> float:
+        # Unix timestamp of the room's last commit or snapshot
+        return max(
+            path.stat().st_mtime
+            for path in (self.journal_path, self.snapshot_path, self.log_path)
+            if path.exists()
+        )
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        if self.log is not None:
+            self.log.close()
+            self.log = None
+
+    def delete(self):
+        # For rooms that are finished with, nothing is left to recover
+        self.close()
+        self.journal_path.unlink(missing_ok=True)
+        self.snapshot_path.unlink(missing_ok=True)
+        self.log_path.unlink(missing_ok=True)
+
+    def __repr__(self):
+        return f"RoomJournal({self.room_id}, sequence={self.sequence}, snapshot={self.snapshot_sequence})"
+
+
+def get_journalled_rooms(directory: str | Path) -> list[str]:
+    # Rooms with something to recover, a room is journalled from its first snapshot
+    directory = Path(directory)
+    if not directory.is_dir():
+        return []
+    return sorted(path.stem for path in directory.glob("*.snapshot"))
@@ -4,6 +4,8 @@ from .doubly_linked_list import *
 
 
 class LimitLevel:
+    __slots__ = ("price", "orders", "quantity")
+
     price: int
     orders: DoublyLinkedList
     quantity: int
@@ -34,3 +36,39 @@ class LimitLevel:
 
     def get_length(self) -> int:
         return self.orders.length
+
+
+class ExecutionReport:
+    # Everything that happened to a single incoming order, built in one pass of the matching loop
+    __slots__ = ("order_id", "trader_id", "is_bid", "fills", "residual", "levels_touched", "rested")
+
+    order_id: int
+    trader_id: str
+    is_bid: bool
+    fills: list[list]  # [buyer, seller, quantity, price], the same rows appended to bid_history
+    residual: int  # Quantity left unfilled once matching finished
+    levels_touched: int
+    rested: bool  # Whether the residual was added to the book
+
+    def __init__(self, order: Order):
+        self.order_id = order.id
+        self.trader_id = order.trader_id
+        self.is_bid = order.is_bid
+        self.fills = []
+        self.residual = order.quantity
+        self.levels_touched = 0
+        self.rested = False
+
+    def get_filled_quantity(self) -> int:
+        return sum(fill[2] for fill in self.fills)
+
+    def as_dict(self) -> dict:
+        # Fills are left out as they are already broadcast as the trades of the book update
+        return {
+            "order_id": self.order_id,
+            "is_bid": self.is_bid,
+            "filled": self.get_filled_quantity(),
+            "residual": self.residual,
+            "levels_touched": self.levels_touched,
+            "rested": self.rested,
+        }
@@ -0,0 +1,53 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from sim.sweep import run_sweep
+
+
+class Command(BaseCommand):
+    help = (
+        "Runs every cell of a grid of headless auction simulations across a process pool, "
+        "skipping cells whose parameters and seed are already in the results table for the current simulation code. "
+        'The grid is a JSON object of Simulation parameters, lists are swept, e.g. {"room_type": ["english", "CDA"], '
+        '"limit_price_distribution": [["uniform", 100, 1000]], "users": [10, 50], "strategies": ["zic", "zip"], '
+        '"timer": [30, 90], "seed": [0, 1, 2]}. '
+        "List valued parameters (limit_price_distribution, money_range, strategies) are swept when given a list of lists."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("grid", help="Path of the JSON grid file")
+        parser.add_argument(
+            "--output",
+            default="sweep_results.sqlite3",
+            help="SQLite file holding the results table, results are only reused while the sim package's code is unchanged",
+        )
+        parser.add_argument(
+            "--workers", type=int, default=None, help="Worker processes, the CPU count by default"
+        )
+
+    def handle(self, *args, **options):
+        try:
+            with open(options["grid"]) as grid_file:
+                grid = json.load(grid_file)
+        except (OSError, ValueError) as error:
+            raise CommandError(f"Could not read grid {options['grid']}: {error}")
+        if not isinstance(grid, dict):
+            raise CommandError("The grid must be a JSON object of parameter names to values")
+
+        def on_result(key: str, params: dict, summary: dict):
+            efficiency = summary["efficiency"]
+            self.stdout.write(
+                f"{key[:12]} {params['room_type']:>7} seed={params['seed']} "
+                f"efficiency={'-' if efficiency is None else f'{efficiency:.3f}'} "
+                f"actions={summary['actions']} ({summary['wall_seconds']:.2f}s)"
+            )
+
+        try:
+            ran, cached = run_sweep(grid, options["output"], options["workers"], on_result)
+        except ValueError as error:
+            raise CommandError(str(error))
+
+        self.stdout.write(
+            self.style.SUCCESS(f"Ran {ran} cells, {cached} already in {options['output']}")
+        )
@@ -0,0 +1,185 @@
+# Replays recorded sessions of a room straight through its auction, with no websocket layer in between, and checks
+# the result against what the room produced live. A session is how the room was created (its type and page
+# parameters, the seed its limit prices are drawn from among them), every command it applied from then on (user,
+# instructions and timestamp) and the outcome the live room finished with.
+# Replaying saved sessions after an engine change shows whether it changed any outcome and how fast it runs.
+# Run from the repository root with: python -m sim.replay session [session ...] [--repeat N]
+import argparse
+import json
+import sys
+from pathlib import Path
+from time import perf_counter
+
+from .auctions import Auction, ContinuousDoubleAuction, MultiUnitSealedBidAuction
+from .clocks import VirtualClock
+from .commands import create_room, replay_commands
+from .journal import RoomJournal, decode_record, encode_record, get_book_orders, read_records
+
+
+def encode_state(value) -> str:
+    return json.dumps(value, sort_keys=True, separators=(",", ":"))
+
+
+def get_outcome(sim: Auction) -> dict[str, str]:
+    # What the room's users can see of its auction, in canonical JSON with one string per section so a mismatch says
+    # where it is. Timestamps are left out, offers made as the room is created are stamped before any command is.
+    #   fills: every bid_history row
+    #   prices: the current price and leader, the winners and what they pay, and whether the auction is over
+    #   book: resting orders of double auctions in queue order
+    #   profits: each user's limit price, money and profits
+    header = sim.bid_history.header
+    columns = [index for index, name in enumerate(header) if name != "timestamp"]
+    fills = [[row[index] for index in columns] for row in sim.bid_history.rows()]
+
+    prices = {"auction_over": getattr(sim, "auction_over", None)}
+    if isinstance(sim, ContinuousDoubleAuction):
+        best_bid, best_ask = sim.get_best_bid(), sim.get_best_ask()
+        prices["best_bid"] = None if best_bid is None else best_bid.price
+        prices["best_ask"] = None if best_ask is None else best_ask.price
+    else:
+        leader = getattr(sim, "auction_leader", None)
+        prices["price"] = sim.auction_price
+        prices["leader"] = None if leader is None else leader.username
+    if isinstance(sim, MultiUnitSealedBidAuction):
+        prices["winners"] = [[winner.username, paid] for paid, winner in sim.get_winners()]
+
+    return {
+        "fills": encode_state(fills),
+        "prices": encode_state(prices),
+        "book": encode_state(get_book_orders(sim) if isinstance(sim, ContinuousDoubleAuction) else None),
+        "profits": encode_state(
+            {
+                username: [user.limit_price, user.money, user.profits]
+                for username, user in sim.users.items()
+            }
+        ),
+    }
+
+
+class Session:
+    room_id: str
+    config: dict  # The room's create record: ts, room_type, params, and the creator's user, limit_price and money
+    commands: list[dict]
+    expected: dict[str, str] | None  # The live room's final outcome, None if the room was never seen finishing
+
+    def __init__(
+        self,
+        room_id: str,
+        config: dict,
+        commands: list[dict],
+        expected: dict[str, str] | None = None,
+    ):
+        self.room_id = room_id
+        self.config = config
+        self.commands = commands
+        self.expected = expected
+
+    @classmethod
+    def from_journal(cls, journal: RoomJournal) -> "Session":
+        # Everything the journal has logged since the room was created, expected to end as its auction is now
+        records, _ = read_records(journal.log_path)
+        if not records or records[0]["kind"] != "create":
+            raise ValueError(f"Room {journal.room_id} has no session log")
+        return cls(
+            journal.room_id,
+            records[0],
+            records[1:],
+            None if journal.auction is None else get_outcome(journal.auction),
+        )
+
+    def save(self, path: str | Path):
+        # JSON lines: the create record, one line per command, then the expected outcome
+        with open(path, "wb") as session_file:
+            session_file.write(encode_record({**self.config, "room_id": self.room_id}))
+            for command in self.commands:
+                session_file.write(encode_record(command))
+            if self.expected is not None:
+                session_file.write(encode_record({"kind": "expected", "outcome": self.expected}))
+
+    @classmethod
+    def load(cls, path: str | Path) -> "Session":
+        with open(path, "rb") as session_file:
+            config = decode_record(session_file.readline())
+            if config.get("kind") != "create":
+                raise ValueError(f"{path} is not a recorded session")
+            commands, expected = [], None
+            for line in session_file:
+                record = decode_record(line)
+                if record["kind"] == "expected":
+                    expected = record["outcome"]
+                else:
+                    commands.append(record)
+        return cls(config.pop("room_id"), config, commands, expected)
+
+    def create_auction(self) -> Auction:
+        # The room as it was created, on a clock reading the time it was created at
+        sim = create_room(
+            self.config["room_type"],
+            dict(self.config["params"]),
+            self.config["user"],
+            VirtualClock(self.config["ts"]),
+            (self.config["limit_price"], self.config["money"]),
+        )
+        if sim is None:
+            raise ValueError(f"Unknown room type {self.config['room_type']}")
+        return sim
+
+    def replay(self) -> tuple[Auction, float, int]:
+        # Returns the replayed auction, the seconds spent applying commands and the number that failed
+        sim = self.create_auction()
+        start = perf_counter()
+        failed = replay_commands(sim, self.commands)
+        return sim, perf_counter() - start, failed
+
+    def verify(self, repeat: int = 1) -> dict:
+        # Replays the session, repeat times for a steadier timing, and compares the outcome to the live room's
+        seconds = []
+        for _ in range(max(repeat, 1)):
+            sim, elapsed, failed = self.replay()
+            seconds.append(elapsed)
+        best = min(seconds)
+
+        outcome = get_outcome(sim)
+        mismatched = (
+            None
+            if self.expected is None
+            else sorted(name for name in outcome if outcome[name] != self.expected.get(name))
+        )
+        return {
+            "room_id": self.room_id,
+            "auction": type(sim).__name__,
+            "events": len(self.commands),
+            "failed": failed,
+            "seconds": best,
+            "events_per_second": len(self.commands) / best if best else None,
+            "trades": len(sim.bid_history),
+            "matches": None if mismatched is None else not mismatched,
+            "mismatched": mismatched,
+        }
+
+
+def save_journal_session(journal: RoomJournal, directory: str | Path) -> Path:
+    # Keeps a finished room's journal as a session before the journal is deleted
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    path = directory / f"{journal.room_id}-{journal.sequence}.session"
+    Session.from_journal(journal).save(path)
+    return path
+
+
+def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(description="Replay recorded room sessions and compare them to the live rooms")
+    parser.add_argument("sessions", nargs="+", help="Session files, as saved to SIM_SESSION_DIR")
+    parser.add_argument("--repeat", type=int, default=1, help="Replays per session, the fastest is reported")
+    args = parser.parse_args(argv)
+
+    all_match = True
+    for path in args.sessions:
+        result = Session.load(path).verify(args.repeat)
+        all_match = all_match and result["matches"] is not False
+        print(json.dumps({"session": str(path), **result}))
+    sys.exit(0 if all_match else 1)
+
+
+if __name__ == "__main__":
+    main()
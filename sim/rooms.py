@@ -0,0 +1,307 @@
+import asyncio
+
+from .clocks import VirtualClock, wall_clock
+from .encoding import encode_message, encode_message_binary
+from .journal import RoomJournal
+
+
+def merge_book_updates(previous: dict, update: dict) -> dict:
+    # Later quantities replace earlier ones for the same level, trades from both updates are kept in order.
+    # first_sequence lets clients check the merged update directly follows the last one they applied.
+    merged = {
+        "first_sequence": previous.get("first_sequence", previous["sequence"]),
+        "sequence": update["sequence"],
+    }
+    for side in ("bids", "asks"):
+        levels = {price: quantity for quantity, price in previous[side]}
+        levels.update({price: quantity for quantity, price in update[side]})
+        merged[side] = [[quantity, price] for price, quantity in levels.items()]
+    merged["trades"] = [*previous["trades"], *update["trades"]]
+    return merged
+
+
+def merge_profit_updates(previous: list, update: list) -> list:
+    # Pairs of [profit, username], the newest pairs go first as pages treat the first pair as the latest leader
+    usernames = {username for _, username in update}
+    return [*update, *(pair for pair in previous if pair[1] not in usernames)]
+
+
+# Keys describing shared room state, messages made only of these can be merged together.
+# Anything else (e.g. a user's own limit price) has to be sent on its own so ordering is preserved.
+COALESCED_KEYS = frozenset(
+    (
+        "book_update",
+        "batch_result",  # Only the latest batch is reported, the book update keeps every batch's trades
+        "execution_report",  # Only the latest report survives a merge, the book update keeps every trade
+        "price_update",
+        "auction_leader",
+        "set_price",
+        "price_tick",  # Only the latest price of a descending clock matters
+        "update_user_count",
+        "profit_update",
+    )
+)
+
+MERGE_FUNCTIONS: dict[str, callable] = {
+    "book_update": merge_book_updates,
+    "profit_update": merge_profit_updates,
+}
+
+
+def can_merge(message: dict) -> bool:
+    return COALESCED_KEYS.issuperset(message)
+
+
+def merge_messages(pending: dict | None, message: dict) -> dict:
+    # Returns a new message, neither argument is modified
+    if pending is None:
+        return dict(message)
+
+    merged = dict(pending)
+    for key, value in message.items():
+        if key in merged and key in MERGE_FUNCTIONS:
+            merged[key] = MERGE_FUNCTIONS[key](merged[key], value)
+        else:
+            merged[key] = value
+    return merged
+
+
+class RoomBroadcaster:
+    # Sends a room's broadcasts, optionally merging bursts of state updates into one message per flush interval.
+    # Messages that cannot be merged flush what is pending and go out on their own.
+    room_id: str
+    channel_layer: object
+    flush_interval: float  # Seconds, 0 sends every broadcast immediately
+    pending: dict | None
+    pending_username: str | None
+    flush_task: asyncio.Task | None
+    # Connected consumers per wire format, so a broadcast is only encoded in the formats someone reads
+    text_consumers: int
+    binary_consumers: int
+
+    def __init__(self, room_id: str, channel_layer, flush_interval: float = 0.0):
+        self.room_id = room_id
+        self.channel_layer = channel_layer
+        self.flush_interval = flush_interval
+        self.pending = None
+        self.pending_username = None
+        self.flush_task = None
+        self.text_consumers = 0
+        self.binary_consumers = 0
+
+    def add_consumer(self, binary: bool):
+        if binary:
+            self.binary_consumers += 1
+        else:
+            self.text_consumers += 1
+
+    def remove_consumer(self, binary: bool):
+        if binary:
+            self.binary_consumers -= 1
+        else:
+            self.text_consumers -= 1
+
+    async def publish(self, message: dict, username: str):
+        if self.flush_interval <= 0 or not can_merge(message):
+            await self.flush()
+            await self.send(message, username)
+            return
+
+        self.pending = merge_messages(self.pending, message)
+        self.pending_username = username
+
+        if self.flush_task is None:
+            self.flush_task = asyncio.create_task(self.flush_later())
+
+    async def flush_later(self):
+        await asyncio.sleep(self.flush_interval)
+        self.flush_task = None
+        await self.flush()
+
+    async def flush(self):
+        if self.pending is None:
+            return
+
+        message, username = self.pending, self.pending_username
+        self.pending = None
+        self.pending_username = None
+        await self.send(message, username)
+
+    async def close(self):
+        # Sends anything still pending and stops the flush timer
+        if self.flush_task is not None:
+            self.flush_task.cancel()
+            self.flush_task = None
+        await self.flush()
+
+    async def close_consumers(self):
+        # Sends anything still pending, then has every consumer in the room close its connection
+        await self.close()
+        await self.channel_layer.group_send(self.room_id, {"type": "close_consumer"})
+
+    async def send(self, message: dict, username: str):
+        # The payload is encoded once per wire format here rather than once per consumer in the room
+        await self.channel_layer.group_send(
+            self.room_id,
+            {
+                "type": "send_encoded",
+                "text": (
+                    encode_message(message, username) if self.text_consumers > 0 else None
+                ),
+                "bytes": (
+                    encode_message_binary(message, username)
+                    if self.binary_consumers > 0
+                    else None
+                ),
+            },
+        )
+
+
+class RoomStopped(RuntimeError):
+    # Raised to whoever submits a command to a room that has stopped taking them
+    pass
+
+
+class RoomActor:
+    # The single writer of a room's auction. Consumers submit commands to its queue instead of touching the
+    # auction themselves, and the actor applies them strictly in order, draining whatever has queued up as a batch.
+    # Commands are synchronous callables returning (broadcast message or None, username, reply to the submitter),
+    # the broadcasts of a batch are merged where possible so a burst produces one message rather than many.
+    broadcaster: RoomBroadcaster
+    max_batch_size: int
+    # Commands appended to the journal while a batch is applied are committed before any of its results go out
+    journal: RoomJournal | None
+    # The room's auction reads the time from this clock, moved on to the wall clock as each command starts.
+    # A command therefore sees a single instant however often it reads the time, so replaying it at that instant
+    # from the journal repeats it exactly.
+    clock: VirtualClock
+    queue: asyncio.Queue
+    task: asyncio.Task | None
+    # Why the room stopped taking commands, None while it runs. A room stops when a batch cannot be journalled, as
+    # its auction then holds changes nobody may be told about, and only recovering it from its journal undoes them.
+    stopped_by: Exception | None
+    # Counters for monitoring how far behind the room is running
+    max_queue_depth: int
+    commands_processed: int
+    batches_processed: int
+
+    def __init__(
+        self,
+        broadcaster: RoomBroadcaster,
+        max_batch_size: int = 256,
+        journal: RoomJournal | None = None,
+    ):
+        self.broadcaster = broadcaster
+        self.max_batch_size = max_batch_size
+        self.journal = journal
+        self.clock = VirtualClock(wall_clock())
+        self.queue = asyncio.Queue()
+        self.task = None
+        self.stopped_by = None
+        self.max_queue_depth = 0
+        self.commands_processed = 0
+        self.batches_processed = 0
+
+    async def submit(self, command: callable, *args):
+        # Resolves with the command's reply once the batch containing it has been applied
+        future = asyncio.get_running_loop().create_future()
+        self.enqueue(command, args, future)
+        return await future
+
+    def post(self, command: callable, *args):
+        # Queues a command nobody waits on, e.g. one raised by a timer rather than a consumer
+        self.enqueue(command, args, None)
+
+    def enqueue(self, command: callable, args: tuple, future: asyncio.Future | None):
+        self.queue.put_nowait((command, args, future))
+        self.max_queue_depth = max(self.max_queue_depth, self.queue.qsize())
+
+        if self.task is None:
+            self.task = asyncio.create_task(self.run())
+
+    async def run(self):
+        try:
+            while True:
+                batch = [await self.queue.get()]
+                while len(batch) < self.max_batch_size and not self.queue.empty():
+                    batch.append(self.queue.get_nowait())
+
+                try:
+                    await self.run_batch(batch)
+                except Exception as error:
+                    # Something past the commands themselves failed, e.g. encoding or publishing a broadcast.
+                    # Everyone waiting on the batch hears of it rather than waiting for a reply that never comes.
+                    self.fail_batch(batch, error)
+        finally:
+            # Should the actor stop anyway, the next command starts a new one instead of queueing behind a dead task
+            if self.task is asyncio.current_task():
+                self.task = None
+
+    async def run_batch(self, batch: list[tuple[callable, tuple, asyncio.Future | None]]):
+        if self.stopped_by is not None:
+            raise RoomStopped(self.stopped_by)
+
+        outgoing: list[tuple[dict, str]] = []
+        results = []
+        for command, args, future in batch:
+            # The wall clock can step backwards, the room's clock never does
+            self.clock.advance_to(max(wall_clock(), self.clock.now))
+            try:
+                message, username, reply = command(*args)
+            except Exception as error:
+                results.append((future, None, error))
+                continue
+
+            if message:
+                if outgoing and can_merge(outgoing[-1][0]) and can_merge(message):
+                    outgoing[-1] = (merge_messages(outgoing[-1][0], message), username)
+                else:
+                    outgoing.append((message, username))
+            results.append((future, reply, None))
+
+        self.commands_processed += len(batch)
+        self.batches_processed += 1
+
+        if self.journal is not None:
+            # One fsync for the whole batch, the commands queued meanwhile make up the next one
+            try:
+                await self.journal.commit()
+            except OSError as error:
+                # Nothing of the batch is broadcast or acknowledged, and nobody is left connected to a room that
+                # has moved on from its journal
+                self.stopped_by = error
+                await self.broadcaster.close_consumers()
+                raise
+
+        for message, username in outgoing:
+            await self.broadcaster.publish(message, username)
+
+        # Submitters hear back only once the batch's broadcasts have been handed to the channel layer
+        for future, reply, error in results:
+            if future is None:  # Posted, so there is nobody to hand the reply or error to
+                if error is not None:
+                    print(f"Room {self.broadcaster.room_id} command failed: {error!r}")
+                continue
+            if future.done():  # The submitting consumer has gone away
+                continue
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(reply)
+
+    def fail_batch(self, batch: list[tuple[callable, tuple, asyncio.Future | None]], error: Exception):
+        print(f"Room {self.broadcaster.room_id} batch failed: {error!r}")
+        for _, _, future in batch:
+            if future is not None and not future.done():
+                # A new exception for each submitter, the original's traceback holds the actor's own frames
+                if self.stopped_by is not None:
+                    failure = RoomStopped(f"Room {self.broadcaster.room_id} stopped: {self.stopped_by!r}")
+                else:
+                    failure = RuntimeError(f"Room {self.broadcaster.room_id} batch failed: {error!r}")
+                failure.__cause__ = error
+                future.set_exception(failure)
+
+    async def close(self):
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
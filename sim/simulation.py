@@ -0,0 +1,541 @@
+# Headless auction runner, drives the auctions of sim/auctions.py directly with automated agents on a VirtualClock.
+# Needs neither Django nor websockets. Run from the repository root with, for example:
+#   python -m sim.simulation CDA --agents zic=50 zip=50 --rounds 100 --seed 1
+import argparse
+import heapq
+import json
+import math
+import random
+from time import perf_counter
+
+import numpy as np
+
+from .agents import AGENT_TYPES, Agent, ZIPAgent
+from .auctions import (
+    Auction,
+    ContinuousDoubleAuction,
+    DutchAuction,
+    EnglishAuction,
+    FirstPriceSealedBidAuction,
+    FrequentBatchAuction,
+    MultiUnitSealedBidAuction,
+    SecondPriceSealedBidAuction,
+)
+from .batch_clearing import ALLOCATION_RULES
+from .clocks import VirtualClock
+from .limit_order_book import OrderType
+
+ROOM_TYPES = ("english", "dutch", "FPSB", "SPSB", "CDA")
+AUCTIONEER = "auctioneer"
+
+
+def get_limit_distribution(
+    distribution: str, limit_min: int, limit_max: int, seed: int
+) -> tuple[callable, int, int]:
+    # The distributions offered to rooms by SimConsumer.get_limit_distribution, drawn from a seeded generator.
+    # As there, a normal distribution takes limit_min as its mean and limit_max as its standard deviation.
+    if distribution == "normal":
+        return np.random.default_rng(seed).normal, limit_min, limit_max
+    return random.Random(seed).uniform, limit_min, limit_max
+
+
+def get_max_surplus(values: list[int], costs: list[int]) -> int:
+    # Surplus of the efficient allocation, the highest values matched with the lowest costs for as long as they gain
+    return sum(
+        max(value - cost, 0)
+        for value, cost in zip(sorted(values, reverse=True), sorted(costs))
+    )
+
+
+class Simulation:
+    # Runs rounds of one room type, a fresh auction per round with limit prices redrawn for the same agents.
+    # Agents act at exponentially distributed intervals of simulated time, alongside the auction's own timed events
+    # (deadlines, the Dutch clock and batch clears), all kept in one event queue ordered by time.
+    room_type: str
+    agents: list[Agent]
+    agents_by_name: dict[str, Agent]
+    rounds: int
+    seed: int
+    rng: random.Random
+    limit_price_distribution: tuple[callable, int, int]
+    money_range: tuple[int, int] | int
+    timer: int | None  # None keeps each auction's own default
+    think_time: float  # Mean simulated seconds between an agent's actions
+    units: int  # Items for sale in sealed bid rounds, units per trader in double auctions
+    increment: int
+    clock_decrement: int
+    clock_interval: float
+    batch_interval: float | None  # Makes CDA rounds frequent batch auctions
+    allocation: str
+    price_floor: int
+    price_ceiling: int
+
+    clock: VirtualClock  # Seconds since the start of the run, shared by every round's auction
+    events: list[tuple[float, int, callable, tuple]]
+    event_count: int
+    auction: Auction | None
+    round_over: bool
+    last_trade_price: int | None
+    trade_count: int
+    seen_trades: dict[str, int]  # trade_count when each agent last acted
+    reported_trades: int  # bid_history rows of a batch auction already credited to agents
+    sale_price: int | None  # What the item of a single item round went for
+    # Totals over the run
+    actions: int
+    accepted: int
+    trades: int
+    volume: int
+    turnover: int
+    surplus: int
+    max_surplus: int
+
+    def __init__(
+        self,
+        room_type: str,
+        agents: dict[str, int],  # Number of agents of each strategy in AGENT_TYPES
+        rounds: int = 1,
+        seed: int = 0,
+        distribution: str = "uniform",
+        limit_min: int = 100,
+        limit_max: int = 1000,
+        money_range: tuple[int, int] | int = (1000, 2000),
+        timer: int | None = None,
+        think_time: float = 1.0,
+        units: int = 1,
+        increment: int = 1,
+        clock_decrement: int = 10,
+        clock_interval: float = 1.0,
+        batch_interval: float | None = None,
+        allocation: str = "pro_rata",
+    ):
+        if room_type not in ROOM_TYPES:
+            raise ValueError(f"Unknown room type {room_type}")
+        if allocation not in ALLOCATION_RULES:
+            raise ValueError(f"Unknown allocation rule {allocation}")
+        unknown = set(agents) - set(AGENT_TYPES)
+        if unknown:
+            raise ValueError(f"Unknown agent strategies {sorted(unknown)}")
+
+        self.room_type = room_type
+        self.rounds = rounds
+        self.seed = seed
+        self.rng = random.Random(seed)
+        self.limit_price_distribution = get_limit_distribution(
+            distribution, limit_min, limit_max, seed
+        )
+        self.money_range = money_range
+        self.timer = timer
+        self.think_time = think_time
+        self.units = max(int(units), 1)
+        self.increment = increment
+        self.clock_decrement = clock_decrement
+        self.clock_interval = clock_interval
+        self.batch_interval = batch_interval
+        self.allocation = allocation
+        if distribution == "normal":
+            self.price_floor = max(int(limit_min - 3 * limit_max), 1)
+            self.price_ceiling = int(limit_min + 3 * limit_max)
+        else:
+            self.price_floor = max(int(limit_min), 1)
+            self.price_ceiling = int(limit_max)
+
+        # Double auctions alternate buyers and sellers within each strategy, other rooms only have buyers
+        self.agents = []
+        for strategy, count in agents.items():
+            for index in range(count):
+                self.agents.append(
+                    AGENT_TYPES[strategy](
+                        f"{strategy}_{index}",
+                        not self.is_double_auction() or index % 2 == 0,
+                        self.rng,
+                        self.price_floor,
+                        self.price_ceiling,
+                    )
+                )
+        self.agents_by_name = {agent.username: agent for agent in self.agents}
+
+        self.clock = VirtualClock()
+        self.events = []
+        self.event_count = 0
+        self.auction = None
+        self.round_over = False
+        self.last_trade_price = None
+        self.trade_count = 0
+        self.seen_trades = {}
+        self.reported_trades = 0
+        self.sale_price = None
+        self.actions = 0
+        self.accepted = 0
+        self.trades = 0
+        self.volume = 0
+        self.turnover = 0
+        self.surplus = 0
+        self.max_surplus = 0
+
+    def is_double_auction(self) -> bool:
+        return self.room_type == "CDA"
+
+    def create_auction(self) -> Auction:
+        # The auction SimConsumer.set_room_type would create for a room with the same settings
+        usernames = [agent.username for agent in self.agents]
+        if not self.is_double_auction():
+            usernames.append(AUCTIONEER)
+        # Every round's auction reads the run's simulated time, timers are left at each auction's default unless set
+        options = {"clock": self.clock}
+        if self.timer is not None:
+            options["timer"] = self.timer
+        distribution, money_range = self.limit_price_distribution, self.money_range
+
+        match self.room_type:
+            case "english":
+                auction = EnglishAuction(
+                    usernames, distribution, money_range, increment=self.increment, **options
+                )
+            case "dutch":
+                auction = DutchAuction(usernames, distribution, money_range, clock=self.clock)
+            case "FPSB" if self.units > 1:
+                auction = MultiUnitSealedBidAuction(
+                    usernames, distribution, money_range, units=self.units, **options
+                )
+            case "FPSB":
+                auction = FirstPriceSealedBidAuction(usernames, distribution, money_range, **options)
+            case "SPSB":
+                auction = SecondPriceSealedBidAuction(
+                    usernames, distribution, money_range, units=self.units, **options
+                )
+            case _ if self.batch_interval is not None:
+                auction = FrequentBatchAuction(
+                    usernames,
+                    distribution,
+                    money_range,
+                    batch_interval=self.batch_interval,
+                    allocation=self.allocation,
+                    **options,
+                )
+            case _:
+                auction = ContinuousDoubleAuction(
+                    usernames,
+                    distribution,
+                    money_range,
+                    **options,
+                )
+
+        if not self.is_double_auction():
+            auction.auctioneer = AUCTIONEER
+        return auction
+
+    def schedule(self, at: float, callback: callable, *args):
+        # The event count breaks ties so events due at the same time run in the order they were scheduled
+        heapq.heappush(self.events, (at, self.event_count, callback, args))
+        self.event_count += 1
+
+    def schedule_turn(self, agent: Agent):
+        self.schedule(
+            self.clock.now + self.rng.expovariate(1 / self.think_time), self.take_turn, agent
+        )
+
+    def schedule_deadline(self):
+        deadline = self.auction.get_deadline()
+        if deadline is not None:
+            # Auctions only count as finished once their deadline has passed, not at the deadline itself
+            self.schedule(math.nextafter(deadline, math.inf), self.check_deadline, deadline)
+
+    def run(self) -> dict:
+        random.seed(self.seed)  # AuctionUser draws its money from the module level generator
+        start = perf_counter()
+        for _ in range(self.rounds):
+            self.run_round()
+        return self.get_summary(perf_counter() - start)
+
+    def run_round(self):
+        # Rounds start on a whole second, as auctions truncate their start time to one
+        self.clock.advance_to(float(math.ceil(self.clock.now)))
+        self.events.clear()
+        self.round_over = False
+        self.sale_price = None
+        self.auction = auction = self.create_auction()
+        self.reported_trades = len(auction.bid_history)
+
+        values, costs = [], []
+        for agent in self.agents:
+            agent.start_round(auction.users[agent.username].limit_price, self.units)
+            (values if agent.is_buyer else costs).extend([agent.limit_price] * self.units)
+            self.seen_trades[agent.username] = self.trade_count
+            self.schedule_turn(agent)
+
+        if self.is_double_auction():
+            if isinstance(auction, FrequentBatchAuction):
+                self.schedule(self.clock.now + auction.batch_interval, self.clear_batch)
+        else:
+            items = self.units if self.room_type in ("FPSB", "SPSB") else 1
+            costs = [auction.users[AUCTIONEER].limit_price] * items
+
+        if isinstance(auction, DutchAuction):
+            # The clock falls from the price ceiling to the auctioneer's limit price, which acts as a reserve
+            floor = max(auction.users[AUCTIONEER].limit_price, 0)
+            auction.configure_clock(self.clock_decrement, self.clock_interval, floor)
+            if auction.start_clock(AUCTIONEER, max(self.price_ceiling, floor + 1)):
+                self.schedule(self.clock.now + self.clock_interval, self.tick_clock)
+            else:
+                self.round_over = True
+
+        self.schedule_deadline()
+        self.max_surplus += get_max_surplus(values, costs)
+
+        while self.events and not self.round_over:
+            at, _, callback, args = heapq.heappop(self.events)
+            self.clock.advance_to(at)
+            callback(*args)
+
+        self.end_round()
+
+    def end_round(self):
+        auction = self.auction
+        if isinstance(auction, MultiUnitSealedBidAuction):
+            winners = {winner.username: price for price, winner in auction.get_winners()}
+            # The lowest price paid is what a losing bidder would have needed to beat
+            price = min(winners.values()) if winners else None
+        elif isinstance(auction, (EnglishAuction, FirstPriceSealedBidAuction)):
+            leader = auction.auction_leader
+            winners = {} if leader is None else {leader.username: auction.auction_price}
+            price = auction.auction_price if winners else None
+        elif isinstance(auction, DutchAuction):
+            buyer = auction.bid_history[-1][0] if self.sale_price is not None else None
+            winners = {} if buyer is None else {buyer: self.sale_price}
+            price = self.sale_price
+        else:
+            winners, price = {}, None
+
+        for username, paid in winners.items():
+            self.trades += 1
+            self.volume += 1
+            self.turnover += paid
+            self.agents_by_name[username].trades += 1
+
+        for agent in self.agents:
+            agent.profits += auction.users[agent.username].profits
+            agent.end_round(winners.get(agent.username, price), agent.username in winners)
+
+        self.surplus += sum(user.profits for user in auction.users.values())
+
+    def check_deadline(self, deadline: float):
+        if self.auction.end_auction():
+            self.round_over = True
+            return
+
+        # English deadlines move with every bid, so the auction may now finish later than first scheduled
+        if self.auction.get_deadline() != deadline:
+            self.schedule_deadline()
+
+    def take_turn(self, agent: Agent):
+        self.actions += 1
+        match self.room_type:
+            case "english":
+                acting = self.english_turn(agent)
+            case "dutch":
+                acting = self.dutch_turn(agent)
+            case "FPSB" | "SPSB":
+                acting = self.sealed_bid_turn(agent)
+            case _:
+                acting = self.double_auction_turn(agent)
+
+        if acting and not self.round_over:
+            self.schedule_turn(agent)
+
+    def english_turn(self, agent: Agent) -> bool:
+        auction: EnglishAuction = self.auction
+        leader = auction.auction_leader
+        if leader is not None and leader.username == agent.username:
+            return True
+
+        minimum = self.increment if auction.auction_price is None else auction.auction_price + self.increment
+        amount = agent.quote(minimum)
+        if amount is None:
+            # The price has passed what the agent is prepared to pay, and an ascending price never comes back down
+            return minimum <= agent.limit_price
+
+        if auction.bid(agent.username, amount):
+            self.accepted += 1
+            # Each bid moves the deadline, which check_deadline catches up with when the old one comes round
+        return True
+
+    def dutch_turn(self, agent: Agent) -> bool:
+        auction: DutchAuction = self.auction
+        price = auction.auction_price
+        if price is None:
+            return True
+
+        quote = agent.quote()
+        if quote is not None and quote >= price and auction.bid(agent.username):
+            self.accepted += 1
+            self.sale_price = price
+            self.round_over = True
+        return True
+
+    def tick_clock(self):
+        if not self.auction.tick_clock():
+            # Stopped at the floor a whole interval ago without a sale
+            self.round_over = True
+            return
+        self.schedule(self.clock.now + self.clock_interval, self.tick_clock)
+
+    def sealed_bid_turn(self, agent: Agent) -> bool:
+        # Every agent bids exactly once
+        auction: FirstPriceSealedBidAuction = self.auction
+        amount = agent.quote()
+        if amount is not None and auction.bid(agent.username, amount):
+            self.accepted += 1
+        self.round_over = auction.auction_over
+        return False
+
+    def double_auction_turn(self, agent: Agent) -> bool:
+        # An agent with units left replaces its resting order, if it still has one, with a fresh one unit order
+        if agent.units <= 0:
+            return False
+        auction: ContinuousDoubleAuction = self.auction
+
+        if agent.order_id is not None:
+            auction.cancel(agent.order_id, agent.username)
+            agent.order_id = None
+
+        if isinstance(agent, ZIPAgent):
+            # Only the latest trade matters to the agent, however many it missed
+            seen = self.seen_trades[agent.username]
+            self.seen_trades[agent.username] = self.trade_count
+            best = auction.get_best_bid() if agent.is_buyer else auction.get_best_ask()
+            agent.observe(
+                self.last_trade_price if self.trade_count > seen else None,
+                None if best is None else best.price,
+            )
+
+        price = agent.quote()
+        if price is None:
+            return True
+
+        report = auction.submit_order(agent.is_buyer, 1, price, OrderType.limit, agent.username)
+        if report is None:
+            return True
+
+        self.accepted += 1
+        if report.rested:
+            agent.order_id = report.order_id
+        for buyer, seller, quantity, trade_price in report.fills:
+            self.record_trade(buyer, seller, quantity, trade_price)
+        self.reported_trades = len(auction.bid_history)
+        return agent.units > 0
+
+    def clear_batch(self):
+        auction: FrequentBatchAuction = self.auction
+        if auction.auction_over:
+            return
+
+        auction.clear()
+        for buyer, seller, quantity, trade_price, _ in auction.bid_history[self.reported_trades :]:
+            self.record_trade(buyer, seller, quantity, trade_price)
+        self.reported_trades = len(auction.bid_history)
+        self.schedule(self.clock.now + auction.batch_interval, self.clear_batch)
+
+    def record_trade(self, buyer: str, seller: str, quantity: int, price: int):
+        # Double auctions leave profits to the traders, who gain the difference between the price and their limit
+        users = self.auction.users
+        users[buyer].profits += (users[buyer].limit_price - price) * quantity
+        users[seller].profits += (price - users[seller].limit_price) * quantity
+
+        for username in (buyer, seller):
+            agent = self.agents_by_name[username]
+            agent.units -= quantity
+            agent.trades += 1
+            if agent.units <= 0:
+                agent.order_id = None
+
+        self.last_trade_price = price
+        self.trade_count += 1
+        self.trades += 1
+        self.volume += quantity
+        self.turnover += price * quantity
+
+    def get_summary(self, wall_seconds: float) -> dict:
+        strategies = {}
+        for agent in self.agents:
+            totals = strategies.setdefault(
+                agent.strategy, {"agents": 0, "profit": 0, "trades": 0}
+            )
+            totals["agents"] += 1
+            totals["profit"] += agent.profits
+            totals["trades"] += agent.trades
+        for totals in strategies.values():
+            totals["mean_profit"] = totals["profit"] / totals["agents"]
+
+        return {
+            "room_type": self.room_type,
+            "batch_interval": self.batch_interval,
+            "rounds": self.rounds,
+            "seed": self.seed,
+            "agents": len(self.agents),
+            "actions": self.actions,
+            "accepted": self.accepted,
+            "trades": self.trades,
+            "volume": self.volume,
+            "mean_price": self.turnover / self.volume if self.volume else None,
+            "surplus": self.surplus,
+            "max_surplus": self.max_surplus,
+            "efficiency": self.surplus / self.max_surplus if self.max_surplus else None,
+            "simulated_seconds": self.clock.now,
+            "wall_seconds": wall_seconds,
+            "actions_per_second": self.actions / wall_seconds if wall_seconds else None,
+            "strategies": strategies,
+        }
+
+
+def parse_agents(specs: list[str]) -> dict[str, int]:
+    # "zic=50" style counts, one per strategy
+    agents = {}
+    for spec in specs:
+        strategy, _, count = spec.partition("=")
+        agents[strategy] = agents.get(strategy, 0) + int(count or 1)
+    return agents
+
+
+def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(description="Run auctions headlessly with automated agents")
+    parser.add_argument("room_type", choices=ROOM_TYPES)
+    parser.add_argument(
+        "--agents", nargs="+", default=["zic=10"], help=f"strategy=count, strategies: {', '.join(AGENT_TYPES)}"
+    )
+    parser.add_argument("--rounds", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--distribution", choices=("uniform", "normal"), default="uniform")
+    parser.add_argument("--limit-min", type=int, default=100)
+    parser.add_argument("--limit-max", type=int, default=1000)
+    parser.add_argument("--timer", type=int, default=None)
+    parser.add_argument("--think-time", type=float, default=1.0)
+    parser.add_argument("--units", type=int, default=1)
+    parser.add_argument("--increment", type=int, default=1)
+    parser.add_argument("--clock-decrement", type=int, default=10)
+    parser.add_argument("--clock-interval", type=float, default=1.0)
+    parser.add_argument("--batch-interval", type=float, default=None)
+    parser.add_argument("--allocation", choices=ALLOCATION_RULES, default="pro_rata")
+    args = parser.parse_args(argv)
+
+    simulation = Simulation(
+        args.room_type,
+        parse_agents(args.agents),
+        rounds=args.rounds,
+        seed=args.seed,
+        distribution=args.distribution,
+        limit_min=args.limit_min,
+        limit_max=args.limit_max,
+        timer=args.timer,
+        think_time=args.think_time,
+        units=args.units,
+        increment=args.increment,
+        clock_decrement=args.clock_decrement,
+        clock_interval=args.clock_interval,
+        batch_interval=args.batch_interval,
+        allocation=args.allocation,
+    )
+    print(json.dumps(simulation.run(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
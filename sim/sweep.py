@@ -0,0 +1,190 @@
+# Parameter sweeps of headless simulations, run across a process pool with results cached in a SQLite table.
+# Each cell of the grid is keyed by a hash of its complete parameters, seed included, and of the simulation code, so a
+# cell already in the table is never run again and growing a grid by one value only runs the cells that value adds.
+# Changing any module of the sim package changes every key, so results of older code are never reused.
+import hashlib
+import inspect
+import itertools
+import json
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+from .simulation import Simulation
+
+SIMULATION_DEFAULTS = {
+    name: parameter.default
+    for name, parameter in inspect.signature(Simulation.__init__).parameters.items()
+    if parameter.default is not inspect.Parameter.empty
+}
+
+
+def get_code_version() -> str:
+    # Hash of the sim package's modules, everything a simulation runs is in them
+    digest = hashlib.sha256()
+    for path in sorted(Path(__file__).parent.glob("*.py")):
+        digest.update(path.name.encode())
+        digest.update(path.read_bytes())
+    return digest.hexdigest()
+
+
+CODE_VERSION = get_code_version()
+
+CREATE_TABLE = """
+CREATE TABLE IF NOT EXISTS results (
+    key TEXT PRIMARY KEY,
+    room_type TEXT NOT NULL,
+    seed INTEGER NOT NULL,
+    efficiency REAL,
+    mean_price REAL,
+    actions INTEGER NOT NULL,
+    wall_seconds REAL NOT NULL,
+    params TEXT NOT NULL,
+    summary TEXT NOT NULL
+)
+"""
+
+
+# Parameters whose values are themselves lists, only swept when given a list of such lists
+LIST_PARAMETERS = frozenset(("limit_price_distribution", "money_range", "strategies"))
+
+
+def get_grid_values(name: str, value) -> list:
+    if not isinstance(value, list):
+        return [value]
+    if name in LIST_PARAMETERS and not all(isinstance(item, list) for item in value):
+        return [value]
+    return value
+
+
+def expand_grid(grid: dict) -> list[dict]:
+    # Every combination of the grid's list values, scalars are shared by every cell
+    names = sorted(grid)
+    values = [get_grid_values(name, grid[name]) for name in names]
+    return [dict(zip(names, combination)) for combination in itertools.product(*values)]
+
+
+def get_cell_params(cell: dict) -> dict:
+    # The full keyword arguments of a cell's Simulation, so leaving a parameter out of a grid hashes the same
+    # as giving its default. Also accepts the shorthands:
+    #   limit_price_distribution: [distribution, limit_min, limit_max], as rooms take them
+    #   users with strategies: a number of agents shared as evenly as possible between a list of strategies
+    cell = dict(cell)
+    if "limit_price_distribution" in cell:
+        cell["distribution"], cell["limit_min"], cell["limit_max"] = cell.pop(
+            "limit_price_distribution"
+        )
+    if "users" in cell:
+        users = int(cell.pop("users"))
+        strategies = cell.pop("strategies", ["zic"])
+        if isinstance(strategies, str):
+            strategies = [strategies]
+        cell["agents"] = {
+            strategy: users // len(strategies) + (index < users % len(strategies))
+            for index, strategy in enumerate(strategies)
+        }
+    if isinstance(cell.get("money_range"), tuple):
+        cell["money_range"] = list(cell["money_range"])
+
+    if "room_type" not in cell or "agents" not in cell:
+        raise ValueError("Every cell needs a room_type and either agents or users")
+    unknown = set(cell) - set(SIMULATION_DEFAULTS) - {"room_type", "agents"}
+    if unknown:
+        raise ValueError(f"Unknown simulation parameters {sorted(unknown)}")
+
+    return {**SIMULATION_DEFAULTS, **cell}
+
+
+def get_cell_key(params: dict, code_version: str = CODE_VERSION) -> str:
+    return hashlib.sha256(
+        json.dumps(
+            {"code": code_version, "params": params}, sort_keys=True, separators=(",", ":")
+        ).encode()
+    ).hexdigest()
+
+
+def run_cell(key: str, params: dict) -> tuple[str, dict, dict]:
+    # Runs in a worker process, the parameters are plain JSON values so they pickle cheaply
+    kwargs = dict(params)
+    if isinstance(kwargs["money_range"], list):
+        kwargs["money_range"] = tuple(kwargs["money_range"])
+    return key, params, Simulation(**kwargs).run()
+
+
+class ResultStore:
+    # One row per completed cell, with the columns most often filtered on pulled out of the JSON summary
+    connection: sqlite3.Connection
+
+    def __init__(self, path: str):
+        self.connection = sqlite3.connect(path)
+        self.connection.execute(CREATE_TABLE)
+        self.connection.commit()
+
+    def get_keys(self) -> set[str]:
+        return {key for (key,) in self.connection.execute("SELECT key FROM results")}
+
+    def add(self, key: str, params: dict, summary: dict):
+        self.connection.execute(
+            "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                key,
+                params["room_type"],
+                params["seed"],
+                summary["efficiency"],
+                summary["mean_price"],
+                summary["actions"],
+                summary["wall_seconds"],
+                json.dumps(params, sort_keys=True, separators=(",", ":")),
+                json.dumps(summary, separators=(",", ":")),
+            ),
+        )
+        # Committed per cell so an interrupted sweep keeps everything it finished
+        self.connection.commit()
+
+    def close(self):
+        self.connection.close()
+
+
+def get_pending_cells(grid: dict, done: set[str]) -> tuple[list[tuple[str, dict]], int]:
+    # The cells still to run, and the number skipped because they are already in the table
+    pending, cached = {}, 0
+    for cell in expand_grid(grid):
+        params = get_cell_params(cell)
+        key = get_cell_key(params)
+        if key in done:
+            cached += 1
+        else:
+            # Two spellings of the same cell, e.g. users with strategies and the equivalent agents, run once
+            pending[key] = params
+    return list(pending.items()), cached
+
+
+def run_sweep(
+    grid: dict,
+    path: str,
+    workers: int | None = None,
+    on_result: callable = None,
+) -> tuple[int, int]:
+    # Returns the number of cells run and the number found in the cache
+    store = ResultStore(path)
+    try:
+        pending, cached = get_pending_cells(grid, store.get_keys())
+        if pending:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                futures = {
+                    executor.submit(run_cell, key, params): key for key, params in pending
+                }
+                # Stored as they finish rather than in grid order, so one slow cell holds nothing else up
+                for future in as_completed(futures):
+                    try:
+                        key, params, summary = future.result()
+                    except Exception as error:
+                        # Left out of the table, so the next run of the sweep tries the cell again
+                        print(f"Cell {futures[future]} failed: {error!r}")
+                        continue
+                    store.add(key, params, summary)
+                    if on_result is not None:
+                        on_result(key, params, summary)
+        return len(pending), cached
+    finally:
+        store.close()
@@ -0,0 +1,235 @@
+import random
+
+from django.test import SimpleTestCase
+
+from sim.auctions import (
+    ContinuousDoubleAuction,
+    DutchAuction,
+    EnglishAuction,
+    FrequentBatchAuction,
+    MultiUnitSealedBidAuction,
+    OrderType,
+)
+from sim.clocks import VirtualClock
+
+
+class PriceRangeTests(SimpleTestCase):
+    def setUp(self):
+        self.sim = ContinuousDoubleAuction(["buyer", "seller"], (random.uniform, 100, 1000))
+
+    def test_prices_above_the_limit_range_rest(self):
+        # A seller whose cost is near the top of the range may still ask above it
+        report = self.sim.ask(1, 1500, OrderType.limit, "seller")
+        self.assertTrue(report.rested)
+        self.assertEqual(self.sim.get_book_snapshot()["asks"], [[1, 1500]])
+
+    def test_negative_prices_are_rejected(self):
+        self.assertIsNone(self.sim.bid(1, -1, OrderType.limit, "buyer"))
+        report = self.sim.bid(1, 500, OrderType.limit, "buyer")
+        self.assertIsNone(self.sim.amend(report.order_id, "buyer", price=-1))
+        self.assertEqual(self.sim.orders[report.order_id].price, 500)
+
+    def test_market_order_still_trades(self):
+        self.sim.ask(1, 1000, OrderType.limit, "seller")
+        report = self.sim.bid(1, 10**12, OrderType.market, "buyer")
+        self.assertEqual(report.fills, [["buyer", "seller", 1, 1000]])
+
+
+class OrderTypeTests(SimpleTestCase):
+    def setUp(self):
+        self.sim = ContinuousDoubleAuction(["buyer", "seller"], (random.uniform, 100, 1000))
+        self.sim.ask(2, 500, OrderType.limit, "seller")
+        self.sim.ask(3, 510, OrderType.limit, "seller")
+
+    def test_unfilled_quantity_is_discarded(self):
+        for order_type in (OrderType.immediate_or_cancel, OrderType.fill_and_kill):
+            with self.subTest(order_type=order_type):
+                self.setUp()
+                report = self.sim.bid(4, 500, order_type, "buyer")
+                self.assertEqual(report.fills, [["buyer", "seller", 2, 500]])
+                self.assertEqual(report.residual, 2)
+                self.assertFalse(report.rested)
+                self.assertNotIn(report.order_id, self.sim.orders)
+                self.assertEqual(self.sim.get_book_snapshot()["bids"], [])
+                self.assertEqual(self.sim.get_book_snapshot()["asks"], [[3, 510]])
+
+    def test_post_only_rejected_when_it_would_cross(self):
+        self.assertIsNone(self.sim.bid(1, 500, OrderType.post_only, "buyer"))
+        self.assertEqual(self.sim.get_book_snapshot()["asks"], [[2, 500], [3, 510]])
+        self.assertEqual(len(self.sim.bid_history), 0)
+
+        report = self.sim.bid(1, 499, OrderType.post_only, "buyer")
+        self.assertTrue(report.rested)
+        self.assertEqual(report.fills, [])
+
+
+class AmendTests(SimpleTestCase):
+    def setUp(self):
+        self.sim = ContinuousDoubleAuction(["first", "second", "buyer"], (random.uniform, 100, 1000))
+        self.first = self.sim.ask(2, 500, OrderType.limit, "first").order_id
+        self.second = self.sim.ask(2, 500, OrderType.limit, "second").order_id
+
+    def get_sellers(self, quantity: int) -> list[str]:
+        return [fill[1] for fill in self.sim.bid(quantity, 500, OrderType.limit, "buyer").fills]
+
+    def test_reducing_quantity_keeps_priority(self):
+        self.assertTrue(self.sim.amend(self.first, "first", quantity=1).rested)
+        self.assertEqual(self.get_sellers(1), ["first"])
+
+    def test_price_change_loses_priority(self):
+        self.sim.amend(self.first, "first", price=501)
+        self.sim.amend(self.first, "first", price=500)
+        self.assertEqual(self.get_sellers(2), ["second"])
+        self.assertEqual(self.sim.get_book_snapshot()["asks"], [[2, 500]])
+        self.assertEqual(self.sim.orders[self.first].trader_id, "first")
+
+    def test_amend_into_the_book_trades(self):
+        self.sim.bid(1, 490, OrderType.limit, "buyer")
+        report = self.sim.amend(self.second, "second", price=490)
+        self.assertEqual(report.fills, [["buyer", "second", 1, 490]])
+        self.assertTrue(report.rested)
+
+
+class ProxyBidTests(SimpleTestCase):
+    def setUp(self):
+        self.sim = EnglishAuction(["leader", "challenger"], (random.uniform, 100, 1000), increment=1)
+
+    def get_bids(self) -> list[tuple[str, int]]:
+        return [(username, price) for username, price, _, _ in self.sim.bid_history.rows()]
+
+    def test_leaders_proxy_outbid_by_another_proxy(self):
+        self.assertTrue(self.sim.proxy_bid("leader", 50))
+        self.assertEqual(self.get_bids(), [("leader", 1)])
+
+        self.assertTrue(self.sim.proxy_bid("challenger", 100))
+        # The leader's proxy bids its maximum before the challenger's answers it
+        self.assertEqual(self.get_bids(), [("leader", 1), ("leader", 50), ("challenger", 51)])
+        self.assertEqual(self.sim.auction_leader.username, "challenger")
+        self.assertEqual(self.sim.auction_price, 51)
+
+    def test_manual_leader_outbid_by_proxy(self):
+        self.assertTrue(self.sim.bid("leader", 20))
+        self.assertTrue(self.sim.proxy_bid("challenger", 100))
+        self.assertEqual(self.get_bids(), [("leader", 20), ("challenger", 21)])
+
+
+class DutchClockTests(SimpleTestCase):
+    def setUp(self):
+        self.clock = VirtualClock(1000.0)
+        self.sim = DutchAuction(["seller", "first", "second"], (random.uniform, 100, 1000), clock=self.clock)
+        self.sim.auctioneer = "seller"
+        self.assertTrue(self.sim.configure_clock(30, 2, floor=100))
+        self.assertTrue(self.sim.start_clock("seller", 200))
+
+    def run_clock(self, ticks: int) -> list[int]:
+        prices = []
+        for _ in range(ticks):
+            self.clock.advance(self.sim.clock_interval)
+            if not self.sim.tick_clock():
+                break
+            prices.append(self.sim.auction_price)
+        return prices
+
+    def test_offer_descends_and_stops_at_the_floor(self):
+        self.assertEqual(self.run_clock(10), [170, 140, 110, 100])
+        self.assertFalse(self.sim.clock_running)
+        self.assertEqual(self.sim.auction_price, 100)
+        self.assertEqual(
+            [(price, timestamp) for _, price, _, _, timestamp in self.sim.bid_history.rows()],
+            [(200, 1000.0), (170, 1002.0), (140, 1004.0), (110, 1006.0), (100, 1008.0)],
+        )
+
+    def test_first_taker_wins(self):
+        self.assertEqual(self.run_clock(2), [170, 140])
+        first_money = self.sim.users["first"].money
+
+        self.assertTrue(self.sim.bid("first"))
+        self.assertFalse(self.sim.bid("second"))
+        self.assertEqual(self.run_clock(1), [])
+
+        self.assertEqual(self.sim.users["first"].money, first_money - 140)
+        self.assertEqual(self.sim.bid_history[-1][:2], ("first", 140))
+        self.assertTrue(self.sim.bid_history[-1][3])
+
+
+class MultiUnitSealedBidTests(SimpleTestCase):
+    def create_auction(self, bids: list[tuple[str, int]], units: int, pricing: str) -> MultiUnitSealedBidAuction:
+        usernames = [username for username, _ in bids]
+        sim = MultiUnitSealedBidAuction(
+            ["seller", *usernames], (random.uniform, 100, 1000), units=units, pricing=pricing, clock=VirtualClock()
+        )
+        sim.auctioneer = "seller"
+        for username, amount in bids:
+            self.assertTrue(sim.bid(username, amount))
+        self.assertTrue(sim.auction_over)
+        return sim
+
+    def get_winners(self, sim: MultiUnitSealedBidAuction) -> list[tuple[int, str]]:
+        return [(price, winner.username) for price, winner in sim.get_winners()]
+
+    def test_tied_bids_set_the_uniform_price(self):
+        # The earlier of two equal bids wins the last unit, the later one is the highest losing bid
+        sim = self.create_auction([("a", 500), ("b", 400), ("c", 400), ("d", 300)], 2, "uniform")
+        self.assertEqual(self.get_winners(sim), [(400, "a"), (400, "b")])
+
+    def test_tied_bids_pay_their_own_bid(self):
+        sim = self.create_auction([("a", 500), ("b", 400), ("c", 400), ("d", 300)], 2, "discriminatory")
+        self.assertEqual(self.get_winners(sim), [(500, "a"), (400, "b")])
+
+    def test_more_units_than_bidders(self):
+        bids = [("a", 300), ("b", 500)]
+        # Without a losing bid the uniform price falls back to the reserve
+        self.assertEqual(self.get_winners(self.create_auction(bids, 5, "uniform")), [(0, "b"), (0, "a")])
+        self.assertEqual(
+            self.get_winners(self.create_auction(bids, 5, "discriminatory")), [(500, "b"), (300, "a")]
+        )
+
+
+class FrequentBatchAuctionTests(SimpleTestCase):
+    def create_auction(self, allocation: str = "pro_rata") -> FrequentBatchAuction:
+        return FrequentBatchAuction(
+            ["b1", "b2", "s1", "s2"], (random.uniform, 100, 1000), allocation=allocation, clock=VirtualClock()
+        )
+
+    def test_batch_clears_at_one_uniform_price(self):
+        sim = self.create_auction()
+        sim.bid(5, 510, OrderType.limit, "b1")
+        sim.bid(5, 500, OrderType.limit, "b2")
+        sim.ask(4, 490, OrderType.limit, "s1")
+        sim.ask(4, 505, OrderType.limit, "s2")
+        # Crossing orders only rest until the batch clears
+        self.assertEqual(len(sim.bid_history), 0)
+
+        # Volume peaks at 5 from 505 to 510 with the same imbalance throughout, so the middle of that range is taken
+        self.assertEqual(sim.clear(), {"batch": 1, "price": 508, "volume": 5})
+        self.assertEqual(
+            [row[:4] for row in sim.bid_history.rows()], [("b1", "s1", 4, 508), ("b1", "s2", 1, 508)]
+        )
+        snapshot = sim.get_book_snapshot()
+        self.assertEqual((snapshot["bids"], snapshot["asks"]), ([[5, 500]], [[3, 505]]))
+
+    def test_orders_tied_at_the_marginal_price_share_by_rule(self):
+        for allocation, expected in (
+            ("pro_rata", [("b1", "s1", 1), ("b2", "s1", 1)]),
+            ("time", [("b1", "s1", 2)]),
+        ):
+            with self.subTest(allocation=allocation):
+                sim = self.create_auction(allocation)
+                sim.bid(2, 500, OrderType.limit, "b1")
+                sim.bid(2, 500, OrderType.limit, "b2")
+                sim.ask(2, 500, OrderType.limit, "s1")
+
+                self.assertEqual(sim.clear(), {"batch": 1, "price": 500, "volume": 2})
+                self.assertEqual([row[:3] for row in sim.bid_history.rows()], expected)
+                self.assertEqual(sim.get_book_snapshot()["asks"], [])
+
+    def test_book_that_does_not_cross_is_left_alone(self):
+        sim = self.create_auction()
+        sim.bid(1, 490, OrderType.limit, "b1")
+        sim.ask(1, 500, OrderType.limit, "s1")
+
+        self.assertIsNone(sim.clear())
+        self.assertEqual(sim.batch_number, 1)
+        self.assertEqual(len(sim.bid_history), 0)
+        snapshot = sim.get_book_snapshot()
+        self.assertEqual((snapshot["bids"], snapshot["asks"]), ([[1, 490]], [[1, 500]]))
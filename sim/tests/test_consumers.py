@@ -0,0 +1,323 @@
+import asyncio
+import json
+import os
+import tempfile
+from pathlib import Path
+from unittest import mock, skipIf
+
+from channels.layers import InMemoryChannelLayer
+from channels.testing import WebsocketCommunicator
+from django.conf import settings
+from django.test import SimpleTestCase
+
+from dissdjango.asgi import application
+from sim import journal, websocket_consumers
+from sim.encoding import MSGPACK_SUBPROTOCOL, msgpack
+from sim.journal import RoomJournal
+from sim.replay import Session
+
+ORIGIN = [(b"origin", f"https://{settings.ALLOWED_HOSTS[0]}".encode())]
+
+
+async def join_room(room_type: str, room_id: str, username: str, window_search: str = "") -> WebsocketCommunicator:
+    communicator = WebsocketCommunicator(application, f"/ws/{room_type}/{room_id}/", headers=ORIGIN)
+    connected, _ = await communicator.connect()
+    assert connected
+    message = {"register_user": True}
+    if window_search:
+        message["window_search"] = window_search
+    await communicator.send_to(text_data=json.dumps({"username": username, "message": message}))
+    # Registering is answered by a broadcast carrying the user's limit price
+    while True:
+        frame = json.loads(await communicator.receive_from())
+        if frame["username"] == username and "limit_price" in frame["message"]:
+            return communicator
+
+
+class ConsumerTestCase(SimpleTestCase):
+    # Journals go to a directory of the test's own so no real room is touched
+    def setUp(self):
+        self.journal_dir = tempfile.TemporaryDirectory()
+        patcher = mock.patch.object(websocket_consumers, "JOURNAL_DIR", self.journal_dir.name)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(self.journal_dir.cleanup)
+
+
+class DisconnectTests(ConsumerTestCase):
+    async def test_room_emptied_at_once_is_torn_down_once(self):
+        room_id = "race"
+        communicators = [await join_room("CDA", room_id, room_id, "?time=600")]
+        for index in range(5):
+            communicators.append(await join_room("CDA", room_id, f"user{index}"))
+
+        # Every consumer finds no connections left once its own disconnect has been applied
+        await asyncio.gather(*(communicator.disconnect() for communicator in communicators))
+
+        self.assertNotIn(room_id, websocket_consumers.auction_instances)
+        self.assertNotIn(room_id, websocket_consumers.room_actors)
+        self.assertNotIn(room_id, websocket_consumers.room_broadcasters)
+        self.assertEqual(websocket_consumers.connection_counters[room_id], 0)
+
+
+@skipIf(msgpack is None, "msgpack is not installed")
+class WireFormatTests(ConsumerTestCase):
+    async def test_binary_consumer_is_counted_before_joining_the_group(self):
+        # Anything broadcast once the consumer is in the group has to be encoded in its format
+        binary_consumers = []
+        group_add = InMemoryChannelLayer.group_add
+
+        async def recording_group_add(layer, group, channel):
+            binary_consumers.append(websocket_consumers.room_broadcasters[group].binary_consumers)
+            await group_add(layer, group, channel)
+
+        room_id = "formats"
+        with mock.patch.object(InMemoryChannelLayer, "group_add", recording_group_add):
+            admin = await join_room("CDA", room_id, room_id, "?time=600")
+            communicator = WebsocketCommunicator(
+                application, f"/ws/CDA/{room_id}/", headers=ORIGIN, subprotocols=[MSGPACK_SUBPROTOCOL]
+            )
+            connected, subprotocol = await communicator.connect()
+
+        self.assertTrue(connected)
+        self.assertEqual(subprotocol, MSGPACK_SUBPROTOCOL)
+        self.assertEqual(binary_consumers, [0, 1])
+
+        await communicator.disconnect()
+        await admin.disconnect()
+
+    async def test_bytes_frames_are_ignored_unless_msgpack_was_negotiated(self):
+        room_id = "frames"
+        admin = await join_room("CDA", room_id, room_id, "?time=600")
+        frame = msgpack.packb({"username": "trader", "message": {"register_user": True}}, use_bin_type=True)
+
+        text = WebsocketCommunicator(application, f"/ws/CDA/{room_id}/", headers=ORIGIN)
+        await text.connect()
+        await text.send_to(bytes_data=frame)
+        self.assertTrue(await text.receive_nothing())
+        self.assertNotIn("trader", websocket_consumers.auction_instances[room_id].users)
+
+        binary = WebsocketCommunicator(
+            application, f"/ws/CDA/{room_id}/", headers=ORIGIN, subprotocols=[MSGPACK_SUBPROTOCOL]
+        )
+        await binary.connect()
+        await binary.send_to(bytes_data=frame)
+        reply = msgpack.unpackb(await binary.receive_from(), raw=False)
+        self.assertEqual(reply["username"], "trader")
+        self.assertIn("trader", websocket_consumers.auction_instances[room_id].users)
+
+        for communicator in (binary, text, admin):
+            await communicator.disconnect()
+
+    async def test_bytes_values_are_applied_and_journalled_as_text(self):
+        room_id = "bytes"
+        admin = await join_room("CDA", room_id, room_id, "?time=600")
+        binary = WebsocketCommunicator(
+            application, f"/ws/CDA/{room_id}/", headers=ORIGIN, subprotocols=[MSGPACK_SUBPROTOCOL]
+        )
+        await binary.connect()
+
+        async def send(message: dict, expected: str):
+            await binary.send_to(bytes_data=msgpack.packb({"username": b"trader", "message": message}, use_bin_type=True))
+            while expected not in msgpack.unpackb(await binary.receive_from(), raw=False)["message"]:
+                pass
+
+        await send({"register_user": True}, "limit_price")
+        await send({"update_auction": {"method": b"bid", "quantity": 1, "price": b"450"}}, "book_update")
+
+        sim = websocket_consumers.auction_instances[room_id]
+        self.assertEqual(sim.get_book_snapshot()["bids"], [[1, 450]])
+        records, _ = journal.read_records(websocket_consumers.room_journals[room_id].journal_path)
+        self.assertEqual(
+            records[-1]["instructions"], [{"method": "bid", "quantity": 1, "price": "450"}]
+        )
+
+        await binary.disconnect()
+        await admin.disconnect()
+
+
+class UpdateAuctionTests(ConsumerTestCase):
+    async def test_malformed_instructions_do_not_stop_the_batch(self):
+        room_id = "batch"
+        admin = await join_room("CDA", room_id, room_id, "?time=600")
+        trader = await join_room("CDA", room_id, "trader")
+        instructions = [
+            {"method": "bid", "quantity": 1, "price": 400},
+            {"method": "bid", "price": 400},
+            {"method": "cancel"},
+            "bid",
+            {"method": "amend", "order_id": [0], "price": 410},
+            {"method": "ask", "quantity": 2, "price": 600},
+        ]
+        await trader.send_to(
+            text_data=json.dumps({"username": "trader", "message": {"update_auction": instructions}})
+        )
+        while True:
+            frame = json.loads(await trader.receive_from())
+            if "update_results" in frame["message"]:
+                results = frame["message"]["update_results"]
+                break
+
+        self.assertEqual([result["updated"] for result in results], [True, False, False, False, False, True])
+        self.assertEqual(
+            [result.get("error") for result in results],
+            [
+                None,
+                "bid requires quantity",
+                "cancel requires order_id",
+                "Instructions must be objects with a method",
+                "amend requires order_id",
+                None,
+            ],
+        )
+        sim = websocket_consumers.auction_instances[room_id]
+        self.assertEqual(sim.get_book_snapshot()["bids"], [[1, 400]])
+        self.assertEqual(sim.get_book_snapshot()["asks"], [[2, 600]])
+
+        await trader.disconnect()
+        await admin.disconnect()
+
+
+class DistributionTests(ConsumerTestCase):
+    async def test_normal_room_accepts_prices_around_its_mean(self):
+        # limit_max is the standard deviation of a normal room, not a bound on prices
+        room_id = "normal"
+        admin = await join_room(
+            "CDA", room_id, room_id, "?time=600&limit_distribution_function=normal&limit_min=500&limit_max=50"
+        )
+        trader = await join_room("CDA", room_id, "trader")
+        instructions = [
+            {"method": "bid", "quantity": 1, "price": 480},
+            {"method": "ask", "quantity": 1, "price": 620},
+        ]
+        await trader.send_to(
+            text_data=json.dumps({"username": "trader", "message": {"update_auction": instructions}})
+        )
+        while True:
+            frame = json.loads(await trader.receive_from())
+            if "update_results" in frame["message"]:
+                break
+
+        self.assertEqual([result["updated"] for result in frame["message"]["update_results"]], [True, True])
+        sim = websocket_consumers.auction_instances[room_id]
+        self.assertEqual(sim.get_book_snapshot()["bids"], [[1, 480]])
+        self.assertEqual(sim.get_book_snapshot()["asks"], [[1, 620]])
+
+        await trader.disconnect()
+        await admin.disconnect()
+
+
+class JournalFailureTests(ConsumerTestCase):
+    async def test_room_stops_when_a_batch_cannot_be_journalled(self):
+        room_id = "durable"
+        admin = await join_room("CDA", room_id, room_id, "?time=600")
+        trader = await join_room("CDA", room_id, "trader")
+
+        async def send_bid(price: int):
+            instruction = {"method": "bid", "quantity": 1, "price": price}
+            await trader.send_to(
+                text_data=json.dumps({"username": "trader", "message": {"update_auction": instruction}})
+            )
+
+        await send_bid(400)
+        while "book_update" not in json.loads(await trader.receive_from())["message"]:
+            pass
+        with mock.patch.object(RoomJournal, "write", side_effect=OSError("disk full")), mock.patch.object(
+            journal, "COMMIT_RETRY_DELAY", 0
+        ):
+            await send_bid(410)
+            # Everyone in the room is disconnected rather than told of a bid that was never journalled
+            for communicator in (trader, admin):
+                while (await communicator.receive_output())["type"] != "websocket.close":
+                    pass
+
+        await trader.disconnect()
+        await admin.disconnect()
+        self.assertNotIn(room_id, websocket_consumers.room_actors)
+
+        # Reconnecting recovers the room as far as its journal goes
+        admin = await join_room("CDA", room_id, room_id)
+        sim = websocket_consumers.auction_instances[room_id]
+        self.assertEqual(sim.get_book_snapshot()["bids"], [[1, 400]])
+        await admin.disconnect()
+
+
+class ExpiryTests(ConsumerTestCase):
+    def fire_due_timers(self):
+        # Timers already due go in the wheel's next tick, which may be ahead of the clock after an earlier call
+        wheel = websocket_consumers.timer_wheel
+        wheel.advance((max(wheel.current_tick, wheel.to_tick(wheel.clock())) + 1.5) * wheel.tick_duration)
+
+    async def test_empty_room_expires_unless_rejoined(self):
+        room_id = "abandoned"
+        admin = await join_room("CDA", room_id, room_id, "?time=600")
+        with mock.patch.object(websocket_consumers, "ROOM_EXPIRY", 0):
+            await admin.disconnect()
+        self.assertIn(room_id, websocket_consumers.expiry_timers)
+
+        # Rejoining keeps the room, leaving again starts its expiry over
+        admin = await join_room("CDA", room_id, room_id)
+        self.assertNotIn(room_id, websocket_consumers.expiry_timers)
+        self.fire_due_timers()
+        self.assertEqual(journal.get_journalled_rooms(self.journal_dir.name), [room_id])
+
+        with mock.patch.object(websocket_consumers, "ROOM_EXPIRY", 0):
+            await admin.disconnect()
+        self.fire_due_timers()
+        self.assertEqual(journal.get_journalled_rooms(self.journal_dir.name), [])
+        self.assertNotIn(room_id, websocket_consumers.expiry_timers)
+
+    async def test_startup_deletes_stale_rooms_and_recovers_the_rest(self):
+        for room_id in ("stale", "fresh"):
+            admin = await join_room("CDA", room_id, room_id, "?time=600")
+            await admin.disconnect()
+            websocket_consumers.cancel_expiry(room_id)
+        stale = RoomJournal(self.journal_dir.name, "stale")
+        for path in (stale.journal_path, stale.snapshot_path):
+            os.utime(path, (0, 0))
+
+        websocket_consumers.recover_rooms()
+        self.addCleanup(websocket_consumers.cancel_expiry, "fresh")
+        self.addCleanup(websocket_consumers.room_journals.pop("fresh").close)
+        self.addCleanup(websocket_consumers.auction_instances.pop, "fresh")
+
+        self.assertEqual(journal.get_journalled_rooms(self.journal_dir.name), ["fresh"])
+        self.assertNotIn("stale", websocket_consumers.auction_instances)
+        self.assertIn("fresh", websocket_consumers.auction_instances)
+        self.assertIn("fresh", websocket_consumers.expiry_timers)
+
+
+class SessionTests(ConsumerTestCase):
+    async def test_finished_room_replays_from_its_creation(self):
+        session_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(session_dir.cleanup)
+        patcher = mock.patch.object(websocket_consumers, "SESSION_DIR", session_dir.name)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        room_id = "recorded"
+        admin = await join_room(
+            "SPSB", room_id, room_id, "?time=600&units=2&limit_distribution_function=normal&limit_min=500&limit_max=50"
+        )
+        bids = {"a": 300, "b": 500, "c": 400}
+        # Everyone joins first, as the room closes once every bidder in it has bid
+        bidders = {username: await join_room("SPSB", room_id, username) for username in bids}
+        for username, price in bids.items():
+            instruction = {"method": "bid", "price": price}
+            await bidders[username].send_to(
+                text_data=json.dumps({"username": username, "message": {"update_auction": instruction}})
+            )
+        while "auction_end" not in json.loads(await admin.receive_from())["message"]:
+            pass
+        # The last to leave saves the session
+        for communicator in [admin, *bidders.values()]:
+            await communicator.disconnect()
+
+        [path] = Path(session_dir.name).glob(f"{room_id}-*.session")
+        session = Session.load(path)
+        self.assertEqual(session.config["room_type"], "SPSB")
+        self.assertIn("seed", session.config["params"])
+        result = session.verify()
+        self.assertEqual(result["failed"], 0)
+        self.assertTrue(result["matches"])
+        self.assertEqual(json.loads(session.expected["prices"])["winners"], [["b", 300], ["c", 300]])
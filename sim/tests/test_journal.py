@@ -0,0 +1,76 @@
+import asyncio
+import random
+import tempfile
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from sim import journal as journal_module
+from sim.auctions import ContinuousDoubleAuction, OrderType
+from sim.journal import RoomJournal, read_records, restore_auction
+
+
+class RoomJournalTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        patcher = mock.patch.object(journal_module, "COMMIT_RETRY_DELAY", 0)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.sim = ContinuousDoubleAuction(["buyer", "seller"], (random.uniform, 100, 1000))
+        self.journal = RoomJournal(directory.name, "room")
+        self.journal.start(self.sim)
+        self.addCleanup(self.journal.close)
+        asyncio.run(self.journal.commit())
+
+    def append_bid(self, price: int):
+        self.journal.append(
+            "update", self.sim.clock(), user="buyer", instructions=[{"method": "bid", "quantity": 1, "price": price}]
+        )
+        self.sim.bid(1, price, OrderType.limit, "buyer")
+
+    def get_journalled_prices(self) -> list[int]:
+        records, _ = read_records(self.journal.journal_path)
+        return [record["instructions"][0]["price"] for record in records]
+
+    def test_failed_write_is_retried_without_repeating_records(self):
+        self.append_bid(400)
+        fsync = journal_module.os.fsync
+        failures = iter([OSError("disk unavailable")])
+
+        def flaky_fsync(fileno):
+            error = next(failures, None)
+            if error is not None:
+                raise error
+            fsync(fileno)
+
+        with mock.patch.object(journal_module.os, "fsync", flaky_fsync):
+            asyncio.run(self.journal.commit())
+
+        self.assertEqual(self.journal.pending, [])
+        self.assertEqual(self.get_journalled_prices(), [400])
+
+    def test_records_stay_pending_until_written(self):
+        self.append_bid(400)
+        with mock.patch.object(journal_module.os, "fsync", side_effect=OSError("disk full")):
+            with self.assertRaises(OSError):
+                asyncio.run(self.journal.commit())
+
+        self.assertEqual(len(self.journal.pending), 1)
+        self.assertEqual(self.get_journalled_prices(), [])
+
+        asyncio.run(self.journal.commit())
+        self.assertEqual(self.journal.pending, [])
+        self.assertEqual(self.get_journalled_prices(), [400])
+
+    def test_snapshot_restores_the_book(self):
+        for price in (400, 410, 410):
+            self.append_bid(price)
+        self.journal.snapshot_due = True
+        asyncio.run(self.journal.commit())
+
+        sim, sequence = restore_auction(self.journal.snapshot_path.read_bytes())
+        self.assertEqual(sequence, 3)
+        self.assertEqual(sim.get_book_snapshot(), self.sim.get_book_snapshot())
+        self.assertEqual(self.get_journalled_prices(), [])
@@ -0,0 +1,50 @@
+import asyncio
+
+from django.test import SimpleTestCase
+
+from sim.rooms import RoomActor, RoomBroadcaster
+
+
+class FailingChannelLayer:
+    # Fails the first sends, then lets everything through
+    failures: int
+    sent: list[dict]
+
+    def __init__(self, failures: int):
+        self.failures = failures
+        self.sent = []
+
+    async def group_send(self, group: str, message: dict):
+        if self.failures > 0:
+            self.failures -= 1
+            raise RuntimeError("channel layer unavailable")
+        self.sent.append(message)
+
+
+def broadcast(value: int) -> tuple[dict, str, int]:
+    return {"update_user_count": value}, "admin", value
+
+
+class RoomActorTests(SimpleTestCase):
+    async def test_failed_publish_fails_batch_and_actor_keeps_running(self):
+        channel_layer = FailingChannelLayer(failures=1)
+        broadcaster = RoomBroadcaster("room", channel_layer)
+        broadcaster.add_consumer(False)
+        actor = RoomActor(broadcaster)
+
+        with self.assertRaises(RuntimeError):
+            await asyncio.wait_for(actor.submit(broadcast, 1), 1)
+
+        self.assertEqual(await asyncio.wait_for(actor.submit(broadcast, 2), 1), 2)
+        self.assertEqual(len(channel_layer.sent), 1)
+        await actor.close()
+
+    async def test_stopped_actor_is_restarted(self):
+        actor = RoomActor(RoomBroadcaster("room", FailingChannelLayer(failures=0)))
+        self.assertEqual(await actor.submit(broadcast, 1), 1)
+
+        actor.task.cancel()
+        await asyncio.sleep(0)
+        self.assertIsNone(actor.task)
+        self.assertEqual(await asyncio.wait_for(actor.submit(broadcast, 2), 1), 2)
+        await actor.close()
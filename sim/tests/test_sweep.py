@@ -0,0 +1,23 @@
+import tempfile
+from pathlib import Path
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from sim import sweep
+
+
+class CellKeyTests(SimpleTestCase):
+    def test_key_depends_on_code_version(self):
+        params = sweep.get_cell_params({"room_type": "english", "users": 4, "seed": 1})
+        self.assertEqual(sweep.get_cell_key(params), sweep.get_cell_key(dict(params)))
+        self.assertNotEqual(sweep.get_cell_key(params, "old"), sweep.get_cell_key(params, "new"))
+
+    def test_code_version_follows_module_sources(self):
+        with tempfile.TemporaryDirectory() as directory:
+            module = Path(directory) / "auctions.py"
+            module.write_text("PRICE = 1\n")
+            with mock.patch.object(sweep, "__file__", str(Path(directory) / "sweep.py")):
+                before = sweep.get_code_version()
+                module.write_text("PRICE = 2\n")
+                self.assertNotEqual(sweep.get_code_version(), before)
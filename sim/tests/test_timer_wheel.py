@@ -0,0 +1,34 @@
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from sim.clocks import VirtualClock
+from sim.timer_wheel import TimerWheel
+
+
+class TimerWheelTests(SimpleTestCase):
+    def test_idle_wheel_resyncs_before_scheduling(self):
+        clock = VirtualClock(1_000_000.0)
+        wheel = TimerWheel(clock=clock)
+        fired = []
+
+        # Hours pass with nothing scheduled and nothing turning the wheel
+        clock.advance(6 * 3600)
+        wheel.schedule(clock() + 1, fired.append, "room")
+        self.assertEqual(wheel.current_tick, wheel.to_tick(clock()))
+
+        with mock.patch.object(wheel, "cascade", wraps=wheel.cascade) as cascade:
+            wheel.advance(clock.advance(2))
+        self.assertEqual(fired, ["room"])
+        self.assertLessEqual(cascade.call_count, 2 / wheel.tick_duration)
+
+    def test_pending_timers_still_fire_in_order(self):
+        clock = VirtualClock(1_000_000.0)
+        wheel = TimerWheel(clock=clock)
+        fired = []
+        wheel.schedule(clock() + 5, fired.append, "late")
+        clock.advance(3600)
+        # The wheel is behind but holds a timer, so it must not skip past it
+        wheel.schedule(clock() + 1, fired.append, "early")
+        wheel.advance(clock.advance(2))
+        self.assertEqual(fired, ["late", "early"])
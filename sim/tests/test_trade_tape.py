@@ -0,0 +1,33 @@
+import io
+from contextlib import redirect_stdout
+
+from django.test import SimpleTestCase
+
+from sim.trade_tape import TradeTape
+
+
+class TradeTapeTests(SimpleTestCase):
+    def setUp(self):
+        self.tape = TradeTape(("buyer", str), ("quantity", int), ("price", int), ("timestamp", float))
+
+    def test_invalid_rows_are_dropped_and_columns_stay_aligned(self):
+        self.tape.append("alice", 1, 500, 1.0)
+        invalid_rows = (("bob", 2, 500.5, 2.0), ("bob", 2, 2**70, 2.0), (None, 2, 500, 2.0), ("bob", 2, 500, "now"), ("bob", 2))
+        for row in invalid_rows:
+            self.tape.append(*row)
+        self.tape.append("carol", 3, 501, 3.0)
+
+        output = io.StringIO()
+        with redirect_stdout(output):
+            self.assertEqual(len(self.tape), 2)
+        self.assertEqual(self.tape.rows(), [("alice", 1, 500, 1.0), ("carol", 3, 501, 3.0)])
+        self.assertEqual(len(output.getvalue().splitlines()), len(invalid_rows))
+
+    def test_rows_survive_flushes(self):
+        rows = [(f"user{index % 7}", index, 500 + index % 3, float(index)) for index in range(2 * TradeTape.buffer_size + 5)]
+        for row in rows:
+            self.tape.append(*row)
+
+        self.assertEqual(len(self.tape), len(rows))
+        self.assertEqual(self.tape[-1], rows[-1])
+        self.assertEqual(self.tape.rows(), rows)
@@ -0,0 +1,183 @@
+import asyncio
+
+from .clocks import wall_clock
+
+
+class Timer:
+    # A scheduled callback, kept so its owner can cancel or move it later
+    __slots__ = ("deadline", "tick", "callback", "args", "slot")
+
+    deadline: float
+    tick: int
+    callback: callable
+    args: tuple
+    slot: dict | None  # The wheel slot currently holding the timer, None once fired or cancelled
+
+    def __init__(self, deadline: float, callback: callable, args: tuple):
+        self.deadline = deadline
+        self.tick = 0
+        self.callback = callback
+        self.args = args
+        self.slot = None
+
+    @property
+    def active(self) -> bool:
+        return self.slot is not None
+
+    def __repr__(self):
+        return f"Timer(deadline={self.deadline}, active={self.active})"
+
+
+class TimerWheel:
+    # Hierarchical timing wheel shared by every room. Level 0 has one slot per tick and each higher level has slots
+    # covering a whole revolution of the level below, timers cascade down a level as their slot comes round.
+    # Scheduling, moving and cancelling a timer are O(1) however many rooms are waiting on a deadline.
+    tick_duration: float  # Seconds per level 0 slot
+    slots_per_level: int
+    levels: list[list[dict[Timer, None]]]
+    current_tick: int
+    task: asyncio.Task | None
+    timer_count: int
+    clock: callable  # The time deadlines are measured against while the wheel turns itself
+
+    def __init__(
+        self,
+        tick_duration: float = 0.1,
+        slots_per_level: int = 64,
+        level_count: int = 4,  # 64 ** 4 ticks of 0.1s is about 194 days before timers overflow into the top level
+        start: float | None = None,
+        clock: callable = None,
+    ):
+        self.clock = wall_clock if clock is None else clock
+        self.tick_duration = tick_duration
+        self.slots_per_level = slots_per_level
+        self.levels = [
+            [{} for _ in range(slots_per_level)] for _ in range(level_count)
+        ]
+        self.current_tick = self.to_tick(self.clock() if start is None else start)
+        self.task = None
+        self.timer_count = 0
+
+    def to_tick(self, timestamp: float) -> int:
+        return int(timestamp // self.tick_duration)
+
+    def schedule(self, deadline: float, callback: callable, *args) -> Timer:
+        # Calls callback(*args) from the first tick at or after the unix timestamp deadline
+        timer = Timer(deadline, callback, args)
+        self.insert(timer)
+        self.timer_count += 1
+        self.start()
+        return timer
+
+    def reschedule(self, timer: Timer, deadline: float) -> Timer:
+        # Moves a pending timer, or re-arms one that has already fired or been cancelled
+        if timer.active:
+            del timer.slot[timer]
+            self.timer_count -= 1
+        timer.deadline = deadline
+        self.insert(timer)
+        self.timer_count += 1
+        self.start()
+        return timer
+
+    def cancel(self, timer: Timer):
+        if timer.active:
+            del timer.slot[timer]
+            timer.slot = None
+            self.timer_count -= 1
+
+    def insert(self, timer: Timer):
+        if self.timer_count == 0:
+            # An empty wheel has nothing to fire on the way, so after an idle spell it jumps straight to now rather
+            # than leave the next advance to walk every tick since it last turned
+            self.current_tick = max(self.current_tick, self.to_tick(self.clock()))
+
+        # Round up so a timer never fires before its deadline, and anything already due goes in the next tick
+        timer.tick = max(-int(-timer.deadline // self.tick_duration), self.current_tick + 1)
+        self.place(timer)
+
+    def place(self, timer: Timer):
+        # Puts a timer in the lowest level whose revolution reaches its tick
+        remaining = max(timer.tick - self.current_tick, 0)
+
+        span = 1
+        for level in self.levels[:-1]:
+            if remaining < span * self.slots_per_level:
+                break
+            span *= self.slots_per_level
+        else:
+            level = self.levels[-1]
+            # Deadlines beyond the last level wait in its furthest slot and are re-inserted as it comes round
+            remaining = min(remaining, span * (self.slots_per_level - 1))
+
+        timer.slot = level[((self.current_tick + remaining) // span) % self.slots_per_level]
+        timer.slot[timer] = None
+
+    def advance(self, now: float) -> int:
+        # Moves the wheel on to the unix timestamp now, firing every timer that became due on the way
+        fired = 0
+        target_tick = self.to_tick(now)
+        while self.current_tick < target_tick:
+            if self.timer_count == 0:
+                # Nothing is waiting, so there is nothing to cascade or fire in between
+                self.current_tick = target_tick
+                break
+
+            self.current_tick += 1
+            self.cascade()
+
+            slot = self.levels[0][self.current_tick % self.slots_per_level]
+            due = list(slot)
+            slot.clear()
+            for timer in due:
+                timer.slot = None
+                self.timer_count -= 1
+            for timer in due:
+                try:
+                    timer.callback(*timer.args)
+                except Exception as error:
+                    # One room's failing callback must not stop every other room's deadlines
+                    print(f"Timer callback {timer.callback} failed: {error!r}")
+            fired += len(due)
+        return fired
+
+    def cascade(self):
+        # When a level comes back round to slot 0, the matching slot of the level above is spread over the levels below
+        span = 1
+        for level_index in range(1, len(self.levels)):
+            span *= self.slots_per_level
+            if self.current_tick % span != 0:
+                break
+
+            slot = self.levels[level_index][(self.current_tick // span) % self.slots_per_level]
+            timers = list(slot)
+            slot.clear()
+            for timer in timers:
+                self.place(timer)
+
+    def start(self):
+        # The wheel turns on a single task for the whole server, started by the first timer scheduled
+        if self.task is None:
+            try:
+                self.task = asyncio.get_running_loop().create_task(self.run())
+            except RuntimeError:  # No event loop, e.g. in a script, so advance() has to be called by hand
+                pass
+
+    async def run(self):
+        try:
+            while True:
+                await asyncio.sleep(self.tick_duration)
+                self.advance(self.clock())
+        finally:
+            self.task = None
+
+    def close(self):
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+
+    def __len__(self) -> int:
+        return self.timer_count
+
+    def __repr__(self):
+        return f"TimerWheel(timers={self.timer_count}, tick={self.current_tick})"
@@ -0,0 +1,45 @@
+import heapq
+
+
+class TopKBids:
+    # The highest bids seen so far, at most capacity of them, in a min-heap whose root is the lowest bid kept.
+    # A new bid only has to beat the root, so each bid costs O(log capacity) however many bids the room receives.
+    capacity: int
+    # (amount, -arrival, username), so among equal amounts the latest bid sits nearest the root and is dropped first
+    heap: list[tuple[int, int, str]]
+    arrivals: int
+
+    def __init__(self, capacity: int):
+        if capacity < 1:
+            raise ValueError("TopKBids needs a capacity of at least 1")
+        self.capacity = capacity
+        self.heap = []
+        self.arrivals = 0
+
+    def push(self, amount: int, username: str) -> bool:
+        # Returns whether the bid is now among the highest kept
+        entry = (amount, -self.arrivals, username)
+        self.arrivals += 1
+
+        if len(self.heap) < self.capacity:
+            heapq.heappush(self.heap, entry)
+            return True
+        if entry > self.heap[0]:
+            heapq.heapreplace(self.heap, entry)
+            return True
+        return False
+
+    def ranked(self) -> list[tuple[int, str]]:
+        # Highest bid first, earlier bids first among equal amounts
+        return [
+            (amount, username) for amount, _, username in sorted(self.heap, reverse=True)
+        ]
+
+    def lowest(self) -> int | None:
+        return self.heap[0][0] if self.heap else None
+
+    def __len__(self) -> int:
+        return len(self.heap)
+
+    def __repr__(self):
+        return f"TopKBids({self.ranked()})"
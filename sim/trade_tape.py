@@ -0,0 +1,127 @@
+import sys
+from array import array
+
+
+class TradeTape:
+    # Append-only, column oriented bid history shared by every auction type.
+    # Each column is a typed growable array and strings (trader ids) are interned and stored as integer symbols.
+    # Appending only queues the row as a tuple, rows are converted to the columns' types in bulk when flushed.
+    typecodes: dict[type, str] = {str: "q", int: "q", float: "d", bool: "b"}
+    buffer_size: int = 1024
+
+    header: tuple[str, ...]
+    column_types: tuple[type, ...]
+    columns: tuple[array, ...]
+    pending: list[tuple]  # Rows appended since the last flush, as they were given
+    symbols: list[str]
+    symbol_ids: dict[str, int]
+
+    def __init__(self, *columns: tuple[str, type]):
+        self.header = tuple(name for name, _ in columns)
+        self.column_types = tuple(column_type for _, column_type in columns)
+        self.columns = tuple(
+            array(self.typecodes[column_type]) for column_type in self.column_types
+        )
+        self.pending = []
+        self.symbols = []
+        self.symbol_ids = {}
+
+    def intern(self, value: str) -> int:
+        symbol_id = self.symbol_ids.get(value)
+        if symbol_id is None:
+            symbol_id = len(self.symbols)
+            self.symbols.append(sys.intern(value))
+            self.symbol_ids[self.symbols[-1]] = symbol_id
+        return symbol_id
+
+    def append(self, *values):
+        pending = self.pending
+        pending.append(values)
+        if len(pending) >= self.buffer_size:
+            self.flush()
+
+    def stage(self, rows: list[tuple]) -> list[array]:
+        # Converts rows into one array per column, raising before any column is touched if a value does not fit
+        if set(map(len, rows)) - {len(self.columns)}:
+            raise ValueError(f"Expected rows of {len(self.columns)} values")
+
+        staged = []
+        for column_type, values in zip(self.column_types, zip(*rows) if rows else [()] * len(self.columns)):
+            if column_type is str:
+                values = list(map(self.intern, values))
+            staged.append(array(self.typecodes[column_type], values))
+        return staged
+
+    def flush(self):
+        if not self.pending:
+            return
+
+        rows, self.pending = self.pending, []
+        try:
+            staged = self.stage(rows)
+        except (TypeError, ValueError, OverflowError):
+            # Staged again one row at a time so only the rows that do not fit are dropped, keeping the columns aligned
+            valid_rows = []
+            for row in rows:
+                try:
+                    self.stage([row])
+                except (TypeError, ValueError, OverflowError) as error:
+                    print(f"Dropped trade tape row {row!r}: {error}")
+                else:
+                    valid_rows.append(row)
+            staged = self.stage(valid_rows)
+
+        for column, values in zip(self.columns, staged):
+            column.extend(values)
+
+    def decode(self, column_index: int, values: array) -> list:
+        column_type = self.column_types[column_index]
+        if column_type is str:
+            symbols = self.symbols
+            return [symbols[value] for value in values]
+        elif column_type is bool:
+            return [bool(value) for value in values]
+        return values.tolist()
+
+    def column(self, name: str, start: int = 0, stop: int | None = None) -> list:
+        self.flush()
+        column_index = self.header.index(name)
+        return self.decode(column_index, self.columns[column_index][start:stop])
+
+    def rows(self, start: int = 0, stop: int | None = None) -> list[tuple]:
+        # Rows by sequence number range, each column is sliced as a whole before being zipped back together
+        self.flush()
+        return list(
+            zip(
+                *(
+                    self.decode(column_index, column[start:stop])
+                    for column_index, column in enumerate(self.columns)
+                )
+            )
+        )
+
+    def as_rows(self, include_header: bool = True) -> list[tuple]:
+        # The layout bid_history used to have, a header row followed by every row
+        return [self.header, *self.rows()] if include_header else self.rows()
+
+    def __getitem__(self, index: int | slice) -> tuple | list[tuple]:
+        if isinstance(index, slice):
+            if index.step not in (None, 1):
+                raise ValueError("TradeTape slices do not support a step")
+            return self.rows(index.start or 0, index.stop)
+
+        rows = self.rows(index, index + 1 or None)
+        if not rows:
+            raise IndexError("TradeTape index out of range")
+        return rows[0]
+
+    def __len__(self) -> int:
+        # Flushed first, as a row that turns out not to fit is dropped rather than counted
+        self.flush()
+        return len(self.columns[0]) if self.columns else 0
+
+    def __iter__(self):
+        return iter(self.rows())
+
+    def __repr__(self):
+        return f"TradeTape({', '.join(self.header)}; {len(self)} rows)"
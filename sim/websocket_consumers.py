@@ -1,15 +1,23 @@
-import json
-import random
 import asyncio
 import sys
 from collections import defaultdict
 
-import numpy as np
-
 from channels.generic.websocket import AsyncWebsocketConsumer
+from django.conf import settings
 
 from .auctions import *
-from .doubly_linked_list import OrderType
+from .commands import apply_instruction, create_room
+from .encoding import (
+    MSGPACK_SUBPROTOCOL,
+    decode_frame,
+    encode_message,
+    encode_message_binary,
+    msgpack,
+)
+from .journal import RoomJournal, get_journalled_rooms
+from .replay import save_journal_session
+from .rooms import RoomActor, RoomBroadcaster, RoomStopped
+from .timer_wheel import Timer, TimerWheel
 
 # All auction instances are stored in this global variable and keyed by room ID
 # This is because to serve multiple users an arbitrary number of SimConsumer objects will be created without my control
@@ -17,6 +25,101 @@ auction_instances: dict[str, Auction | None | ContinuousDoubleAuction] = {}
 
 connection_counters: dict[str, int] = defaultdict(int)
 
+# Each room's broadcasts go through one broadcaster, which may merge bursts of updates, keyed by room ID
+room_broadcasters: dict[str, RoomBroadcaster] = {}
+
+# Each room's auction is only ever read or changed by its actor, which applies consumers' commands in order
+room_actors: dict[str, RoomActor] = {}
+
+# Every room's deadline is kept on one wheel, which ends auctions on the server when their time runs out
+timer_wheel = TimerWheel()
+room_timers: dict[str, Timer] = {}
+# The next step of each running Dutch clock, on the same wheel so idle clocks cost nothing between steps
+clock_timers: dict[str, Timer] = {}
+# The next clearing of each frequent batch auction room
+batch_timers: dict[str, Timer] = {}
+
+# Maximum number of bid history rows sent in a single websocket frame
+HISTORY_CHUNK_SIZE = 500
+
+# Each room's accepted commands are journalled so a restarted worker can rebuild its auction, None disables journals
+JOURNAL_DIR = getattr(settings, "SIM_JOURNAL_DIR", None)
+SNAPSHOT_INTERVAL = getattr(settings, "SIM_SNAPSHOT_INTERVAL", 50_000)
+room_journals: dict[str, RoomJournal] = {}
+# Seconds a journalled room may stand empty before its journal is deleted, counted from its last commit
+ROOM_EXPIRY = getattr(settings, "SIM_ROOM_EXPIRY", 3600)
+# Rooms nobody is connected to, each expires unless someone rejoins it first
+expiry_timers: dict[str, Timer] = {}
+# Finished rooms' journals are kept here as sessions for python -m sim.replay, None discards them
+SESSION_DIR = getattr(settings, "SIM_SESSION_DIR", None)
+
+
+def recover_room(room_id: str) -> Auction | None:
+    # Rebuilds a room from its journal, leaving it for its users to reconnect to
+    journal = RoomJournal(JOURNAL_DIR, room_id, SNAPSHOT_INTERVAL)
+    try:
+        sim = journal.recover()
+    except Exception as error:
+        print(f"Room {room_id} could not be recovered: {error!r}")
+        journal.close()
+        return None
+    if sim is None:
+        return None
+
+    auction_instances[room_id] = sim
+    room_journals[room_id] = journal
+    return sim
+
+
+def recover_rooms():
+    # Called once as the worker starts, see SimConfig.ready. Rooms that have stood empty for ROOM_EXPIRY are deleted,
+    # the rest come back as they were and expire in turn unless their users come back to them.
+    if JOURNAL_DIR is None:
+        return
+    for room_id in get_journalled_rooms(JOURNAL_DIR):
+        if room_id in auction_instances:
+            continue
+        journal = RoomJournal(JOURNAL_DIR, room_id, SNAPSHOT_INTERVAL)
+        expires = journal.get_last_write() + ROOM_EXPIRY
+        if expires <= timer_wheel.clock():
+            journal.delete()
+            print(f"Room {room_id} expired while the server was down")
+        elif recover_room(room_id) is not None:
+            schedule_expiry(room_id, expires)
+
+
+def schedule_expiry(room_id: str, expires: float):
+    if room_id in expiry_timers:
+        timer_wheel.reschedule(expiry_timers[room_id], expires)
+    else:
+        expiry_timers[room_id] = timer_wheel.schedule(expires, expire_room, room_id)
+
+
+def cancel_expiry(room_id: str):
+    if room_id in expiry_timers:
+        timer_wheel.cancel(expiry_timers.pop(room_id))
+
+
+def expire_room(room_id: str):
+    # Called by the timer wheel, a room somebody has rejoined in the meantime is left alone
+    expiry_timers.pop(room_id, None)
+    if room_id in room_actors or JOURNAL_DIR is None:
+        return
+
+    auction_instances.pop(room_id, None)
+    journal = room_journals.pop(room_id, None)
+    if journal is None:
+        journal = RoomJournal(JOURNAL_DIR, room_id, SNAPSHOT_INTERVAL)
+    journal.delete()
+    print(f"Room {room_id} expired after standing empty")
+
+
+def is_auction_finished(sim: Auction | None) -> bool:
+    if isinstance(sim, DutchAuction):
+        # Sold once the last offer has been accepted
+        return sim.auction_price is None and len(sim.bid_history) > 0 and sim.bid_history[-1][3]
+    return getattr(sim, "auction_over", False)
+
 
 class SimConsumer(AsyncWebsocketConsumer):
     room_id: str
@@ -24,23 +127,50 @@ class SimConsumer(AsyncWebsocketConsumer):
     connection_counter: int = 0
     query_params: dict = None
     room_type: str
+    username: str | None = None
+    # Whether this client negotiated the MessagePack subprotocol, otherwise frames are JSON text
+    binary: bool = False
 
     async def connect(self):
         self.room_id = self.scope["url_route"]["kwargs"]["room_name"]
         self.room_type = self.scope["path"][4 : self.scope["path"][4:].find("/") + 4]
-
-        if self.room_id not in auction_instances:
-            auction_instances[self.room_id] = None
+        # Nothing from here to the room's actor existing awaits, so the room cannot expire underneath this consumer
+        cancel_expiry(self.room_id)
+
+        if self.room_id not in auction_instances and JOURNAL_DIR is not None:
+            # Everyone left a room whose auction was still running, it carries on from where they left it
+            recover_room(self.room_id)
+
+        if self.room_id not in room_actors:
+            # The first connection to a new room, or to one recovered from its journal
+            auction_instances.setdefault(self.room_id, None)
+            room_broadcasters[self.room_id] = RoomBroadcaster(
+                self.room_id, self.channel_layer
+            )
+            room_actors[self.room_id] = RoomActor(
+                room_broadcasters[self.room_id],
+                journal=room_journals.get(self.room_id),
+            )
+            if auction_instances[self.room_id] is not None:
+                auction_instances[self.room_id].clock = room_actors[self.room_id].clock
         else:
             # A created room should never be none, reject connection if so
             if auction_instances[self.room_id] is None:
                 await self.close()
 
+        # Counted in its wire format before joining the group, so every broadcast it receives is encoded for it
+        self.binary = msgpack is not None and MSGPACK_SUBPROTOCOL in self.scope.get(
+            "subprotocols", []
+        )
+        room_broadcasters[self.room_id].add_consumer(self.binary)
         await self.channel_layer.group_add(
             self.room_id,
             self.channel_name,
         )
-        await self.accept()
+        if self.binary:
+            await self.accept(subprotocol=MSGPACK_SUBPROTOCOL)
+        else:
+            await self.accept()
         connection_counters[self.room_id] += 1
 
     async def disconnect(self, code: int):
@@ -49,38 +179,73 @@ class SimConsumer(AsyncWebsocketConsumer):
             self.channel_name,
         )
         connection_counters[self.room_id] -= 1
+        # The last consumer out is also the last to queue its disconnect, so once the actor has applied it every
+        # other consumer leaving at the same time has been dealt with and the room can be torn down
+        is_last = connection_counters[self.room_id] == 0
+        room_broadcasters[self.room_id].remove_consumer(self.binary)
+
+        try:
+            await room_actors[self.room_id].submit(self.apply_disconnect)
+        except RoomStopped:
+            # The room is recovered from its journal once everyone has left, there is nothing to apply until then
+            pass
+
+        # Nobody joined while the disconnect was applied, and nothing from here to popping the actor awaits
+        if is_last and connection_counters[self.room_id] == 0 and self.room_id in room_actors:
+            sim = auction_instances.pop(self.room_id)
+            journal = room_journals.pop(self.room_id, None)
+            if journal is not None:
+                # A stopped room's auction is ahead of its journal, so only the journal is worth keeping
+                if room_actors[self.room_id].stopped_by is None and is_auction_finished(sim):
+                    if SESSION_DIR is not None:
+                        try:
+                            save_journal_session(journal, SESSION_DIR)
+                        except (OSError, ValueError) as error:
+                            print(f"Room {self.room_id} session could not be saved: {error!r}")
+                    journal.delete()
+                else:
+                    # Kept so the room can be recovered, whether everyone left or the worker is shutting down
+                    journal.close()
+                    schedule_expiry(self.room_id, timer_wheel.clock() + ROOM_EXPIRY)
+            if self.room_id in room_timers:
+                timer_wheel.cancel(room_timers.pop(self.room_id))
+            if self.room_id in clock_timers:
+                timer_wheel.cancel(clock_timers.pop(self.room_id))
+            if self.room_id in batch_timers:
+                timer_wheel.cancel(batch_timers.pop(self.room_id))
+            await room_actors.pop(self.room_id).close()
+            await room_broadcasters.pop(self.room_id).close()
+
+    def apply_disconnect(self) -> tuple[dict, str, None]:
+        res = {"update_user_count": connection_counters[self.room_id]}
+
+        sim = auction_instances.get(self.room_id)
+        if (
+            isinstance(sim, ContinuousDoubleAuction)
+            and sim.cancel_on_disconnect
+            and self.username is not None
+        ):
+            self.record_command(self.room_id, sim, "disconnect", user=self.username)
+            if sim.cancel_all(self.username) > 0:
+                # The leaving user's resting orders are pulled so nobody trades against an absent trader
+                book_update = sim.get_book_update()
+                if book_update is not None:
+                    res["book_update"] = book_update
 
-        await self.channel_layer.group_send(  # Tell everyone a user has disconnected
-            self.room_id,
-            {
-                "type": "send_message",
-                "message": {"update_user_count": connection_counters[self.room_id]},
-                "username": "disco_admin",
-            },
-        )
-
-        if connection_counters[self.room_id] == 0:
-            del auction_instances[self.room_id]
+        return res, "disco_admin", None  # Tell everyone a user has disconnected
 
     async def receive(
         self, text_data: str | None = None, bytes_data: bytes | None = None
     ):
-        room_name = self.scope["url_route"]["kwargs"]["room_name"]
-        sim = auction_instances[room_name]
-
-        # Format {username: ..., message: {...}}
-        parsed_data = json.loads(text_data)
-
-        # By default, most server interactions will not cause a broadcast to connected browsers
-        broadcast_msg = False
+        # Format {username: ..., message: {...}}, as JSON text or MessagePack bytes
+        parsed_data = decode_frame(text_data, bytes_data, self.binary)
+        if parsed_data is None:
+            return
 
-        # Interpret json data from web client
+        # Interpret data from web client
         username = parsed_data["username"]
         message = parsed_data["message"]
 
-        # The final message to be broadcast
-        res = {}
-
         # Room ID should be equal to the username code of the admin user
         # I.e. If username = room id the admin is making changes
 
@@ -95,77 +260,252 @@ class SimConsumer(AsyncWebsocketConsumer):
                 if len(elem) > 0
             }
 
+        # The auction is changed on the room's actor, anything only meant for this user comes back as the reply
+        try:
+            reply = await room_actors[self.room_id].submit(
+                self.apply_message, username, message
+            )
+        except RoomStopped:
+            await self.close()
+            return
+
+        if "book_snapshot" in reply:
+            await self.send_frame({"book_snapshot": reply["book_snapshot"]}, username)
+
+        if "update_results" in reply:
+            await self.send_frame(
+                {"update_results": reply["update_results"]}, username
+            )
+
+        if "download_history" in reply:
+            await self.send_history(
+                auction_instances[self.room_id], username, *reply["download_history"]
+            )
+
+    def apply_message(
+        self, username: str, message: dict
+    ) -> tuple[dict | None, str, dict]:
+        sim = auction_instances[self.room_id]
+
+        # By default, most server interactions will not cause a broadcast to connected browsers
+        broadcast_msg = False
+
+        # The final message to be broadcast
+        res = {}
+        # Anything returned only to the user that sent the message
+        reply = {}
+
         if "register_user" in message:
-            broadcast_msg, sim = await self.register_user(
-                broadcast_msg, res, room_name, sim, username
+            broadcast_msg, sim = self.register_user(
+                broadcast_msg, res, reply, sim, username
             )
 
         if "update_auction" in message:
-            broadcast_msg = await self.try_update_auction(
-                broadcast_msg, message, res, username
+            broadcast_msg = self.try_update_auction(
+                broadcast_msg, message, res, reply, username
             )
 
+        if "book_snapshot" in message and isinstance(sim, ContinuousDoubleAuction):
+            # Clients request a fresh snapshot if they notice a gap in the book update sequence
+            reply["book_snapshot"] = sim.get_book_snapshot()
+
         if "download_history" in message and hasattr(sim, "bid_history"):
-            broadcast_msg = True
-            res["download_history"] = sim.bid_history
+            # Only the requesting user gets the history, nobody else in the room needs it
+            reply["download_history"] = self.get_history_range(
+                sim, message["download_history"]
+            )
 
-        if "end_auction" in message and hasattr(sim, "bidding_finished"):
-            if sim.bidding_finished():
+        if "end_auction" in message and sim is not None:
+            self.record_command(self.room_id, sim, "end")
+            if sim.end_auction():
+                # The timer wheel normally gets here first, this only catches a client that is ahead of it
                 broadcast_msg = True
-
-                # Not all auctions work in this way
-                if hasattr(sim, "auction_leader") and hasattr(sim, "auction_price"):
-                    res["profit_update"] = (
-                        sim.auction_leader.limit_price - sim.auction_price
-                    )
-
-                res["auction_end"] = True
+                res.update(self.get_auction_end(sim))
+
+        if sim is not None:
+            # Bids can move the deadline, so the room's timer follows it
+            self.schedule_deadline(self.room_id, sim)
+            self.schedule_clock(self.room_id, sim)
+            if isinstance(sim, FrequentBatchAuction) and self.room_id not in batch_timers:
+                batch_timers[self.room_id] = timer_wheel.schedule(
+                    timer_wheel.clock() + sim.batch_interval, SimConsumer.on_batch, self.room_id
+                )
 
         if broadcast_msg:
             print(res)
             # Should only be done if message is state-updating
-            await self.channel_layer.group_send(
-                self.room_id,
-                {
-                    "type": "send_message",
-                    "message": res,
-                    "username": username,
-                },
+            return res, username, reply
+        return None, username, reply
+
+    @staticmethod
+    def schedule_deadline(room_id: str, sim: Auction):
+        deadline = sim.get_deadline()
+        if deadline is None:
+            return
+
+        timer = room_timers.get(room_id)
+        if timer is None:
+            room_timers[room_id] = timer_wheel.schedule(
+                deadline, SimConsumer.on_deadline, room_id
             )
+        elif timer.deadline != deadline:
+            timer_wheel.reschedule(timer, deadline)
+
+    @staticmethod
+    def on_deadline(room_id: str):
+        # Called by the timer wheel, the auction itself is only ever changed on the room's actor
+        if room_id in room_actors:
+            room_actors[room_id].post(SimConsumer.apply_deadline, room_id)
+
+    @staticmethod
+    def apply_deadline(room_id: str) -> tuple[dict | None, str, None]:
+        sim = auction_instances.get(room_id)
+        if sim is None:
+            return None, "server", None
+
+        SimConsumer.record_command(room_id, sim, "end")
+        if not sim.end_auction():
+            # A bid may have extended the deadline after the timer fired
+            deadline = sim.get_deadline()
+            if deadline is not None and deadline >= sim.clock() and room_id in room_timers:
+                timer_wheel.reschedule(room_timers[room_id], deadline)
+            return None, "server", None
+
+        return SimConsumer.get_auction_end(sim), "server", None
+
+    @staticmethod
+    def schedule_clock(room_id: str, sim: Auction):
+        # Starts stepping a Dutch clock that has just been started, and drops the step of one that has stopped
+        timer = clock_timers.get(room_id)
+        if not getattr(sim, "clock_running", False):
+            if timer is not None:
+                timer_wheel.cancel(clock_timers.pop(room_id))
+        elif timer is None:
+            clock_timers[room_id] = timer_wheel.schedule(
+                timer_wheel.clock() + sim.clock_interval, SimConsumer.on_clock_tick, room_id
+            )
+        elif not timer.active:
+            timer_wheel.reschedule(timer, timer_wheel.clock() + sim.clock_interval)
+
+    @staticmethod
+    def on_clock_tick(room_id: str):
+        if room_id in room_actors:
+            room_actors[room_id].post(SimConsumer.apply_clock_tick, room_id)
+
+    @staticmethod
+    def apply_clock_tick(room_id: str) -> tuple[dict | None, str, None]:
+        # Runs on the room's actor, so a bid applied before this step has already stopped the clock
+        sim = auction_instances.get(room_id)
+        if sim is None:
+            return None, "server", None
+
+        SimConsumer.record_command(room_id, sim, "tick")
+        if not sim.tick_clock():
+            return None, "server", None
+
+        SimConsumer.schedule_clock(room_id, sim)
+        return {"price_tick": sim.auction_price}, "server", None
+
+    @staticmethod
+    def on_batch(room_id: str):
+        if room_id in room_actors:
+            room_actors[room_id].post(SimConsumer.apply_batch, room_id)
+
+    @staticmethod
+    def apply_batch(room_id: str) -> tuple[dict | None, str, None]:
+        sim = auction_instances.get(room_id)
+        if sim is None or sim.auction_over:
+            return None, "server", None
+
+        # Batches follow each other at a fixed rate, falling behind skips ahead rather than clearing in a burst
+        timer = batch_timers[room_id]
+        timer_wheel.reschedule(
+            timer, max(timer.deadline + sim.batch_interval, timer_wheel.clock())
+        )
+
+        SimConsumer.record_command(room_id, sim, "clear")
+        batch_result = sim.clear()
+        if batch_result is None:
+            return None, "server", None
+        return (
+            {"book_update": sim.get_book_update(), "batch_result": batch_result},
+            "server",
+            None,
+        )
 
-    async def register_user(self, broadcast_msg, res, room_name, sim, username):
+    @staticmethod
+    def record_command(room_id: str, sim: Auction, kind: str, **fields):
+        # Journals a command as it is applied, see apply_command for how each kind is replayed
+        journal = room_journals.get(room_id)
+        if journal is not None:
+            journal.append(kind, sim.clock(), **fields)
+
+    @staticmethod
+    def get_auction_end(sim: Auction) -> dict:
+        # The result of a finished auction, plus the profits it settled
+        res = {"auction_end": {"winner": None, "price": None}}
+        leader = getattr(sim, "auction_leader", None)
+        price = getattr(sim, "auction_price", None)
+
+        if isinstance(sim, MultiUnitSealedBidAuction):
+            winners = sim.get_winners()
+            res["auction_end"]["winners"] = [
+                [winner.username, paid] for paid, winner in winners
+            ]
+            res["profit_update"] = [
+                [winner.profits, winner.username] for _, winner in winners
+            ] + [[sim.users[sim.auctioneer].profits, sim.auctioneer]]
+            if winners:
+                res["auction_end"].update(
+                    winner=winners[0][1].username, price=winners[0][0]
+                )
+        elif isinstance(leader, AuctionUser):
+            res["auction_end"] = {"winner": leader.username, "price": price}
+            res["profit_update"] = [
+                [leader.profits, leader.username],
+                [sim.users[sim.auctioneer].profits, sim.auctioneer],
+            ]
+        return res
+
+    def register_user(self, broadcast_msg, res, reply, sim, username):
         if sim is None and self.query_params is not None:
             # parse initial page arguments to augment auction
-            room_type = self.room_type
-
-            limit_price_distribution = await self.get_limit_distribution()
-
-            await self.set_room_type(limit_price_distribution, room_type)
-
-            await self.set_initial_params_from_query()
-
-            sim = auction_instances[room_name]
-            sim.auctioneer = username
+            sim = create_room(
+                self.room_type, self.query_params, username, room_actors[self.room_id].clock
+            )
+            auction_instances[self.room_id] = sim
+            self.set_broadcast_params_from_query()
             res["set_admin"] = True
         if username not in sim.users:
             sim.add_user(username, sim.limit_price_distribution)
+            if not res.get("set_admin"):
+                # The user's draws are recorded, replaying the join must not draw different ones
+                self.record_command(
+                    self.room_id,
+                    sim,
+                    "join",
+                    user=username,
+                    limit_price=sim.users[username].limit_price,
+                    money=sim.users[username].money,
+                )
+        if res.get("set_admin") and JOURNAL_DIR is not None:
+            # The configured auction is the journal's first snapshot, everything after it is journalled.
+            # Rooms kept as sessions also log how they were created, so a replay can start from nothing.
+            journal = RoomJournal(JOURNAL_DIR, self.room_id, SNAPSHOT_INTERVAL)
+            journal.start(sim, None if SESSION_DIR is None else self.get_room_config(sim, username))
+            room_journals[self.room_id] = journal
+            room_actors[self.room_id].journal = journal
+        self.username = username
         broadcast_msg = True
-        res["countdown_timer"] = int(
-            (sim.timestamp + int(sim.time_difference)) - time()
-        )
-        res["max_time"] = sim.time_difference
+        if sim.get_deadline() is not None:
+            # Dutch auctions have no deadline to count down to
+            res["countdown_timer"] = int(sim.get_deadline() - sim.clock())
+            res["max_time"] = sim.time_difference
         if not isinstance(sim, ContinuousDoubleAuction):
-            if isinstance(sim.auction_price, deque):
-                res["set_price"] = sim.auction_price[-1]
-            else:
-                res["set_price"] = sim.auction_price
+            res["set_price"] = sim.auction_price
         else:
-            bid_values = sim.bids.values()[-5:][::-1]
-            ask_values = sim.asks.values()[:5]
-            res["price_update"] = {
-                "bids": [[bid.quantity, bid.price] for bid in bid_values],
-                "asks": [[ask.quantity, ask.price] for ask in ask_values],
-            }
+            # Only the registering client needs the full book, everyone else keeps up via deltas
+            reply["book_snapshot"] = sim.get_book_snapshot()
 
         res["limit_price"] = sim.users[username].limit_price
         res["update_user_count"] = connection_counters[self.room_id]
@@ -174,38 +514,44 @@ class SimConsumer(AsyncWebsocketConsumer):
         # The set admin is to tell webpages to render differently if the user is the room admin
         return broadcast_msg, sim
 
-    async def try_update_auction(self, broadcast_msg, message, res, username):
+    def try_update_auction(self, broadcast_msg, message, res, reply, username):
         auction_updated = False
+        execution_report = None
         sim = auction_instances[self.room_id]
-        # Instruction should be a tuple (instruction, [args])
-        # Each instruction should return a boolean based on whether the auction has been updated
-        # This can be used to determine whether a message should be broadcast
-        instruction = message["update_auction"]
-        if instruction["method"] == "ask" and hasattr(sim, "ask"):
-            auction_updated = sim.ask(instruction["quantity"], instruction["price"], OrderType.limit, username)
-        elif instruction["method"] == "bid" and hasattr(sim, "bid"):
-            if isinstance(sim, DutchAuction):
-                # Dutch auctions do not require a provided price to bid
-                auction_updated = sim.bid(username)
-            elif isinstance(sim, ContinuousDoubleAuction):
-                # Only supporting limit orders for now, though some of the others are technically supported
-                order_id = sim.bid(
-                    instruction["quantity"],
-                    instruction["price"],
-                    OrderType.limit,
-                    username,
+        # A frame carries either one instruction or a list of them, which are applied in order.
+        # Lists get a result per instruction sent back to the sender, and the room still sees a single broadcast.
+        instructions = message["update_auction"]
+        is_batch = isinstance(instructions, list)
+        if not is_batch:
+            instructions = [instructions]
+
+        self.record_command(
+            self.room_id, sim, "update", user=username, instructions=instructions
+        )
+        results = []
+        for instruction in instructions:
+            result = {"method": None, "updated": False}
+            if isinstance(instruction, dict):
+                result["method"] = instruction.get("method")
+            try:
+                instruction_updated, instruction_report = apply_instruction(
+                    sim, instruction, username
                 )
-                auction_updated = order_id != -1
-            else:
-                auction_updated = sim.bid(username, instruction["price"])
-        elif (
-            instruction["method"] == "update_offer"
-            and username == sim.auctioneer
-            and hasattr(sim, "auctioneer_update_offer")
-        ):
-            auction_updated = sim.auctioneer_update_offer(
-                username, instruction["price"]
-            )
+            except ValueError as error:
+                # A malformed instruction is reported to its sender and the rest of the list still applies
+                result["error"] = str(error)
+                results.append(result)
+                continue
+            auction_updated = auction_updated or instruction_updated
+            result["updated"] = instruction_updated
+            if instruction_report is not None:
+                execution_report = instruction_report
+                result["execution_report"] = instruction_report.as_dict()
+            results.append(result)
+
+        if is_batch:
+            reply["update_results"] = results
+
         # if auction updated, make sure message is broadcast
         # But dont remove previous message broadcast approvals
         broadcast_msg = auction_updated or broadcast_msg
@@ -214,112 +560,109 @@ class SimConsumer(AsyncWebsocketConsumer):
                 # We dont want FPSB or SPSB auctions broadcasting pricing if they are not finished
                 res["price_update"] = True
             else:
-                # Lots of deque checks for SPSB auctions, probably better done with method calls but oh well
-                if isinstance(sim.auction_price, deque):
-                    # Take the second highest price for SPSB
-                    res["price_update"] = sim.auction_price[0]
-                else:
-                    res["price_update"] = sim.auction_price
+                # Sealed bid auctions report the price the top winner pays, e.g. the second highest bid for SPSB
+                res["price_update"] = sim.auction_price
+
+                if isinstance(sim, FirstPriceSealedBidAuction):
+                    # The final bid closed the auction, so the result goes out with it
+                    res.update(self.get_auction_end(sim))
+
+                if isinstance(sim, EnglishAuction) and sim.auction_leader is not None:
+                    # With proxy bidding the leader is not necessarily whoever sent this bid
+                    res["auction_leader"] = sim.auction_leader.username
 
                 if hasattr(sim, "auction_leader"):
-                    if isinstance(sim.auction_leader, AuctionUser):
+                    # Sealed bid results already carry the profits of every winner
+                    if isinstance(sim.auction_leader, AuctionUser) and "profit_update" not in res:
                         res["profit_update"] = [
                             [sim.auction_leader.profits, sim.auction_leader.username],
                             [sim.users[sim.auctioneer].profits, sim.auctioneer],
                         ]
-                    else:
-                        res["profit_update"] = [
-                            [
-                                sim.auction_leader[-1].profits,
-                                sim.auction_leader[-1].username,
-                            ],
-                            [sim.users[sim.auctioneer].profits, sim.auctioneer],
-                        ]
                 else:
                     res["profit_update"] = [
                         [sim.users[username].profits, username],
                         [sim.users[sim.auctioneer].profits, sim.auctioneer],
                     ]
         elif auction_updated and isinstance(sim, ContinuousDoubleAuction):
-            # As insanely inefficient as it is we will broadcast the top 5 values of the changed side each time
-            # This is because building a CDA reconciler in the webpage is a little bit too much work for now
-            # If we ever want to scale we should only broadcast the changed msg and let the webpage reconcile trades
-            bid_values = sim.bids.values()[-5:][::-1]
-            ask_values = sim.asks.values()[:5]
-            res["price_update"] = {
-                "bids": [[bid.quantity, bid.price] for bid in bid_values],
-                "asks": [[ask.quantity, ask.price] for ask in ask_values],
-            }
+            # Only the levels changed by this order are broadcast, the webpage reconciles them into its own book
+            book_update = sim.get_book_update()
+            if book_update is not None:
+                res["book_update"] = book_update
+            if execution_report is not None:
+                res["execution_report"] = execution_report.as_dict()
 
         return broadcast_msg
 
-    async def set_initial_params_from_query(self):
-        sim = auction_instances[self.room_id]
-        if "time" in self.query_params and self.query_params["time"] not in ["", None]:
-            sim.time_difference = self.query_params["time"]
-        if "starting_money" in self.query_params and self.query_params[
-            "starting_money"
+    def set_broadcast_params_from_query(self):
+        if "flush_interval" in self.query_params and self.query_params[
+            "flush_interval"
         ] not in ["", None]:
-            sim.money_range = int(self.query_params["starting_money"])
-        if "starting_bid" in self.query_params and self.query_params[
-            "starting_bid"
-        ] not in ["", None]:
-            sim.auction_price = self.query_params["starting_bid"]
+            # Milliseconds over which room updates are merged into a single broadcast, e.g. 20 to 100
+            room_broadcasters[self.room_id].flush_interval = (
+                max(int(self.query_params["flush_interval"]), 0) / 1000
+            )
 
-    async def get_limit_distribution(self):
-        if (
-            "limit_distribution_function" in self.query_params
-            and "limit_min" in self.query_params
-            and "limit_max" in self.query_params
-        ):
-            self.query_params["limit_min"] = int(self.query_params["limit_min"])
-            self.query_params["limit_max"] = int(self.query_params["limit_max"])
-
-            match self.query_params["limit_distribution_function"]:
-                case "uniform":
-                    limit_price_distribution = (
-                        random.uniform,
-                        self.query_params["limit_min"],
-                        self.query_params["limit_max"],
-                    )
-                case "normal":
-                    limit_price_distribution = (
-                        np.random.normal,
-                        self.query_params["limit_min"],
-                        self.query_params["limit_max"],
-                    )
-                case _:
-                    limit_price_distribution = (
-                        random.uniform,
-                        self.query_params["limit_min"],
-                        self.query_params["limit_max"],
-                    )
-        else:
-            limit_price_distribution = (random.uniform, 100, 1000)
-        return limit_price_distribution
-
-    async def set_room_type(self, limit_price_distribution, room_type):
-        sim = None
-        match room_type:
-            case "english":
-                sim = EnglishAuction([], limit_price_distribution)
-            case "dutch":
-                sim = DutchAuction([], limit_price_distribution)
-            case "FPSB":
-                sim = FirstPriceSealedBidAuction([], limit_price_distribution)
-            case "SPSB":
-                sim = SecondPriceSealedBidAuction([], limit_price_distribution)
-            case "CDA":
-                sim = ContinuousDoubleAuction([], limit_price_distribution)
-
-        auction_instances[self.room_id] = sim
-
-    async def send_message(self, event):
-        await self.send(
-            text_data=json.dumps(
+    def get_room_config(self, sim: Auction, username: str) -> dict:
+        # Everything create_room needs to build this room again, the seed among the params
+        return {
+            "ts": sim.timestamp,
+            "room_type": self.room_type,
+            "params": dict(self.query_params),
+            "user": username,
+            "limit_price": sim.users[username].limit_price,
+            "money": sim.users[username].money,
+        }
+
+    @staticmethod
+    def get_history_range(sim: Auction, request: dict | bool) -> tuple[int, int]:
+        # Rows from the client's cursor up to the end of the history when the request arrived.
+        # Fixing the end means a busy room cannot keep a download going forever.
+        cursor = 0
+        if isinstance(request, dict):
+            try:
+                cursor = max(int(request.get("cursor", 0)), 0)
+            except (TypeError, ValueError):
+                cursor = 0
+        return cursor, len(sim.bid_history)
+
+    async def send_history(self, sim: Auction, username: str, cursor: int, end: int):
+        # Streams the bid history in bounded chunks, the tape is append-only so it is safe to read outside the actor
+        while True:
+            stop = min(cursor + HISTORY_CHUNK_SIZE, end)
+            await self.send_frame(
                 {
-                    "message": event["message"],
-                    "username": event["username"],
-                }
+                    "download_history": {
+                        "header": sim.bid_history.header,
+                        "rows": sim.bid_history.rows(cursor, stop),
+                        "start": cursor,
+                        "cursor": max(stop, cursor),
+                        "done": stop >= end,
+                    }
+                },
+                username,
             )
-        )
+
+            if stop >= end:
+                break
+
+            cursor = stop
+            # Give the rest of the room's traffic a turn between chunks
+            await asyncio.sleep(0)
+
+    async def send_frame(self, message: dict, username: str):
+        # Sends a message to this client only, in whichever wire format it negotiated
+        if self.binary:
+            await self.send(bytes_data=encode_message_binary(message, username))
+        else:
+            await self.send(text_data=encode_message(message, username))
+
+    async def send_encoded(self, event):
+        if self.binary:
+            await self.send(bytes_data=event["bytes"])
+        else:
+            await self.send(text_data=event["text"])
+
+    async def close_consumer(self, event):
+        # Sent by the room's broadcaster when the room stops taking commands
+        await self.close()
+